@@ -4,23 +4,58 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_cors import CORS
 from flask_wtf.csrf import CSRFProtect
+from flask_mail import Mail
 from dotenv import load_dotenv
-from flask_session import Session
 from config import Config
+from app.utils.db_routing import DatabaseRouter, RoutingSession
 
 # Load environment variables
 load_dotenv()
 
 # Initialize extensions
-db = SQLAlchemy()
+# Plain reads in @read_replica views go to the replica bind, everything else to the primary
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+db_router = DatabaseRouter()
 migrate = Migrate()
 csrf = CSRFProtect()
-sess = Session()
+mail = Mail()
 
 # Import models to ensure they are registered with SQLAlchemy
 from app.models import user, lead, payment
 from app.models.user import User
 
+# Server-side sessions (imports models, so it must come after them)
+from app.services.sessions import ServerSessions
+sess = ServerSessions()
+
+# Leased locks coordinating reservations, webhooks and background tasks across hosts
+from app.services.locks import LockService
+locks = LockService()
+
+# Lead lifecycle events for the live plumber feed
+from app.services.events import LeadEvents
+lead_events = LeadEvents()
+
+# Conditional responses and rendered JSON bodies, invalidated by lead events
+from app.utils.http_cache import ResponseCache
+response_cache = ResponseCache()
+
+# Rendered lead cards and detail sections for the server-rendered pages
+from app.utils.fragment_cache import FragmentCache
+fragment_cache = FragmentCache()
+
+# Request, SQL and external call timings, exposed on /metrics
+from app.utils.metrics import Metrics
+metrics = Metrics()
+
+# N+1, slow query and query budget checks for development, staging and tests
+from app.utils.query_profiler import QueryProfiler
+query_profiler = QueryProfiler()
+
+# On-demand stack sampling of a live worker (admin profile endpoint and ?profile=1)
+from app.utils.sampling_profiler import SamplingProfiler
+sampling_profiler = SamplingProfiler()
+
 def create_app(config_class=Config):
     """Create and configure the Flask application."""
     app = Flask(__name__)
@@ -30,9 +65,23 @@ def create_app(config_class=Config):
     
     # Initialize extensions with app
     db.init_app(app)
+    # First, so its request timing also covers the other extensions' request hooks
+    metrics.init_app(app)
+    query_profiler.init_app(app)
+    sampling_profiler.init_app(app)
+    db_router.init_app(app)
     migrate.init_app(app, db)
     csrf.init_app(app)
+    mail.init_app(app)
     sess.init_app(app)
+    locks.init_app(app)
+    lead_events.init_app(app)
+    response_cache.init_app(app)
+    fragment_cache.init_app(app)
+    
+    # Return pooled Supabase clients at the end of each request
+    from app.services.supabase import release_supabase_client
+    app.teardown_appcontext(release_supabase_client)
     
     # Enable CORS for API routes
     CORS(app, resources={r"/api/*": {"origins": "*"}})
@@ -2,4 +2,4 @@ from flask import Blueprint
 
 bp = Blueprint('api', __name__)
 
-from app.api import leads, plumbers, payments, admin 
\ No newline at end of file
+from app.api import leads, plumbers, payments, admin, notifications, exports 
\ No newline at end of file
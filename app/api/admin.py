@@ -1,10 +1,13 @@
 from flask import jsonify, request, current_app
-from flask_login import current_user, login_required
 from app import db
 from app.api import bp
+from app.api.leads import get_current_user, login_required
 from app.models.user import User
 from app.models.lead import Lead
 from app.models.payment import Payment
+from app.utils.db_routing import read_replica
+from app.utils.sampling_profiler import format_collapsed
+from app.utils.pricing import from_cents, invalidate_pricing, pricing_snapshot
 from datetime import datetime, timedelta
 import json
 import os
@@ -12,7 +15,8 @@ import os
 # Admin-only middleware
 def admin_required(func):
     def decorated_function(*args, **kwargs):
-        if not current_user.is_authenticated or not current_user.is_admin:
+        user = get_current_user()
+        if not user or not user.is_admin:
             return jsonify({'error': 'Admin privileges required'}), 403
         return func(*args, **kwargs)
     decorated_function.__name__ = func.__name__
@@ -21,6 +25,7 @@ def admin_required(func):
 # Admin dashboard stats
 @bp.route('/admin/stats', methods=['GET'])
 @admin_required
+@read_replica
 def admin_stats():
     # Time period filter (default: last 30 days)
     days = request.args.get('days', 30, type=int)
@@ -29,22 +34,24 @@ def admin_stats():
     # User stats
     total_users = User.query.filter_by(is_admin=False).count()
     active_users = User.query.filter_by(is_admin=False, is_active=True).count()
-    verified_users = User.query.filter_by(is_admin=False, is_verified=True).count()
+    # Email verification is tracked by Supabase, not in the users table
+    verified_users = None
     new_users = User.query.filter(User.created_at >= start_date, User.is_admin==False).count()
     
     # Lead stats
     total_leads = Lead.query.count()
     new_leads = Lead.query.filter(Lead.created_at >= start_date).count()
-    claimed_leads = Lead.query.filter_by(is_claimed=True).count()
+    claimed_leads = Lead.query.filter(Lead.claimed_at.isnot(None)).count()
     claimed_percentage = (claimed_leads / total_leads * 100) if total_leads > 0 else 0
     
     # Payment stats
     completed_payments = Payment.query.filter_by(status='completed').count()
-    total_revenue = db.session.query(db.func.sum(Payment.amount)).filter_by(status='completed').scalar() or 0
-    recent_revenue = db.session.query(db.func.sum(Payment.amount)).filter(
+    # Summed in integer cents so totals don't pick up float rounding errors
+    total_revenue = from_cents(db.session.query(db.func.sum(Payment.amount_cents)).filter_by(status='completed').scalar() or 0)
+    recent_revenue = from_cents(db.session.query(db.func.sum(Payment.amount_cents)).filter(
         Payment.status=='completed', 
         Payment.created_at >= start_date
-    ).scalar() or 0
+    ).scalar() or 0)
     
     # Service type distribution
     service_types = db.session.query(
@@ -62,13 +69,21 @@ def admin_stats():
     
     state_distribution = {state: count for state, count in geographic_stats}
     
+    # Leads per region: the one place lead queries deliberately span every region
+    region_stats = db.session.query(
+        Lead.region,
+        db.func.count(Lead.id)
+    ).group_by(Lead.region).all()
+    
+    region_distribution = {region: count for region, count in region_stats}
+    
     return jsonify({
         'user_stats': {
             'total_users': total_users,
             'active_users': active_users,
             'verified_users': verified_users,
             'new_users': new_users,
-            'verification_rate': (verified_users / total_users * 100) if total_users > 0 else 0
+            'verification_rate': None
         },
         'lead_stats': {
             'total_leads': total_leads,
@@ -84,7 +99,8 @@ def admin_stats():
             'average_payment': (total_revenue / completed_payments) if completed_payments > 0 else 0
         },
         'geographic_stats': {
-            'state_distribution': state_distribution
+            'state_distribution': state_distribution,
+            'region_distribution': region_distribution
         },
         'time_period': {
             'days': days,
@@ -144,6 +160,30 @@ def get_logs():
             'lines': []
         }), 500
 
+# Sample this worker's stacks for a while (collapsed-stack output for flamegraph tools)
+@bp.route('/admin/profile', methods=['GET'])
+@admin_required
+def profile_worker():
+    seconds = request.args.get('seconds', 10, type=float)
+    max_seconds = current_app.config.get('PROFILER_MAX_SECONDS', 60)
+    if not 0 < seconds <= max_seconds:
+        return jsonify({'error': f'seconds must be between 0 and {max_seconds}'}), 400
+    
+    # This request's thread samples until the deadline; a sync worker would serve nothing meanwhile
+    if not request.environ.get('wsgi.multithread'):
+        return jsonify({'error': 'Worker profiles need a threaded worker (e.g. gunicorn --threads); '
+                                 'use ?profile=1 to profile a single request'}), 501
+    
+    result = current_app.extensions['sampling_profiler'].profile(seconds, request.args.get('interval_ms', type=int))
+    if result is None:
+        return jsonify({'error': 'A profile is already running on this worker'}), 409
+    
+    counts, samples = result
+    response = current_app.response_class(format_collapsed(counts), mimetype='text/plain')
+    response.headers['X-Profile-Samples'] = str(samples)
+    response.headers['X-Profile-Worker'] = str(os.getpid())
+    return response
+
 # Get system configuration
 @bp.route('/admin/config', methods=['GET'])
 @admin_required
@@ -155,6 +195,7 @@ def get_config():
         'APPLICATION_ROOT': current_app.config.get('APPLICATION_ROOT'),
         'PREFERRED_URL_SCHEME': current_app.config.get('PREFERRED_URL_SCHEME'),
         'LEAD_CLAIM_PERCENTAGE': current_app.config.get('LEAD_CLAIM_PERCENTAGE'),
+        'MINIMUM_LEAD_PRICE': current_app.config.get('MINIMUM_LEAD_PRICE'),
         'DEFAULT_CURRENCY': current_app.config.get('DEFAULT_CURRENCY'),
         'MAIL_SERVER': current_app.config.get('MAIL_SERVER'),
         'MAIL_PORT': current_app.config.get('MAIL_PORT'),
@@ -175,6 +216,7 @@ def update_config():
     # List of allowed configuration options to update
     allowed_config_options = [
         'LEAD_CLAIM_PERCENTAGE',
+        'MINIMUM_LEAD_PRICE',
         'DEFAULT_CURRENCY',
         'MAIL_SERVER',
         'MAIL_PORT',
@@ -197,6 +239,15 @@ def update_config():
     if not updated_config:
         return jsonify({'error': 'No valid configuration options provided'}), 400
     
+    # New pricing applies to leads still on offer; reserved leads keep the price shown at checkout
+    if updated_config.keys() & {'LEAD_CLAIM_PERCENTAGE', 'MINIMUM_LEAD_PRICE'}:
+        invalidate_pricing()
+        repriced = Lead.reprice_available(db.session, pricing_snapshot())
+        db.session.commit()
+        if repriced:
+            # Not written through the ORM, so no per-lead events: caches and live feeds start over
+            current_app.extensions['lead_events'].publish([{'type': 'resync'}])
+    
     return jsonify({
         'message': 'Configuration updated successfully',
         'updated_config': updated_config
@@ -205,6 +256,7 @@ def update_config():
 # Get user activity report
 @bp.route('/admin/reports/user-activity', methods=['GET'])
 @admin_required
+@read_replica
 def user_activity_report():
     # Parse query parameters
     days = request.args.get('days', 30, type=int)
@@ -212,7 +264,7 @@ def user_activity_report():
     
     # Get active users who have claimed at least one lead
     active_users = db.session.query(User).join(
-        Lead, User.id == Lead.plumber_id
+        Lead, User.id == Lead.claimed_by_id
     ).filter(
         Lead.claimed_at >= start_date,
         User.is_admin == False
@@ -224,7 +276,7 @@ def user_activity_report():
     for user in active_users:
         # Get leads claimed by this user in the time period
         leads_claimed = Lead.query.filter(
-            Lead.plumber_id == user.id,
+            Lead.claimed_by_id == user.id,
             Lead.claimed_at >= start_date
         ).all()
         
@@ -235,14 +287,14 @@ def user_activity_report():
         ).all()
         
         # Calculate total spent
-        total_spent = sum(p.amount for p in payments if p.status == 'completed')
+        total_spent = from_cents(sum(p.amount_cents for p in payments if p.status == 'completed'))
         
         report_data.append({
             'user_id': user.id,
             'email': user.email,
             'full_name': user.full_name,
             'company_name': user.company_name,
-            'is_verified': user.is_verified,
+            'is_verified': user.is_verified(),
             'is_active': user.is_active,
             'leads_claimed': len(leads_claimed),
             'total_spent': total_spent,
@@ -267,6 +319,7 @@ def user_activity_report():
 # Get lead conversion report
 @bp.route('/admin/reports/lead-conversion', methods=['GET'])
 @admin_required
+@read_replica
 def lead_conversion_report():
     # Parse query parameters
     days = request.args.get('days', 30, type=int)
@@ -277,7 +330,7 @@ def lead_conversion_report():
     
     # Calculate conversion metrics
     total_leads = len(leads)
-    claimed_leads = sum(1 for lead in leads if lead.is_claimed)
+    claimed_leads = sum(1 for lead in leads if lead.claimed_at)
     conversion_rate = (claimed_leads / total_leads * 100) if total_leads > 0 else 0
     
     # Group leads by service type
@@ -292,7 +345,7 @@ def lead_conversion_report():
             }
         
         service_type_data[service_type]['total'] += 1
-        if lead.is_claimed:
+        if lead.claimed_at:
             service_type_data[service_type]['claimed'] += 1
     
     # Calculate conversion rates for each service type
@@ -305,7 +358,7 @@ def lead_conversion_report():
     # Calculate time to claim
     time_to_claim_data = []
     for lead in leads:
-        if lead.is_claimed and lead.claimed_at:
+        if lead.claimed_at:
             # Calculate time difference in hours
             time_diff = lead.claimed_at - lead.created_at
             hours_to_claim = time_diff.total_seconds() / 3600
@@ -0,0 +1,122 @@
+from flask import jsonify, request, Response, stream_with_context
+from datetime import datetime
+from app.api import bp
+from app.api.leads import get_current_user, login_required
+from app.models.lead import Lead
+from app.models.payment import Payment
+import csv
+import io
+import json
+import uuid
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+LEAD_FIELDS = [
+    'id', 'title', 'description', 'city', 'state', 'zip_code', 'service_type', 'service_details',
+    'urgency', 'price', 'price_cents', 'claim_price_cents', 'status', 'reserved_at', 'source', 'created_at', 'updated_at', 'change_seq',
+    'customer_name', 'customer_email', 'customer_phone', 'address', 'notes'
+]
+
+PAYMENT_FIELDS = [
+    'id', 'user_id', 'lead_id', 'amount', 'amount_cents', 'currency', 'payment_method', 'payment_processor',
+    'processor_payment_id', 'status', 'payment_intent_id', 'error_message', 'created_at',
+    'completed_at', 'refunded_at'
+]
+
+def parse_date_arg(name):
+    """Parse an ISO date query argument, ignoring invalid values like the list APIs do"""
+    try:
+        return datetime.fromisoformat(request.args[name]) if request.args.get(name) else None
+    except ValueError:
+        return None
+
+def stream_rows(rows, fields, export_format):
+    """Serialize dict rows as NDJSON or CSV, yielding one chunk per batch"""
+    buffer = io.StringIO()
+    writer = None
+    if export_format == 'csv':
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+
+    for count, row in enumerate(rows, 1):
+        if writer:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps({field: row.get(field) for field in fields}))
+            buffer.write('\n')
+
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def export_response(name, rows, fields):
+    """Stream an export as an attachment in the requested format"""
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+    filename = f"{name}-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{export_format}"
+    return Response(
+        stream_with_context(stream_rows(rows, fields, export_format)),
+        mimetype='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+# Export leads (admin only)
+@bp.route('/exports/leads', methods=['GET'])
+@login_required
+def export_leads():
+    user = get_current_user()
+    if not user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    query = Lead.query
+
+    # Same filters as GET /api/leads, plus a creation date range
+    if request.args.get('service_type'):
+        query = query.filter_by(service_type=request.args.get('service_type'))
+    if request.args.get('zip_code'):
+        query = query.filter_by(zip_code=request.args.get('zip_code'))
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args.get('status'))
+    if parse_date_arg('start_date'):
+        query = query.filter(Lead.created_at >= parse_date_arg('start_date'))
+    if parse_date_arg('end_date'):
+        query = query.filter(Lead.created_at <= parse_date_arg('end_date'))
+
+    query = query.order_by(Lead.created_at, Lead.id).yield_per(EXPORT_BATCH_SIZE)
+    rows = (lead.to_dict(include_contact=True) for lead in query)
+    return export_response('leads', rows, LEAD_FIELDS)
+
+# Export payments (admin only)
+@bp.route('/exports/payments', methods=['GET'])
+@login_required
+def export_payments():
+    user = get_current_user()
+    if not user.is_admin:
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    query = Payment.query
+
+    # Same filters as GET /api/payments
+    if request.args.get('user_id'):
+        try:
+            query = query.filter_by(user_id=uuid.UUID(request.args.get('user_id')))
+        except ValueError:
+            return jsonify({'error': 'Invalid user_id'}), 400
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args.get('status'))
+    if parse_date_arg('start_date'):
+        query = query.filter(Payment.created_at >= parse_date_arg('start_date'))
+    if parse_date_arg('end_date'):
+        query = query.filter(Payment.created_at <= parse_date_arg('end_date'))
+
+    # client_secret is left out of PAYMENT_FIELDS on purpose
+    query = query.order_by(Payment.created_at, Payment.id).yield_per(EXPORT_BATCH_SIZE)
+    rows = (payment.to_dict() for payment in query)
+    return export_response('payments', rows, PAYMENT_FIELDS)
@@ -1,19 +1,48 @@
-from flask import jsonify, request, current_app, session
-from app import db
+from flask import jsonify, request, current_app, session, g
+from sqlalchemy import func
+from app import db, csrf, locks
 from app.api import bp
 from app.models.lead import Lead
 from app.models.payment import Payment
 from app.models.user import User
+from app.models.user_service import UserServiceArea, UserServiceType
 from app.routes.plumber import calculate_distance
+from app.services.lead_dedupe import check_new_lead
+from app.services.lead_import import import_leads
+from app.services.locks import LockLost, LockUnavailable, lead_lock_name
+from app.services.notifications import notify_new_lead
+from app.services.search import FACETS, search_leads
+from app.services.supabase import verify_access_token
+from app.utils.db_routing import read_replica
+from app.utils.pricing import lead_price_cents
 import stripe
 import os
+import uuid
+import hmac
 from functools import wraps
 
 def get_current_user():
-    """Get the current user from the session"""
-    if not session.get('user'):
-        return None
-    return User.query.get(session['user']['id'])
+    """Get the current user from the session or a Supabase bearer token"""
+    user = None
+    if session.get('user'):
+        user = User.query.get(session['user']['id'])
+    else:
+        # API clients may authenticate with their Supabase access token instead of a cookie
+        auth_header = request.headers.get('Authorization', '')
+        if auth_header.startswith('Bearer '):
+            claims = verify_access_token(auth_header[len('Bearer '):])
+            try:
+                user_id = uuid.UUID(str(claims['sub'])) if claims else None
+            except (KeyError, ValueError):
+                # Validly signed, but not one of our user ids: unauthenticated, like an invalid token
+                user_id = None
+            if user_id:
+                user = User.query.get(user_id)
+    
+    # Lets the database router keep this user's reads on the primary after they write
+    if user:
+        g.current_user_id = user.id
+    return user
 
 def login_required(f):
     """Decorator to require login"""
@@ -25,11 +54,106 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def filter_plumber_leads(query, user):
+    """Restrict a lead query to the plumber's service areas/types and the request filters"""
+    # Filter by service area if set (indexed lookup on the plumber's coverage rows)
+    if user.service_area_links:
+        query = query.filter(Lead.zip_code.in_(
+            db.session.query(UserServiceArea.area).filter(UserServiceArea.user_id == user.id)
+        ))
+    
+    # Filter by service type if set
+    if user.service_type_links and request.args.get('filter_by_service_types', 'true').lower() == 'true':
+        query = query.filter(Lead.service_type.in_(
+            db.session.query(UserServiceType.service_type).filter(UserServiceType.user_id == user.id)
+        ))
+    
+    # Apply additional filters if provided
+    if request.args.get('service_type'):
+        query = query.filter_by(service_type=request.args.get('service_type'))
+        
+    if request.args.get('zip_code'):
+        query = query.filter_by(zip_code=request.args.get('zip_code'))
+    
+    return query
+
+def current_change_cursor():
+    """Cursor covering every lead change committed so far"""
+    return str(db.session.query(func.max(Lead.change_seq)).scalar() or 0)
+
+def get_lead_changes(user, since):
+    """Leads created or changed after the cursor, with tombstones for leads that left the available set"""
+    try:
+        since = int(since)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    limit = min(request.args.get('per_page', 100, type=int), 500)
+    
+    query = Lead.query.filter(Lead.change_seq > since)
+    if user.is_admin:
+        if request.args.get('service_type'):
+            query = query.filter_by(service_type=request.args.get('service_type'))
+        if request.args.get('zip_code'):
+            query = query.filter_by(zip_code=request.args.get('zip_code'))
+    else:
+        query = filter_plumber_leads(query, user)
+    
+    # Fetch one extra row to know whether the client has to keep paging
+    changes = query.order_by(Lead.change_seq).limit(limit + 1).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    
+    leads, removed = [], []
+    for lead in changes:
+        if user.is_admin:
+            leads.append(lead.to_dict(include_contact=lead.status == 'claimed' and lead.claimed_by_id == user.id))
+        elif lead.status == 'available':
+            leads.append(lead.to_dict(include_contact=False))
+        else:
+            removed.append(str(lead.id))
+    
+    return jsonify({
+        'leads': leads,
+        'removed': removed,
+        'cursor': str(changes[-1].change_seq if changes else since),
+        'has_more': has_more
+    })
+
+def lead_list_dimensions(user):
+    """Response cache dimensions a lead listing for this user depends on"""
+    if request.args.get('zip_code'):
+        return [f"zip_code:{request.args.get('zip_code')}"]
+    if not user.is_admin and user.service_area_links:
+        return [f'zip_code:{area}' for area in user.get_service_areas()]
+    if request.args.get('service_type'):
+        return [f"service_type:{request.args.get('service_type')}"]
+    if not user.is_admin and user.service_type_links:
+        return [f'service_type:{service_type}' for service_type in user.get_service_types()]
+    return ['leads']
+
 # Get available leads for the current plumber
 @bp.route('/leads', methods=['GET'])
 @login_required
+@read_replica
 def get_leads():
     user = get_current_user()
+    
+    # Delta sync: only what changed after the client's cursor
+    if request.args.get('since') is not None:
+        return get_lead_changes(user, request.args.get('since'))
+    
+    # The body depends on the user's coverage as well as the query string
+    key = ('leads', str(user.id), user.is_admin, tuple(user.get_service_areas()),
+           tuple(user.get_service_types()), tuple(sorted(request.args.items(multi=True))))
+    return current_app.extensions['response_cache'].json_response(
+        key, lead_list_dimensions(user), lambda: build_lead_list(user))
+
+def build_lead_list(user):
+    """Build one page of the lead listing for the current user"""
+    # Taken before the page query so no change can slip between the page and the cursor
+    cursor = current_change_cursor()
+    
     # Check if the user is a plumber
     if user.is_admin:
         # Admins can see all leads
@@ -57,40 +181,13 @@ def get_leads():
         # Transform to dictionary
         leads = [lead.to_dict(include_contact=lead.status == 'claimed' and lead.claimed_by_id == user.id) 
                  for lead in leads_page.items]
-        
-        return jsonify({
-            'leads': leads,
-            'total': leads_page.total,
-            'pages': leads_page.pages,
-            'page': page,
-            'per_page': per_page
-        })
     else:
         # Regular plumbers can only see available leads in their service area
         page = request.args.get('page', 1, type=int)
         per_page = min(request.args.get('per_page', 10, type=int), 100)
         
-        # Get user's service areas and service types
-        service_areas = user.get_service_areas()
-        service_types = user.get_service_types()
-        
         # Base query for available leads
-        query = Lead.query.filter_by(status='available')
-        
-        # Filter by service area if set
-        if service_areas:
-            query = query.filter(Lead.zip_code.in_(service_areas))
-        
-        # Filter by service type if set
-        if service_types and request.args.get('filter_by_service_types', 'true').lower() == 'true':
-            query = query.filter(Lead.service_type.in_(service_types))
-        
-        # Apply additional filters if provided
-        if request.args.get('service_type'):
-            query = query.filter_by(service_type=request.args.get('service_type'))
-            
-        if request.args.get('zip_code'):
-            query = query.filter_by(zip_code=request.args.get('zip_code'))
+        query = filter_plumber_leads(Lead.query.filter_by(status='available'), user)
         
         # Order by newest first
         query = query.order_by(Lead.created_at.desc())
@@ -100,14 +197,63 @@ def get_leads():
         
         # Transform to dictionary
         leads = [lead.to_dict(include_contact=False) for lead in leads_page.items]
-        
-        return jsonify({
-            'leads': leads,
-            'total': leads_page.total,
-            'pages': leads_page.pages,
-            'page': page,
-            'per_page': per_page
-        })
+    
+    return {
+        'leads': leads,
+        'total': leads_page.total,
+        'pages': leads_page.pages,
+        'page': page,
+        'per_page': per_page,
+        'cursor': cursor
+    }
+
+# Keyword search over leads with facet counts
+@bp.route('/leads/search', methods=['GET'])
+@login_required
+def search_lead_list():
+    user = get_current_user()
+    
+    if not request.args.get('q', '').strip():
+        return jsonify({'error': 'Must include q parameter'}), 400
+    
+    key = ('leads/search', str(user.id), user.is_admin, tuple(user.get_service_areas()),
+           tuple(user.get_service_types()), tuple(sorted(request.args.items(multi=True))))
+    return current_app.extensions['response_cache'].json_response(
+        key, lead_list_dimensions(user), lambda: build_search_results(user))
+
+def build_search_results(user):
+    """Search the leads the current user may see, narrowed by any facet filters"""
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(request.args.get('per_page', 10, type=int), 100)
+    
+    if user.is_admin:
+        query = Lead.query
+        if request.args.get('service_type'):
+            query = query.filter_by(service_type=request.args.get('service_type'))
+        if request.args.get('zip_code'):
+            query = query.filter_by(zip_code=request.args.get('zip_code'))
+        if request.args.get('status'):
+            query = query.filter_by(status=request.args.get('status'))
+    else:
+        # Same visibility as the plumber's lead listing
+        query = filter_plumber_leads(Lead.query.filter_by(status='available'), user)
+    
+    # Selecting a facet value narrows the results and the other facets
+    for facet in FACETS:
+        if facet != 'service_type' and request.args.get(facet):
+            query = query.filter(getattr(Lead, facet) == request.args.get(facet))
+    
+    results = search_leads(query, request.args.get('q'), page=page, per_page=per_page)
+    
+    return {
+        'leads': [lead.to_dict(include_contact=lead.status == 'claimed' and lead.claimed_by_id == user.id)
+                  for lead in results['leads']],
+        'total': results['total'],
+        'pages': -(-results['total'] // per_page),
+        'page': page,
+        'per_page': per_page,
+        'facets': results['facets']
+    }
 
 # Get claimed leads for the current plumber
 @bp.route('/leads/claimed', methods=['GET'])
@@ -161,6 +307,13 @@ def get_lead(id):
     
     return jsonify(lead.to_dict(include_contact=include_contact))
 
+def cancel_payment_intent(payment_intent_id):
+    """Cancel a payment intent that will never be paid (unpaid intents are harmless, so failures are only logged)."""
+    try:
+        stripe.PaymentIntent.cancel(payment_intent_id)
+    except stripe.error.StripeError as e:
+        current_app.logger.warning(f"Could not cancel payment intent {payment_intent_id}: {str(e)}")
+
 # Reserve a lead
 @bp.route('/leads/<uuid:id>/reserve', methods=['POST'])
 @login_required
@@ -174,96 +327,108 @@ def reserve_lead(id):
             current_app.logger.warning(f"Admin user {user.id} attempted to reserve lead {id}")
             return jsonify({'error': 'This endpoint is only for plumbers'}), 403
         
-        lead = Lead.query.get_or_404(id)
-        current_app.logger.info(f"Found lead {id} with status: {lead.status}")
-        
-        # Check if the lead is available
-        if lead.status != 'available':
-            current_app.logger.warning(f"Lead {id} is not available. Current status: {lead.status}")
-            return jsonify({'error': 'This lead is not available'}), 400
+        # One reservation attempt per lead at a time, across every host; the status
+        # check below only means something once the lead is locked
+        lease = locks.acquire(lead_lock_name(id))
+        if lease is None:
+            current_app.logger.warning(f"Lead {id} is being reserved by another user")
+            return jsonify({'error': 'This lead is being reserved by another plumber'}), 409
         
-        # Check if coordinates are available
-        if not user.latitude or not user.longitude:
-            current_app.logger.warning(f"User {user.id} has no location set")
-            return jsonify({'error': 'Please update your location in your profile'}), 400
+        with lease:
+            lead = Lead.query.get_or_404(id)
+            current_app.logger.info(f"Found lead {id} with status: {lead.status}")
             
-        if not lead.latitude or not lead.longitude:
-            current_app.logger.warning(f"Lead {id} has no location set")
-            return jsonify({'error': 'This lead has no location information'}), 400
-        
-        # Check if the lead is within service radius
-        try:
-            distance = calculate_distance(
-                user.latitude, 
-                user.longitude,
-                lead.latitude,
-                lead.longitude
-            )
-            current_app.logger.info(f"Distance to lead: {distance} miles, User service radius: {user.service_radius} miles")
+            # Check if the lead is available
+            if lead.status != 'available':
+                current_app.logger.warning(f"Lead {id} is not available. Current status: {lead.status}")
+                return jsonify({'error': 'This lead is not available'}), 400
             
-            if distance > user.service_radius:
-                current_app.logger.warning(f"Lead {id} is outside user {user.id}'s service radius")
-                return jsonify({'error': 'Lead is outside your service area'}), 400
-        except Exception as e:
-            current_app.logger.error(f"Error calculating distance: {str(e)}")
-            return jsonify({'error': 'Error calculating service area distance'}), 400
-        
-        # Initialize Stripe
-        stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
-        
-        try:
-            current_app.logger.info(f"Creating Stripe payment intent for lead {id}")
-            # Create a payment intent with Stripe
-            payment_intent = stripe.PaymentIntent.create(
-                amount=int(lead.price * 100),  # Convert to cents
-                currency=current_app.config['DEFAULT_CURRENCY'],
-                payment_method_types=['card'],
-                description=f"Lead: {lead.title} (ID: {lead.id})",
-                metadata={
-                    'lead_id': str(lead.id),
-                    'user_id': str(user.id)
-                }
-            )
-            current_app.logger.info(f"Created Stripe payment intent: {payment_intent.id}")
+            # Check if coordinates are available
+            if not user.latitude or not user.longitude:
+                current_app.logger.warning(f"User {user.id} has no location set")
+                return jsonify({'error': 'Please update your location in your profile'}), 400
+                
+            if not lead.latitude or not lead.longitude:
+                current_app.logger.warning(f"Lead {id} has no location set")
+                return jsonify({'error': 'This lead has no location information'}), 400
             
-            # Create a payment record
-            payment = Payment(
-                user_id=user.id,
-                lead_id=lead.id,
-                amount=lead.price,
-                currency=current_app.config['DEFAULT_CURRENCY'],
-                payment_method='card',
-                payment_processor='stripe',
-                processor_payment_id=payment_intent.id,
-                payment_intent_id=payment_intent.id,
-                client_secret=payment_intent.client_secret,
-                status='pending'
-            )
+            # Check if the lead is within service radius
+            try:
+                distance = calculate_distance(
+                    user.latitude, 
+                    user.longitude,
+                    lead.latitude,
+                    lead.longitude
+                )
+                current_app.logger.info(f"Distance to lead: {distance} miles, User service radius: {user.service_radius} miles")
+                
+                if distance > user.service_radius:
+                    current_app.logger.warning(f"Lead {id} is outside user {user.id}'s service radius")
+                    return jsonify({'error': 'Lead is outside your service area'}), 400
+            except Exception as e:
+                current_app.logger.error(f"Error calculating distance: {str(e)}")
+                return jsonify({'error': 'Error calculating service area distance'}), 400
             
-            # Reserve the lead
-            lead.reserve(user.id)
+            # Initialize Stripe
+            stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
             
-            # Save changes to database
-            db.session.add(payment)
-            db.session.commit()
-            current_app.logger.info(f"Successfully reserved lead {id} for user {user.id}")
+            try:
+                current_app.logger.info(f"Creating Stripe payment intent for lead {id}")
+                # Create a payment intent with Stripe
+                payment_intent = stripe.PaymentIntent.create(
+                    amount=lead_price_cents(lead),
+                    currency=current_app.config['DEFAULT_CURRENCY'],
+                    payment_method_types=['card'],
+                    description=f"Lead: {lead.title} (ID: {lead.id})",
+                    metadata={
+                        'lead_id': str(lead.id),
+                        'user_id': str(user.id)
+                    }
+                )
+                current_app.logger.info(f"Created Stripe payment intent: {payment_intent.id}")
+                
+                # Create a payment record
+                payment = Payment(
+                    user_id=user.id,
+                    lead_id=lead.id,
+                    amount_cents=lead_price_cents(lead),
+                    currency=current_app.config['DEFAULT_CURRENCY'],
+                    payment_method='card',
+                    payment_processor='stripe',
+                    processor_payment_id=payment_intent.id,
+                    payment_intent_id=payment_intent.id,
+                    client_secret=payment_intent.client_secret,
+                    status='pending'
+                )
+                
+                # Reserve the lead and save the payment in one transaction, unless the
+                # Stripe call outlasted the lease and someone else may hold the lead now
+                db.session.add(payment)
+                lead.reserve(user.id, lease)
+                current_app.logger.info(f"Successfully reserved lead {id} for user {user.id}")
+                
+                return jsonify({
+                    'message': 'Lead reserved successfully',
+                    'lead': lead.to_dict(),
+                    'payment': payment.to_dict()
+                })
             
-            return jsonify({
-                'message': 'Lead reserved successfully',
-                'lead': lead.to_dict(),
-                'payment': payment.to_dict()
-            })
-        
-        except stripe.error.StripeError as e:
-            current_app.logger.error(f"Stripe error while reserving lead {id}: {str(e)}")
-            # Handle Stripe errors
-            return jsonify({'error': str(e)}), 400
-        
-        except Exception as e:
-            current_app.logger.error(f"Unexpected error while reserving lead {id}: {str(e)}")
-            # Roll back transaction on error
-            db.session.rollback()
-            return jsonify({'error': str(e)}), 500
+            except LockLost as e:
+                current_app.logger.warning(f"Gave up reserving lead {id}: {str(e)}")
+                db.session.rollback()
+                cancel_payment_intent(payment_intent.id)
+                return jsonify({'error': 'This lead is being reserved by another plumber'}), 409
+            
+            except stripe.error.StripeError as e:
+                current_app.logger.error(f"Stripe error while reserving lead {id}: {str(e)}")
+                # Handle Stripe errors
+                return jsonify({'error': str(e)}), 400
+            
+            except Exception as e:
+                current_app.logger.error(f"Unexpected error while reserving lead {id}: {str(e)}")
+                # Roll back transaction on error
+                db.session.rollback()
+                return jsonify({'error': str(e)}), 500
             
     except Exception as e:
         current_app.logger.error(f"Unexpected error in reserve_lead route: {str(e)}")
@@ -274,115 +439,144 @@ def reserve_lead(id):
 @login_required
 def complete_payment(id):
     user = get_current_user()
-    lead = Lead.query.get_or_404(id)
-    payment = Payment.query.filter_by(lead_id=lead.id, user_id=user.id).first_or_404()
-    
-    # Check if the lead is still reserved for this user
-    if lead.status != 'reserved' or lead.reserved_by_id != user.id:
-        return jsonify({'error': 'Lead is no longer reserved for you'}), 400
-    
-    # Check if reservation has expired
-    if lead.is_reservation_expired():
-        lead.release()
-        payment.mark_failed('Reservation expired')
-        db.session.commit()
-        return jsonify({'error': 'Lead reservation has expired'}), 400
+    lease = locks.acquire(lead_lock_name(id), wait=current_app.config['LOCK_WAIT_SECONDS'])
+    if lease is None:
+        return jsonify({'error': 'This lead is busy, please try again'}), 409
     
-    # Initialize Stripe
-    stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
-    
-    try:
-        # Confirm the payment intent
-        payment_intent = stripe.PaymentIntent.confirm(payment.payment_intent_id)
+    with lease:
+        lead = Lead.query.get_or_404(id)
+        payment = Payment.query.filter_by(lead_id=lead.id, user_id=user.id).first_or_404()
         
-        if payment_intent.status == 'succeeded':
-            # Mark payment as completed
-            payment.mark_completed()
-            
-            # Claim the lead
-            lead.claim(user.id)
-            
-            db.session.commit()
-            
+        # The payment_intent.succeeded webhook may have claimed it already
+        if lead.status == 'claimed' and lead.claimed_by_id == user.id:
             return jsonify({
                 'message': 'Payment completed and lead claimed successfully',
                 'lead': lead.to_dict(include_contact=True),
                 'payment': payment.to_dict()
             })
-        else:
-            payment.mark_failed('Payment not completed')
+        
+        # Check if the lead is still reserved for this user
+        if lead.status != 'reserved' or lead.reserved_by_id != user.id:
+            return jsonify({'error': 'Lead is no longer reserved for you'}), 400
+        
+        # Check if reservation has expired
+        if lead.is_reservation_expired():
+            payment.mark_failed('Reservation expired')
+            lead.release(lease)
+            return jsonify({'error': 'Lead reservation has expired'}), 400
+        
+        # Initialize Stripe
+        stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
+        
+        try:
+            # Confirm the payment intent
+            payment_intent = stripe.PaymentIntent.confirm(payment.payment_intent_id)
+            
+            if payment_intent.status == 'succeeded':
+                # Mark payment as completed
+                payment.mark_completed()
+                
+                # Claim the lead
+                lead.claim(user.id, lease)
+                
+                db.session.commit()
+                
+                return jsonify({
+                    'message': 'Payment completed and lead claimed successfully',
+                    'lead': lead.to_dict(include_contact=True),
+                    'payment': payment.to_dict()
+                })
+            else:
+                payment.mark_failed('Payment not completed')
+                db.session.commit()
+                return jsonify({'error': 'Payment was not completed'}), 400
+        
+        except LockLost as e:
+            current_app.logger.warning(f"Gave up completing payment for lead {id}: {str(e)}")
+            db.session.rollback()
+            return jsonify({'error': 'Lead reservation changed while completing the payment'}), 409
+        
+        except stripe.error.StripeError as e:
+            payment.mark_failed(str(e))
             db.session.commit()
-            return jsonify({'error': 'Payment was not completed'}), 400
-    
-    except stripe.error.StripeError as e:
-        payment.mark_failed(str(e))
-        db.session.commit()
-        return jsonify({'error': str(e)}), 400
-    
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': str(e)}), 500
+            return jsonify({'error': str(e)}), 400
+        
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
 
 # Release a reserved lead
 @bp.route('/leads/<uuid:id>/release', methods=['POST'])
 @login_required
 def release_lead(id):
     user = get_current_user()
-    lead = Lead.query.get_or_404(id)
+    lease = locks.acquire(lead_lock_name(id), wait=current_app.config['LOCK_WAIT_SECONDS'])
+    if lease is None:
+        return jsonify({'error': 'This lead is busy, please try again'}), 409
     
-    # Check if the lead is reserved for this user
-    if lead.status != 'reserved' or lead.reserved_by_id != user.id:
-        return jsonify({'error': 'Lead is not reserved for you'}), 400
-    
-    try:
-        # Release the lead
-        lead.release()
+    with lease:
+        lead = Lead.query.get_or_404(id)
         
-        # Update payment status
-        payment = Payment.query.filter_by(lead_id=lead.id, user_id=user.id).first()
-        if payment:
-            payment.mark_failed('Lead released by user')
+        # Check if the lead is reserved for this user
+        if lead.status != 'reserved' or lead.reserved_by_id != user.id:
+            return jsonify({'error': 'Lead is not reserved for you'}), 400
         
-        db.session.commit()
+        try:
+            # Update payment status
+            payment = Payment.query.filter_by(lead_id=lead.id, user_id=user.id).first()
+            if payment:
+                payment.mark_failed('Lead released by user')
+            
+            # Release the lead (commits the payment too)
+            lead.release(lease)
+            
+            return jsonify({
+                'message': 'Lead released successfully',
+                'lead': lead.to_dict()
+            })
         
-        return jsonify({
-            'message': 'Lead released successfully',
-            'lead': lead.to_dict()
-        })
-    
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': str(e)}), 500
+        except LockLost as e:
+            db.session.rollback()
+            return jsonify({'error': 'Lead reservation changed while releasing it'}), 409
+        
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
 
 # Update lead status
 @bp.route('/leads/<int:id>/status', methods=['PUT'])
 @login_required
 def update_lead_status(id):
     user = get_current_user()
-    lead = Lead.query.get_or_404(id)
-    
-    # Check if the user is authorized to update this lead
-    if not user.is_admin and lead.claimed_by_id != user.id:
-        return jsonify({'error': 'You are not authorized to update this lead'}), 403
-    
     data = request.get_json() or {}
     
     if 'status' not in data:
         return jsonify({'error': 'Status is required'}), 400
     
-    # Update lead status
-    if lead.update_status(data['status']):
-        # Add notes if provided
-        if 'notes' in data:
-            lead.notes = data['notes']
-        
-        db.session.commit()
-        return jsonify({
-            'message': 'Lead status updated successfully',
-            'lead': lead.to_dict(include_contact=True)
-        })
-    else:
-        return jsonify({'error': 'Invalid status'}), 400
+    try:
+        with locks.hold_lead(id, wait=current_app.config['LOCK_WAIT_SECONDS']) as lease:
+            lead = Lead.query.get_or_404(id)
+            
+            # Check if the user is authorized to update this lead
+            if not user.is_admin and lead.claimed_by_id != user.id:
+                return jsonify({'error': 'You are not authorized to update this lead'}), 403
+            
+            # Update lead status
+            if not lead.update_status(data['status'], lease):
+                return jsonify({'error': 'Invalid status'}), 400
+            
+            # Add notes if provided
+            if 'notes' in data:
+                lead.notes = data['notes']
+            
+            db.session.commit()
+            return jsonify({
+                'message': 'Lead status updated successfully',
+                'lead': lead.to_dict(include_contact=True)
+            })
+    except (LockUnavailable, LockLost):
+        db.session.rollback()
+        return jsonify({'error': 'This lead is busy, please try again'}), 409
 
 # Submit a new lead (public endpoint)
 @bp.route('/leads/submit', methods=['POST'])
@@ -418,15 +612,73 @@ def submit_lead():
         source=data.get('source', 'website')
     )
     
+    # Partners resubmit the same job; don't sell it twice
+    action, original_id = check_new_lead(lead)
+    if action == 'merged':
+        return jsonify({
+            'message': 'Lead already submitted',
+            'lead_id': original_id,
+            'duplicate': True
+        }), 200
+    
     # Save to database
     db.session.add(lead)
     db.session.commit()
+    if lead.status == 'available':
+        notify_new_lead(lead)
     
     return jsonify({
         'message': 'Lead submitted successfully',
-        'lead_id': lead.id
+        'lead_id': lead.id,
+        'duplicate': action == 'flagged'
     }), 201
 
+def get_partner_source():
+    """Return the lead source for a valid X-API-Key partner key, or None"""
+    api_key = request.headers.get('X-API-Key')
+    if not api_key:
+        return None
+    
+    # PARTNER_API_KEYS is a comma separated list of key:source pairs
+    for entry in current_app.config.get('PARTNER_API_KEYS', '').split(','):
+        key, _, source = entry.strip().partition(':')
+        if key and hmac.compare_digest(key, api_key):
+            return source or 'partner'
+    return None
+
+# Bulk lead ingestion for partners (X-API-Key) and admins
+@bp.route('/leads/bulk', methods=['POST'])
+@csrf.exempt
+def bulk_submit_leads():
+    source = get_partner_source()
+    if source is None:
+        if request.headers.get('X-API-Key'):
+            return jsonify({'error': 'Invalid API key'}), 401
+        user = get_current_user()
+        if not user:
+            return jsonify({'error': 'Authentication required'}), 401
+        if not user.is_admin:
+            return jsonify({'error': 'Unauthorized'}), 403
+        # Only partner keys are exempt from CSRF; cookie sessions still need the token
+        if session.get('user'):
+            csrf.protect()
+        source = 'import'
+    
+    data = request.get_json(silent=True)
+    rows = data.get('leads') if isinstance(data, dict) else data
+    if not isinstance(rows, list):
+        return jsonify({'error': 'Must include a leads array'}), 400
+    
+    max_rows = current_app.config['LEAD_IMPORT_MAX_ROWS']
+    if len(rows) > max_rows:
+        return jsonify({'error': f'At most {max_rows} leads per request'}), 413
+    
+    # Geocoding up to LEAD_IMPORT_MAX_ROWS addresses would hold the request for minutes;
+    # the notification workers geocode leads without coordinates when they fan them out
+    result = import_leads(rows, source=source, geocode=False)
+    
+    return jsonify(result), 201 if result['created'] else 400
+
 # Admin endpoint to manually create a lead
 @bp.route('/admin/leads', methods=['POST'])
 @login_required
@@ -470,6 +722,7 @@ def create_lead():
     # Save to database
     db.session.add(lead)
     db.session.commit()
+    notify_new_lead(lead)
     
     return jsonify({
         'message': 'Lead created successfully',
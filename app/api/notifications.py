@@ -0,0 +1,55 @@
+from flask import jsonify, request
+from sqlalchemy.orm import joinedload
+from datetime import datetime
+from app import db
+from app.api import bp
+from app.api.leads import get_current_user, login_required
+from app.models.notification import Notification
+import uuid
+
+# Get the current plumber's notifications
+@bp.route('/notifications', methods=['GET'])
+@login_required
+def get_notifications():
+    user = get_current_user()
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', 20, type=int), 100)
+
+    query = Notification.query.options(joinedload(Notification.lead)).filter_by(user_id=user.id)
+    if request.args.get('unread', '').lower() == 'true':
+        query = query.filter(Notification.read_at.is_(None))
+
+    notifications_page = query.order_by(Notification.created_at.desc()).paginate(
+        page=page, per_page=per_page, error_out=False)
+    unread = Notification.query.filter_by(user_id=user.id).filter(Notification.read_at.is_(None)).count()
+
+    return jsonify({
+        'notifications': [notification.to_dict() for notification in notifications_page.items],
+        'unread': unread,
+        'total': notifications_page.total,
+        'pages': notifications_page.pages,
+        'page': page,
+        'per_page': per_page
+    })
+
+# Mark notifications as read
+@bp.route('/notifications/read', methods=['POST'])
+@login_required
+def mark_notifications_read():
+    user = get_current_user()
+    data = request.get_json() or {}
+
+    query = Notification.query.filter_by(user_id=user.id).filter(Notification.read_at.is_(None))
+    if not data.get('all'):
+        try:
+            ids = [uuid.UUID(str(notification_id)) for notification_id in data.get('ids', [])]
+        except ValueError:
+            return jsonify({'error': 'Invalid notification id'}), 400
+        if not ids:
+            return jsonify({'error': 'Must include ids or all'}), 400
+        query = query.filter(Notification.id.in_(ids))
+
+    updated = query.update({Notification.read_at: datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+
+    return jsonify({'message': 'Notifications marked as read', 'updated': updated})
@@ -1,11 +1,14 @@
 from flask import jsonify, request, current_app
-from flask_login import current_user, login_required
-from app import db
+from app import db, csrf, locks
 from app.api import bp
+from app.api.leads import get_current_user, login_required
 from app.models.payment import Payment
 from app.models.lead import Lead
+from app.services.locks import LockLost, lead_lock_name
+from app.utils.db_routing import read_replica
 import stripe
 import os
+import uuid
 from datetime import datetime
 
 # Initialize Stripe
@@ -14,17 +17,22 @@ stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
 # Get payment history for current user
 @bp.route('/payments', methods=['GET'])
 @login_required
+@read_replica
 def get_payments():
+    user = get_current_user()
     page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 10, type=int), 100)
     
     # For admin, allow filtering by user_id
-    if current_user.is_admin and request.args.get('user_id'):
-        user_id = int(request.args.get('user_id'))
+    if user.is_admin and request.args.get('user_id'):
+        try:
+            user_id = uuid.UUID(request.args.get('user_id'))
+        except ValueError:
+            return jsonify({'error': 'Invalid user_id'}), 400
         query = Payment.query.filter_by(user_id=user_id)
     else:
         # Regular users can only see their own payments
-        query = Payment.query.filter_by(user_id=current_user.id)
+        query = Payment.query.filter_by(user_id=user.id)
     
     # Apply filters if provided
     if request.args.get('status'):
@@ -66,16 +74,18 @@ def get_payments():
 @bp.route('/payments/<int:id>', methods=['GET'])
 @login_required
 def get_payment(id):
+    user = get_current_user()
     payment = Payment.query.get_or_404(id)
     
     # Check if user is authorized to view this payment
-    if not current_user.is_admin and payment.user_id != current_user.id:
+    if not user.is_admin and payment.user_id != user.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
     return jsonify(payment.to_dict())
 
 # Process a payment webhook from Stripe
 @bp.route('/webhook/stripe', methods=['POST'])
+@csrf.exempt  # Authenticated by the Stripe signature instead
 def stripe_webhook():
     payload = request.get_data(as_text=True)
     sig_header = request.headers.get('Stripe-Signature')
@@ -92,153 +102,153 @@ def stripe_webhook():
         return jsonify({'error': 'Invalid signature'}), 400
     
     # Handle the event
-    if event['type'] == 'payment_intent.succeeded':
-        payment_intent = event['data']['object']
-        handle_payment_success(payment_intent)
-    elif event['type'] == 'payment_intent.payment_failed':
-        payment_intent = event['data']['object']
-        handle_payment_failure(payment_intent)
+    handlers = {
+        'payment_intent.succeeded': handle_payment_success,
+        'payment_intent.payment_failed': handle_payment_failure
+    }
+    handler = handlers.get(event['type'])
+    if handler is None:
+        return jsonify({'status': 'success'})
+    
+    payment_intent = event['data']['object']
+    lead_id = db.session.query(Payment.lead_id).filter_by(processor_payment_id=payment_intent['id']).scalar()
+    if lead_id is None:
+        return jsonify({'status': 'success'})
+    
+    # Processed under the lead's lock, so it cannot interleave with a completion, release
+    # or sweep of the same reservation on another host; Stripe retries the event on a 409
+    lease = locks.acquire(lead_lock_name(lead_id), wait=current_app.config['LOCK_WAIT_SECONDS'])
+    if lease is None:
+        return jsonify({'error': 'Payment is being processed'}), 409
+    
+    with lease:
+        try:
+            handler(payment_intent, lease)
+        except LockLost:
+            db.session.rollback()
+            return jsonify({'error': 'Payment is being processed'}), 409
     
     return jsonify({'status': 'success'})
 
 # Request a refund for a payment
-@bp.route('/payments/<int:id>/refund', methods=['POST'])
+@bp.route('/payments/<uuid:id>/refund', methods=['POST'])
 @login_required
 def request_refund(id):
+    user = get_current_user()
     payment = Payment.query.get_or_404(id)
     
     # Check if user is authorized to request refund
-    if not current_user.is_admin and payment.user_id != current_user.id:
+    if not user.is_admin and payment.user_id != user.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    # Check if payment is eligible for refund
-    if payment.status != 'completed':
-        return jsonify({'error': 'Only completed payments can be refunded'}), 400
-    
-    # If already refunded
-    if payment.status == 'refunded':
-        return jsonify({'error': 'Payment has already been refunded'}), 400
-    
-    data = request.get_json() or {}
-    
-    if 'reason' not in data:
-        return jsonify({'error': 'Refund reason is required'}), 400
-    
-    try:
-        # Process refund with Stripe
-        refund = stripe.Refund.create(
-            payment_intent=payment.processor_payment_id,
-            reason='requested_by_customer'
-        )
-        
-        # Update payment status
-        payment.refund(data['reason'])
-        
-        # Update lead status if needed
-        lead = Lead.query.get(payment.lead_id)
-        if lead:
-            lead.is_claimed = False
-            lead.plumber_id = None
-            lead.claimed_at = None
-            lead.status = 'new'
-        
-        db.session.commit()
-        
-        return jsonify({
-            'message': 'Refund processed successfully',
-            'payment': payment.to_dict(),
-            'refund_id': refund.id
-        })
-    
-    except stripe.error.StripeError as e:
-        return jsonify({'error': str(e)}), 400
-    
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': str(e)}), 500
+    return refund_payment(payment, 'requested_by_customer')
 
 # Admin endpoint to process a refund
-@bp.route('/admin/payments/<int:id>/refund', methods=['POST'])
+@bp.route('/admin/payments/<uuid:id>/refund', methods=['POST'])
 @login_required
 def admin_refund(id):
+    user = get_current_user()
     # Check if user is admin
-    if not current_user.is_admin:
+    if not user.is_admin:
         return jsonify({'error': 'Unauthorized'}), 403
     
     payment = Payment.query.get_or_404(id)
     
-    # Check if payment is eligible for refund
-    if payment.status != 'completed':
-        return jsonify({'error': 'Only completed payments can be refunded'}), 400
-    
-    # If already refunded
-    if payment.status == 'refunded':
-        return jsonify({'error': 'Payment has already been refunded'}), 400
-    
+    # Admin refunds marked as fraudulent for tracking
+    return refund_payment(payment, 'fraudulent')
+
+def refund_payment(payment, stripe_reason):
+    """Refund a completed payment and put its lead back on offer, under the lead's lock."""
     data = request.get_json() or {}
     
     if 'reason' not in data:
         return jsonify({'error': 'Refund reason is required'}), 400
     
-    try:
-        # Process refund with Stripe
-        refund = stripe.Refund.create(
-            payment_intent=payment.processor_payment_id,
-            reason='fraudulent'  # Admin refunds marked as fraudulent for tracking
-        )
+    lease = locks.acquire(lead_lock_name(payment.lead_id), wait=current_app.config['LOCK_WAIT_SECONDS'])
+    if lease is None:
+        return jsonify({'error': 'This lead is busy, please try again'}), 409
+    
+    with lease:
+        db.session.refresh(payment)
         
-        # Update payment status
-        payment.refund(data['reason'])
+        # If already refunded
+        if payment.status == 'refunded':
+            return jsonify({'error': 'Payment has already been refunded'}), 400
         
-        # Update lead status if needed
-        lead = Lead.query.get(payment.lead_id)
-        if lead:
-            lead.is_claimed = False
-            lead.plumber_id = None
-            lead.claimed_at = None
-            lead.status = 'new'
+        # Check if payment is eligible for refund
+        if payment.status != 'completed':
+            return jsonify({'error': 'Only completed payments can be refunded'}), 400
         
-        db.session.commit()
+        try:
+            # Process refund with Stripe
+            refund = stripe.Refund.create(
+                payment_intent=payment.processor_payment_id,
+                reason=stripe_reason
+            )
+            current_app.logger.info(f"Refunded payment {payment.id}: {data['reason']}")
+            
+            # Update payment status
+            payment.mark_refunded()
+            
+            # The refunded plumber no longer holds the lead
+            lead = db.session.get(Lead, payment.lead_id)
+            if lead and lead.status == 'claimed' and lead.claimed_by_id == payment.user_id:
+                lead.reopen(lease)
+            else:
+                lease.fence(db.session)
+            
+            db.session.commit()
+            
+            return jsonify({
+                'message': 'Refund processed successfully',
+                'payment': payment.to_dict(),
+                'refund_id': refund.id
+            })
         
-        return jsonify({
-            'message': 'Refund processed successfully',
-            'payment': payment.to_dict(),
-            'refund_id': refund.id
-        })
-    
-    except stripe.error.StripeError as e:
-        return jsonify({'error': str(e)}), 400
-    
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': str(e)}), 500
+        except LockLost as e:
+            current_app.logger.error(f"Refunded payment {payment.id} but lost the lead lock before recording it: {str(e)}")
+            db.session.rollback()
+            return jsonify({'error': 'Lead changed while processing the refund'}), 409
+        
+        except stripe.error.StripeError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
 
 # Helper functions for webhook handling
-def handle_payment_success(payment_intent):
+def handle_payment_success(payment_intent, lease):
     # Find the payment in our database
     payment = Payment.query.filter_by(processor_payment_id=payment_intent['id']).first()
     
-    if payment:
+    # Stripe may deliver an event more than once; only a pending payment needs updating
+    if payment and payment.status == 'pending':
         # Mark payment as completed
-        payment.mark_as_completed()
+        payment.mark_completed()
         
-        # Update any other necessary records
+        # The plumber may never call complete-payment; a successful charge claims the lead by itself
+        lead = db.session.get(Lead, payment.lead_id)
+        if lead and lead.status == 'reserved' and lead.reserved_by_id == payment.user_id:
+            lead.claim(payment.user_id, lease)
+        else:
+            current_app.logger.warning(f"Payment {payment.id} succeeded but lead {payment.lead_id} is no longer reserved for its payer")
+            lease.fence(db.session)
         db.session.commit()
 
-def handle_payment_failure(payment_intent):
+def handle_payment_failure(payment_intent, lease):
     # Find the payment in our database
     payment = Payment.query.filter_by(processor_payment_id=payment_intent['id']).first()
     
-    if payment:
+    if payment and payment.status == 'pending':
         # Mark payment as failed
-        payment.mark_as_failed()
-        
-        # Revert lead claim
-        lead = Lead.query.get(payment.lead_id)
-        if lead:
-            lead.is_claimed = False
-            lead.plumber_id = None
-            lead.claimed_at = None
-            lead.status = 'new'
+        error = payment_intent.get('last_payment_error') or {}
+        payment.mark_failed(error.get('message', 'Payment failed'))
         
-        db.session.commit() 
\ No newline at end of file
+        # Release the lead if it is still reserved for this payment (commits the payment too)
+        lead = db.session.get(Lead, payment.lead_id)
+        if lead and lead.status == 'reserved' and lead.reserved_by_id == payment.user_id:
+            lead.release(lease)
+        else:
+            lease.fence(db.session)
+            db.session.commit() 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from flask import jsonify, request
+from flask import jsonify, request, current_app
 from flask_login import current_user, login_required
 from app import db
 from app.api import bp
@@ -153,7 +153,8 @@ def get_service_areas():
         {"id": "94301", "name": "Palo Alto"}
     ]
     
-    return jsonify(service_areas)
+    return current_app.extensions['response_cache'].static_json(
+        service_areas, max_age=current_app.config['REFERENCE_DATA_MAX_AGE'])
 
 # Get service type options
 @bp.route('/service-types', methods=['GET'])
@@ -171,4 +172,5 @@ def get_service_types():
         {"id": "residential", "name": "Residential Plumbing"}
     ]
     
-    return jsonify(service_types) 
\ No newline at end of file
+    return current_app.extensions['response_cache'].static_json(
+        service_types, max_age=current_app.config['REFERENCE_DATA_MAX_AGE']) 
\ No newline at end of file
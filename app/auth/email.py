@@ -1,18 +1,10 @@
 from flask import current_app, render_template
-from flask_mail import Message
-from app import mail
-from threading import Thread
-
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+from app.services.mail_outbox import enqueue_email, kick_outbox
 
 def send_email(subject, sender, recipients, text_body, html_body):
-    msg = Message(subject, sender=sender, recipients=recipients)
-    msg.body = text_body
-    msg.html = html_body
-    
-    Thread(target=send_async_email, args=(current_app._get_current_object(), msg)).start()
+    """Queue an email in the outbox and wake the delivery workers."""
+    enqueue_email(subject, sender, recipients, text_body, html_body)
+    kick_outbox()
 
 def send_password_reset_email(user):
     token = user.get_reset_password_token()
@@ -24,4 +16,4 @@ def send_password_reset_email(user):
                                 user=user, token=token),
         html_body=render_template('email/reset_password.html',
                                 user=user, token=token)
-    ) 
\ No newline at end of file
+    )
@@ -4,32 +4,15 @@ from app.auth import bp
 from app.auth.forms import LoginForm, RegistrationForm, ResetPasswordRequestForm, ResetPasswordForm
 from app.models.user import User
 from app.services.supabase import get_supabase_client
+from app.utils.geocoding import geocode_address
 import json
 import logging
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut
 import os
 from werkzeug.utils import secure_filename
 from flask import current_app
 
 logger = logging.getLogger(__name__)
 
-def geocode_address(address, city, state, zip_code):
-    """Convert address to coordinates using geopy."""
-    try:
-        geolocator = Nominatim(user_agent="plumberleads")
-        full_address = f"{address}, {city}, {state} {zip_code}"
-        location = geolocator.geocode(full_address)
-        if location:
-            return location.latitude, location.longitude
-        return None, None
-    except GeocoderTimedOut:
-        logger.error("Geocoding timed out")
-        return None, None
-    except Exception as e:
-        logger.error(f"Geocoding error: {str(e)}")
-        return None, None
-
 def save_profile_image(file):
     """Save a profile image and return the filename."""
     if file and file.filename:
@@ -62,9 +45,9 @@ def login():
                 # Get user profile from our database
                 user = User.query.filter_by(email=form.email.data.lower()).first()
                 if user:
+                    # Keep the session payload small: only what routes and templates read
                     session['user'] = {
                         'id': user.id,
-                        'email': user.email,
                         'full_name': user.full_name,
                         'is_admin': user.is_admin,
                         'email_confirmed_at': response.user.email_confirmed_at
@@ -170,8 +153,8 @@ def register():
                     longitude=longitude,
                     service_radius=form.service_radius.data,
                     # Service areas and types
-                    service_areas=json.dumps(form.service_areas.data),
-                    service_types=json.dumps(form.service_types.data),
+                    service_areas=form.service_areas.data,
+                    service_types=form.service_types.data,
                     is_active=True,
                     is_admin=False,
                     is_verified=False
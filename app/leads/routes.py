@@ -1,17 +1,18 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, session, jsonify
-from app import db
+from app import db, locks
 from app.leads import bp
 from app.models.lead import Lead
 from app.models.user import User
 from app.models.payment import Payment
 from app.routes.plumber import calculate_distance
+from app.services.locks import LockLost, LockUnavailable
 from flask import current_app
 import json
 import stripe
 from datetime import datetime
 from flask_login import login_required
 from functools import wraps
-from app.utils.pricing import calculate_lead_price
+from app.utils.pricing import lead_price_cents, price_leads
 
 def login_required(f):
     @wraps(f)
@@ -29,8 +30,10 @@ def available():
         flash('Please log in to view available leads.', 'warning')
         return redirect(url_for('auth.login'))
     
-    # Get all available leads
-    leads = Lead.query.filter_by(status='available').order_by(Lead.created_at.desc()).all()
+    # Get one page of available leads; the cards themselves come from the fragment cache
+    page = request.args.get('page', 1, type=int)
+    leads = Lead.query.filter_by(status='available').order_by(Lead.created_at.desc()).paginate(
+        page=page, per_page=current_app.config['LEADS_PER_PAGE'], error_out=False)
     return render_template('leads/available.html', leads=leads)
 
 @bp.route('/<uuid:lead_id>')
@@ -56,69 +59,77 @@ def view(lead_id):
         time_left = int(expiration_time - datetime.utcnow().timestamp())
         current_app.logger.info(f"View route - Time left (seconds): {time_left}")
     
+    # The details section only changes with the lead or the pricing settings
+    details_key = ('details', lead.id, lead.updated_at,
+                   current_app.config['LEAD_CLAIM_PERCENTAGE'], current_app.config['MINIMUM_LEAD_PRICE'])
+    
     return render_template('leads/view.html', 
                          lead=lead,
                          time_left=time_left,
-                         calculate_lead_price=calculate_lead_price)
+                         details_key=details_key,
+                         pricing=price_leads([lead])[lead.id])
 
 @bp.route('/<uuid:lead_id>/claim', methods=['POST'])
 @login_required
 def claim(lead_id):
     try:
-        lead = Lead.query.get_or_404(lead_id)
-        user = User.query.get(session.get('user_id'))
+        # One reservation attempt per lead at a time, whichever route or host it comes from
+        with locks.hold_lead(lead_id) as lease:
+            lead = Lead.query.get_or_404(lead_id)
+            user = User.query.get(session.get('user_id'))
 
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
 
-        if not user.is_verified():
-            return jsonify({'error': 'Please verify your email address before claiming leads'}), 400
+            if not user.is_verified():
+                return jsonify({'error': 'Please verify your email address before claiming leads'}), 400
 
-        if lead.status != 'available':
-            return jsonify({'error': 'This lead is not available'}), 400
+            if lead.status != 'available':
+                return jsonify({'error': 'This lead is not available'}), 400
 
-        # Check if lead is within service radius
-        if user.latitude and user.longitude and lead.latitude and lead.longitude:
-            distance = calculate_distance(
-                user.latitude, user.longitude,
-                lead.latitude, lead.longitude
-            )
-            if distance > user.service_radius:
-                return jsonify({'error': 'This lead is outside your service area'}), 400
+            # Check if lead is within service radius
+            if user.latitude and user.longitude and lead.latitude and lead.longitude:
+                distance = calculate_distance(
+                    user.latitude, user.longitude,
+                    lead.latitude, lead.longitude
+                )
+                if distance > user.service_radius:
+                    return jsonify({'error': 'This lead is outside your service area'}), 400
 
-        # Initialize Stripe
-        stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
+            # Initialize Stripe
+            stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
 
-        # Create payment intent
-        payment_intent = stripe.PaymentIntent.create(
-            amount=int(lead.price * 100),  # Convert to cents
-            currency='usd',
-            metadata={
-                'lead_id': str(lead.id),
-                'user_id': str(user.id)
-            }
-        )
+            # Create payment intent
+            payment_intent = stripe.PaymentIntent.create(
+                amount=lead_price_cents(lead),
+                currency='usd',
+                metadata={
+                    'lead_id': str(lead.id),
+                    'user_id': str(user.id)
+                }
+            )
 
-        # Reserve the lead
-        lead.reserve(user.id)
+            # Create payment record
+            payment = Payment(
+                lead_id=lead.id,
+                user_id=user.id,
+                amount_cents=lead_price_cents(lead),
+                payment_intent_id=payment_intent.id,
+                status='pending'
+            )
+            db.session.add(payment)
 
-        # Create payment record
-        payment = Payment(
-            lead_id=lead.id,
-            user_id=user.id,
-            amount=lead.price,
-            payment_intent_id=payment_intent.id,
-            status='pending'
-        )
-        db.session.add(payment)
+            # Reserve the lead (commits the payment too)
+            lead.reserve(user.id, lease)
 
-        db.session.commit()
-
-        return jsonify({
-            'client_secret': payment_intent.client_secret,
-            'message': 'Lead reserved successfully'
-        })
+            return jsonify({
+                'client_secret': payment_intent.client_secret,
+                'message': 'Lead reserved successfully'
+            })
 
+    except (LockUnavailable, LockLost):
+        db.session.rollback()
+        return jsonify({'error': 'This lead is being reserved by another plumber'}), 409
     except stripe.error.StripeError as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 400
@@ -142,18 +153,27 @@ def reserve(lead_id):
             flash('Your email must be verified before you can reserve leads. Please check your email for the verification link.', 'error')
             return redirect(url_for('leads.view', lead_id=lead_id))
 
-        # Check if lead is available
-        if lead.status != 'available':
-            flash('This lead is no longer available.', 'error')
-            return redirect(url_for('leads.view', lead_id=lead_id))
+        with locks.hold_lead(lead_id) as lease:
+            # Re-read the status now that nobody else can change it
+            db.session.refresh(lead)
+
+            # Check if lead is available
+            if lead.status != 'available':
+                flash('This lead is no longer available.', 'error')
+                return redirect(url_for('leads.view', lead_id=lead_id))
 
-        # Reserve the lead using the model's reserve method
-        lead.reserve(user_id)
+            # Reserve the lead using the model's reserve method
+            lead.reserve(user_id, lease)
 
         expiry_minutes = current_app.config['LEAD_RESERVATION_EXPIRY_MINUTES']
         flash(f'Lead reserved successfully! You have {expiry_minutes} minutes to complete the payment before your reservation expires.', 'success')
         return redirect(url_for('leads.view', lead_id=lead_id))
 
+    except (LockUnavailable, LockLost):
+        db.session.rollback()
+        flash('This lead is being reserved by someone else.', 'error')
+        return redirect(url_for('leads.view', lead_id=lead_id))
+
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f'Error reserving lead: {str(e)}')
@@ -218,7 +238,7 @@ def payment(lead_id):
             
             # Create payment intent
             payment_intent = stripe.PaymentIntent.create(
-                amount=int(lead.price * 100),  # Convert to cents
+                amount=lead_price_cents(lead),
                 currency=current_app.config['DEFAULT_CURRENCY'],
                 metadata={
                     'lead_id': str(lead.id),
@@ -230,7 +250,7 @@ def payment(lead_id):
             payment = Payment(
                 lead_id=lead.id,
                 user_id=user.id,
-                amount=lead.price,
+                amount_cents=lead_price_cents(lead),
                 payment_intent_id=payment_intent.id,
                 status='pending'
             )
@@ -259,17 +279,26 @@ def release(lead_id):
     user_id = session['user']['id']
 
     try:
-        # Check if the lead is reserved by the current user
-        if lead.status != 'reserved' or lead.reserved_by_id != user_id:
-            flash('You can only release leads that you have reserved.', 'error')
-            return redirect(url_for('leads.view', lead_id=lead_id))
+        with locks.hold_lead(lead_id, wait=current_app.config['LOCK_WAIT_SECONDS']) as lease:
+            # Re-read the status now that nobody else can change it
+            db.session.refresh(lead)
+
+            # Check if the lead is reserved by the current user
+            if lead.status != 'reserved' or lead.reserved_by_id != user_id:
+                flash('You can only release leads that you have reserved.', 'error')
+                return redirect(url_for('leads.view', lead_id=lead_id))
 
-        # Release the lead using the model's release method
-        lead.release()
+            # Release the lead using the model's release method
+            lead.release(lease)
 
         flash('Lead released successfully.', 'success')
         return redirect(url_for('leads.view', lead_id=lead_id))
 
+    except (LockUnavailable, LockLost):
+        db.session.rollback()
+        flash('This lead is busy, please try again.', 'error')
+        return redirect(url_for('leads.view', lead_id=lead_id))
+
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f'Error releasing lead: {str(e)}')
@@ -288,9 +317,8 @@ def create_checkout_session(lead_id):
         if lead.status != 'reserved' or lead.reserved_by_id != user_id:
             return jsonify({'error': 'Invalid lead or not reserved by you'}), 400
 
-        # Calculate the price using the utility function
-        pricing = calculate_lead_price(lead.price)
-        price_to_charge = pricing['lead_price']  # Access as dictionary
+        # Charge the claim price stored on the lead, exactly as it was shown
+        pricing = price_leads([lead])[lead.id]
 
         # Initialize Stripe
         stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
@@ -305,7 +333,7 @@ def create_checkout_session(lead_id):
                         'name': lead.title,
                         'description': f"Lead for {lead.service_type} in {lead.city}, {lead.state} ({pricing['percentage']*100:.0f}% of total job price)",
                     },
-                    'unit_amount': int(price_to_charge * 100),  # Convert to cents
+                    'unit_amount': pricing['lead_price_cents'],
                 },
                 'quantity': 1,
             }],
@@ -322,7 +350,7 @@ def create_checkout_session(lead_id):
         payment = Payment(
             lead_id=lead.id,
             user_id=user_id,
-            amount=price_to_charge,
+            amount_cents=pricing['lead_price_cents'],
             currency='usd',
             payment_method='card',
             payment_processor='stripe',
@@ -350,50 +378,45 @@ def payment_success(lead_id):
         lead = Lead.query.get_or_404(lead_id)
         user_id = session['user']['id']
 
-        # Verify the lead is reserved by the current user
-        if lead.status != 'reserved' or str(lead.reserved_by_id) != str(user_id):  # Convert both to strings for comparison
-            flash('Invalid lead or not reserved by you', 'error')
-            return redirect(url_for('leads.view', lead_id=lead_id))
+        with locks.hold_lead(lead_id, wait=current_app.config['LOCK_WAIT_SECONDS']) as lease:
+            # Re-read the status now that nobody else can change it
+            db.session.refresh(lead)
 
-        # Get the most recent payment for this lead
-        payment = Payment.query.filter_by(
-            lead_id=lead.id,
-            user_id=user_id,
-            status='pending'
-        ).order_by(Payment.created_at.desc()).first()
+            # Verify the lead is reserved by the current user
+            if lead.status != 'reserved' or str(lead.reserved_by_id) != str(user_id):  # Convert both to strings for comparison
+                flash('Invalid lead or not reserved by you', 'error')
+                return redirect(url_for('leads.view', lead_id=lead_id))
 
-        if not payment:
-            current_app.logger.error(f"No pending payment found for lead {lead_id}")
-            flash('No pending payment found.', 'error')
-            return redirect(url_for('leads.view', lead_id=lead_id))
+            # Get the most recent payment for this lead
+            payment = Payment.query.filter_by(
+                lead_id=lead.id,
+                user_id=user_id,
+                status='pending'
+            ).order_by(Payment.created_at.desc()).first()
 
-        # Update lead status and tracking
-        lead.status = 'claimed'
-        lead.claimed_at = datetime.utcnow()
-        lead.claimed_by_id = user_id
-        lead.contact_release_count += 1
-
-        # Update payment status
-        payment.status = 'completed'
-
-        # Log the changes
-        from app.utils.lead_history import log_lead_change
-        log_lead_change(
-            lead=lead,
-            field_name='status',
-            old_value='reserved',
-            new_value='claimed',
-            change_type='claim',
-            user_id=user_id
-        )
+            if not payment:
+                current_app.logger.error(f"No pending payment found for lead {lead_id}")
+                flash('No pending payment found.', 'error')
+                return redirect(url_for('leads.view', lead_id=lead_id))
 
-        db.session.commit()
+            # Update lead status, tracking and history
+            lead.claim(user_id, lease)
+
+            # Update payment status
+            payment.status = 'completed'
+
+            db.session.commit()
         current_app.logger.info(f"Successfully claimed lead {lead_id}")
 
         flash('Payment successful! You can now view the customer contact information.', 'success')
             
         return redirect(url_for('leads.view', lead_id=lead_id))
 
+    except (LockUnavailable, LockLost):
+        db.session.rollback()
+        flash('Your payment is still being processed, please refresh the page in a moment.', 'warning')
+        return redirect(url_for('leads.view', lead_id=lead_id))
+
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f'Error in payment success route: {str(e)}')
@@ -447,44 +470,39 @@ def stripe_webhook():
                     current_app.logger.error(f"Lead not found: {lead_id}")
                     return jsonify({'error': 'Lead not found'}), 404
 
-                if lead.status != 'reserved' or str(lead.reserved_by_id) != user_id:
-                    current_app.logger.error(f"Invalid lead state or user: status={lead.status}, reserved_by={lead.reserved_by_id}, user_id={user_id}")
-                    return jsonify({'error': 'Invalid lead state'}), 400
-
-                # Create payment record
-                payment = Payment(
-                    lead_id=lead.id,
-                    user_id=user_id,
-                    amount=session['amount_total'] / 100,  # Convert from cents
-                    currency=session['currency'],
-                    payment_method='card',
-                    payment_processor='stripe',
-                    processor_payment_id=session['id'],
-                    status='completed',
-                    created_at=datetime.fromtimestamp(session['created'])
-                )
-                db.session.add(payment)
-
-                # Update lead status and tracking
-                lead.status = 'claimed'
-                lead.claimed_at = datetime.utcnow()
-                lead.claimed_by_id = user_id
-                lead.contact_release_count += 1
-
-                # Log the changes
-                from app.utils.lead_history import log_lead_change
-                log_lead_change(
-                    lead=lead,
-                    field_name='status',
-                    old_value='reserved',
-                    new_value='claimed',
-                    change_type='claim',
-                    user_id=user_id
-                )
-
-                db.session.commit()
+                with locks.hold_lead(lead.id, wait=current_app.config['LOCK_WAIT_SECONDS']) as lease:
+                    # Re-read the status now that nobody else can change it
+                    db.session.refresh(lead)
+
+                    if lead.status != 'reserved' or str(lead.reserved_by_id) != user_id:
+                        current_app.logger.error(f"Invalid lead state or user: status={lead.status}, reserved_by={lead.reserved_by_id}, user_id={user_id}")
+                        return jsonify({'error': 'Invalid lead state'}), 400
+
+                    # Create payment record
+                    payment = Payment(
+                        lead_id=lead.id,
+                        user_id=user_id,
+                        amount_cents=session['amount_total'],
+                        currency=session['currency'],
+                        payment_method='card',
+                        payment_processor='stripe',
+                        processor_payment_id=session['id'],
+                        status='completed',
+                        created_at=datetime.fromtimestamp(session['created'])
+                    )
+                    db.session.add(payment)
+
+                    # Update lead status, tracking and history
+                    lead.claim(user_id, lease)
+
+                    db.session.commit()
                 current_app.logger.info(f"Successfully processed payment and claimed lead {lead_id}")
                 return jsonify({'status': 'success'})
+
+            except (LockUnavailable, LockLost):
+                # Stripe retries the event
+                db.session.rollback()
+                return jsonify({'error': 'Lead is being processed'}), 409
                 
             except Exception as e:
                 db.session.rollback()
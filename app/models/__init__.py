@@ -3,5 +3,11 @@ from app.models.user import User
 from app.models.lead import Lead
 from app.models.payment import Payment
 from app.models.lead_history import LeadHistory
+from app.models.user_service import UserServiceArea, UserServiceType
+from app.models.server_session import ServerSession
+from app.models.outbox_email import OutboxEmail
+from app.models.notification import Notification
+from app.models.change_sequence import ChangeSequence
+from app.models.lock_lease import LockLease
 
-__all__ = ['User', 'Lead', 'Payment', 'LeadHistory'] 
\ No newline at end of file
+__all__ = ['User', 'Lead', 'Payment', 'LeadHistory', 'UserServiceArea', 'UserServiceType', 'ServerSession', 'OutboxEmail', 'Notification', 'ChangeSequence', 'LockLease'] 
\ No newline at end of file
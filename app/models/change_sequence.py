@@ -0,0 +1,38 @@
+from app import db
+from sqlalchemy import insert, update
+
+class ChangeSequence(db.Model):
+    """A named, monotonically increasing change counter (e.g. for lead sync cursors)."""
+    __tablename__ = 'change_sequences'
+
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+    @classmethod
+    def allocate(cls, session, name, count=1):
+        """
+        Reserve count consecutive values and return the first one.
+
+        The counter row stays locked until the transaction ends, so values
+        become visible in the order they were handed out and a reader that has
+        seen value N will never later find a committed change below N. It also
+        means transactions allocating from the same counter commit one at a
+        time: allocate as late as possible (lead writes do it just before
+        commit), which caps them at roughly one per commit round trip, a few
+        thousand per second on a local PostgreSQL. Each name is its own row,
+        so lock tokens do not contend with lead writes.
+        """
+        table = cls.__table__
+        last = session.execute(
+            update(table)
+            .where(table.c.name == name)
+            .values(value=table.c.value + count)
+            .returning(table.c.value)
+        ).scalar()
+        if last is None:
+            session.execute(insert(table).values(name=name, value=count))
+            last = count
+        return last - count + 1
+
+    def __repr__(self):
+        return f'<ChangeSequence {self.name}: {self.value}>'
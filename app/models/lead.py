@@ -1,8 +1,13 @@
 from datetime import datetime, timedelta
 from app import db
 import uuid
-from sqlalchemy import event
+from sqlalchemy import BigInteger, bindparam, case, cast, event, func, inspect, select, update
+from sqlalchemy.ext.hybrid import hybrid_property
 from app.models.lead_history import LeadHistory
+from app.models.change_sequence import ChangeSequence
+from app.utils.dedupe import lead_fingerprint
+from app.utils.pricing import calculate_claim_price_cents, from_cents, to_cents
+from app.utils.regions import region_key
 
 class Lead(db.Model):
     __tablename__ = 'leads'
@@ -13,7 +18,8 @@ class Lead(db.Model):
     service_type = db.Column(db.String(100), nullable=False)
     service_details = db.Column(db.Text)
     urgency = db.Column(db.String(20), nullable=False, default='medium')
-    price = db.Column(db.Float, nullable=False)
+    price_cents = db.Column(db.Integer, nullable=False)  # Job value
+    claim_price_cents = db.Column(db.Integer)  # What a plumber pays to claim the lead, fixed when the price is written
     status = db.Column(db.String(20), nullable=False, default='available')
     address = db.Column(db.String(200), nullable=False)
     city = db.Column(db.String(100), nullable=False)
@@ -21,6 +27,7 @@ class Lead(db.Model):
     zip_code = db.Column(db.String(20), nullable=False)
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
+    region = db.Column(db.String(24))  # Coordinate cell (or state) for regional queries, kept in sync by set_lead_region
     customer_name = db.Column(db.String(200))
     customer_email = db.Column(db.String(200))
     customer_phone = db.Column(db.String(20))
@@ -33,12 +40,55 @@ class Lead(db.Model):
     contact_release_count = db.Column(db.Integer, default=0)
     claimed_at = db.Column(db.DateTime)
     claimed_by_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('users.id'))
+    notified_at = db.Column(db.DateTime)  # Set once matching plumbers have been notified
+    change_seq = db.Column(db.BigInteger, index=True)  # Bumped on every insert/update; drives the delta sync cursor
+    # Duplicate detection fingerprints, kept in sync by the before_insert/before_update hooks
+    address_hash = db.Column(db.String(32))
+    phone_hash = db.Column(db.String(32))
+    email_hash = db.Column(db.String(32))
+    content_simhash = db.Column(db.BigInteger)
+    duplicate_of_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('leads.id'))
     
     # Relationships
     payment = db.relationship('Payment', backref='lead', uselist=False)
     reserved_by = db.relationship('User', foreign_keys=[reserved_by_id], back_populates='reserved_leads')
     claimed_by = db.relationship('User', foreign_keys=[claimed_by_id], backref='claimed_leads')
     
+    __table_args__ = (
+        # Recent-lead lookups for duplicate detection
+        db.Index('ix_leads_address_hash_created', 'address_hash', 'created_at'),
+        db.Index('ix_leads_phone_hash_created', 'phone_hash', 'created_at'),
+        db.Index('ix_leads_email_hash_created', 'email_hash', 'created_at'),
+        # Lead listings: status with the plumber's ZIP codes and service types, newest first
+        db.Index('ix_leads_status_zip_type_created', 'status', 'zip_code', 'service_type', 'created_at'),
+        db.Index('ix_leads_status_created', 'status', 'created_at'),
+        # Nearby leads: the regions in range, then the bounding box, before the exact distance check
+        db.Index('ix_leads_region_status_lat_lng', 'region', 'status', 'latitude', 'longitude'),
+        # A plumber's claimed and reserved leads
+        db.Index('ix_leads_claimed_by_claimed_at', 'claimed_by_id', 'claimed_at'),
+        db.Index('ix_leads_reserved_by_status', 'reserved_by_id', 'status'),
+        # Expired reservation sweep
+        db.Index('ix_leads_status_reserved_at', 'status', 'reserved_at'),
+    )
+    
+    @hybrid_property
+    def price(self):
+        """Job value in dollars"""
+        return from_cents(self.price_cents)
+    
+    @price.setter
+    def price(self, value):
+        self.price_cents = to_cents(value)
+    
+    @price.expression
+    def price(cls):
+        return cls.price_cents / 100.0
+    
+    @property
+    def claim_price(self):
+        """Claim price in dollars"""
+        return from_cents(self.claim_price_cents)
+    
     def to_dict(self, include_contact=False):
         """Convert to dictionary, optionally including contact info"""
         data = {
@@ -52,11 +102,16 @@ class Lead(db.Model):
             'service_details': self.service_details,
             'urgency': self.urgency,
             'price': self.price,
+            'price_cents': self.price_cents,
+            'claim_price': self.claim_price,
+            'claim_price_cents': self.claim_price_cents,
             'status': self.status,
             'reserved_at': self.reserved_at.isoformat() if self.reserved_at else None,
             'source': self.source,
             'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'change_seq': self.change_seq,
+            'duplicate_of_id': str(self.duplicate_of_id) if self.duplicate_of_id else None
         }
         
         # Only include contact info if requested and lead is claimed
@@ -71,8 +126,23 @@ class Lead(db.Model):
             
         return data
     
-    def reserve(self, user_id):
-        """Reserve a lead for a user."""
+    def fence(self, lease):
+        """
+        Make the current transaction conditional on still holding this lead's lock.
+        
+        Every change to a lead's reservation state (reserve, release, claim,
+        update_status) goes through here, so a writer without the lead's lease,
+        or whose lease ran out, cannot commit over the current holder's work.
+        """
+        from app.services.locks import lead_lock_name
+        
+        if lease.name != lead_lock_name(self.id):
+            raise ValueError(f"{lease!r} does not cover lead {self.id}")
+        lease.fence(db.session)
+    
+    def reserve(self, user_id, lease):
+        """Reserve a lead for a user; lease is the lead's lock (locks.hold_lead)."""
+        self.fence(lease)
         old_status = self.status
         self.status = 'reserved'
         self.reserved_by_id = user_id
@@ -84,8 +154,9 @@ class Lead(db.Model):
         
         db.session.commit()
         
-    def release(self):
-        """Release a reserved lead."""
+    def release(self, lease):
+        """Release a reserved lead; lease is the lead's lock (locks.hold_lead)."""
+        self.fence(lease)
         old_status = self.status
         self.status = 'available'
         self.reserved_by_id = None
@@ -96,10 +167,11 @@ class Lead(db.Model):
         
         db.session.commit()
         
-    def claim(self, user_id):
-        """Claim a lead after successful payment."""
+    def claim(self, user_id, lease):
+        """Claim a lead after successful payment; lease is the lead's lock (locks.hold_lead)."""
         from app.utils.lead_history import log_lead_change
         
+        self.fence(lease)
         old_status = self.status
         self.status = 'claimed'
         self.claimed_at = datetime.utcnow()
@@ -126,10 +198,24 @@ class Lead(db.Model):
             user_id=user_id
         )
         
-    def update_status(self, status):
-        """Update the status of this lead"""
-        valid_statuses = ['available', 'reserved', 'claimed', 'completed', 'closed']
+    def reopen(self, lease):
+        """Put a claimed lead back on offer, e.g. after a refund; lease is the lead's lock (locks.hold_lead)."""
+        self.fence(lease)
+        old_status = self.status
+        self.status = 'available'
+        self.claimed_by_id = None
+        self.claimed_at = None
+        self.reserved_by_id = None
+        self.reserved_at = None
+        
+        # Log the status change
+        db.session.add(LeadHistory.log_status_change(self, old_status, 'available'))
+        
+    def update_status(self, status, lease):
+        """Update the status of this lead; lease is the lead's lock (locks.hold_lead)"""
+        valid_statuses = ['available', 'reserved', 'claimed', 'completed', 'closed', 'duplicate']
         if status in valid_statuses:
+            self.fence(lease)
             old_status = self.status
             self.status = status
             
@@ -139,12 +225,45 @@ class Lead(db.Model):
             return True
         return False
     
+    @classmethod
+    def reprice_available(cls, session, snapshot):
+        """
+        Recompute the stored claim price of every available lead in one statement.
+        
+        Each repriced lead still gets its own change sequence value, so delta
+        sync clients see the new prices: the counter row is locked before the
+        update and only advanced by the number of rows it changed.
+        
+        Returns:
+            int: Number of leads whose claim price changed
+        """
+        leads = cls.__table__
+        # BIGINT: price_cents * basis points overflows a 32-bit integer above ~$14,000 at 15%
+        calculated = (cast(leads.c.price_cents, BigInteger) * snapshot.basis_points + 5000) // 10000
+        claim_price = case((calculated < snapshot.minimum_cents, snapshot.minimum_cents), else_=calculated)
+        numbered = select(leads.c.id, func.row_number().over(order_by=leads.c.id).label('n')) \
+            .where(leads.c.status == 'available', leads.c.claim_price_cents.is_distinct_from(claim_price)) \
+            .subquery()
+        
+        first = ChangeSequence.allocate(session, 'leads', 0)
+        repriced = session.execute(
+            update(leads)
+            .where(leads.c.id == numbered.c.id)
+            .values(claim_price_cents=claim_price, change_seq=first + numbered.c.n - 1)
+        ).rowcount
+        ChangeSequence.allocate(session, 'leads', repriced)
+        return repriced
+    
+    @staticmethod
+    def reservation_cutoff(max_minutes=60):
+        """Reservations made before this time have expired"""
+        return datetime.utcnow() - timedelta(minutes=max_minutes)
+    
     def is_reservation_expired(self, max_minutes=60):
         """Check if the lead reservation has expired"""
         if not self.reserved_at:
             return False
-        expiration_time = self.reserved_at + timedelta(minutes=max_minutes)
-        return datetime.utcnow() > expiration_time
+        return self.reserved_at < Lead.reservation_cutoff(max_minutes)
     
     def __repr__(self):
         return f'<Lead {self.id}: {self.title}>'
@@ -154,14 +273,77 @@ class Lead(db.Model):
 def track_lead_changes(mapper, connection, target):
     """Track changes to lead fields."""
     for attr in mapper.attrs:
-        if attr.key in ['status', 'price', 'reserved_by_id']:
+        if attr.key in ['status', 'price_cents', 'reserved_by_id']:
             old_value = getattr(target, attr.key)
             new_value = getattr(target, attr.key)
             
             if old_value != new_value:
                 if attr.key == 'status':
                     db.session.add(LeadHistory.log_status_change(target, old_value, new_value))
-                elif attr.key == 'price':
-                    db.session.add(LeadHistory.log_price_change(target, old_value, new_value))
+                elif attr.key == 'price_cents':
+                    db.session.add(LeadHistory.log_price_change(target, from_cents(old_value), from_cents(new_value)))
                 elif attr.key == 'reserved_by_id':
-                    db.session.add(LeadHistory.log_reservation(target, new_value)) 
\ No newline at end of file
+                    db.session.add(LeadHistory.log_reservation(target, new_value)) 
+
+# Stamp new and changed leads with the next change sequence values when their transaction commits
+@event.listens_for(db.session, 'after_flush')
+def collect_changed_leads(session, flush_context):
+    """Remember the leads written in this flush until the transaction commits."""
+    changed = session.info.setdefault('changed_leads', {})
+    for obj in session.new:
+        if isinstance(obj, Lead):
+            changed[obj.id] = True
+    for obj in session.dirty:
+        if isinstance(obj, Lead) and session.is_modified(obj):
+            changed[obj.id] = True
+
+@event.listens_for(db.session, 'before_commit')
+def assign_change_seq(session):
+    """
+    Give every lead written in this transaction a fresh change sequence value.
+    
+    Done at commit rather than at the first flush because the counter row stays
+    locked until the transaction ends: this way only the final UPDATE and the
+    commit itself run under it, whatever the caller did in between.
+    """
+    session.flush()
+    changed = session.info.pop('changed_leads', None)
+    if not changed:
+        return
+    
+    leads = Lead.__table__
+    first = ChangeSequence.allocate(session, 'leads', len(changed))
+    session.execute(
+        update(leads)
+        .where(leads.c.id == bindparam('lead_id'))
+        .values(change_seq=bindparam('seq'), updated_at=leads.c.updated_at),
+        [{'lead_id': lead_id, 'seq': first + offset} for offset, lead_id in enumerate(changed)]
+    )
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def discard_changed_leads(session, previous_transaction):
+    session.info.pop('changed_leads', None)
+
+# Fields the dedupe fingerprint is computed from
+FINGERPRINT_FIELDS = ['address', 'city', 'state', 'zip_code', 'customer_phone', 'customer_email', 'title', 'description']
+
+@event.listens_for(Lead, 'before_insert')
+@event.listens_for(Lead, 'before_update')
+def set_lead_fingerprint(mapper, connection, target):
+    """Keep the duplicate detection columns in sync with the lead's contact details and text."""
+    fingerprint = lead_fingerprint({field: getattr(target, field) for field in FINGERPRINT_FIELDS})
+    for key, value in fingerprint.items():
+        setattr(target, key, value)
+
+@event.listens_for(Lead, 'before_insert')
+@event.listens_for(Lead, 'before_update')
+def set_claim_price(mapper, connection, target):
+    """Store the claim price when the job price is written, so listings never recompute it."""
+    if target.claim_price_cents is None or inspect(target).attrs.price_cents.history.has_changes():
+        target.claim_price_cents = calculate_claim_price_cents(target.price_cents)
+
+@event.listens_for(Lead, 'before_insert')
+@event.listens_for(Lead, 'before_update')
+def set_lead_region(mapper, connection, target):
+    """Keep the region key in sync with the lead's coordinates and state."""
+    target.region = region_key(target.latitude, target.longitude, target.state)
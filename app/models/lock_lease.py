@@ -0,0 +1,19 @@
+from datetime import datetime
+from app import db
+
+class LockLease(db.Model):
+    """A lease on a named lock, held by one process until it expires (see app/services/locks.py)."""
+    __tablename__ = 'lock_leases'
+
+    name = db.Column(db.String(100), primary_key=True)
+    owner = db.Column(db.String(100), nullable=False)  # host:pid of the holder, for debugging
+    token = db.Column(db.BigInteger, nullable=False)  # Fencing token, increases with every acquisition of any lock
+    acquired_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    def is_expired(self):
+        """Check if the lease has expired"""
+        return self.expires_at <= datetime.utcnow()
+
+    def __repr__(self):
+        return f'<LockLease {self.name}: {self.token}>'
@@ -0,0 +1,44 @@
+from datetime import datetime
+from app import db
+import uuid
+
+class Notification(db.Model):
+    """An in-app notification telling a plumber about a lead."""
+    __tablename__ = 'notifications'
+
+    id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('users.id'), nullable=False)
+    lead_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('leads.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False, default='new_lead')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    read_at = db.Column(db.DateTime)
+    emailed_at = db.Column(db.DateTime)  # Set once the notification went out in an email digest
+
+    # Relationships
+    lead = db.relationship('Lead')
+
+    __table_args__ = (
+        # One notification per plumber, lead and kind
+        db.UniqueConstraint('user_id', 'lead_id', 'kind', name='uq_notifications_user_lead_kind'),
+        db.Index('ix_notifications_user_created', 'user_id', 'created_at'),
+        db.Index('ix_notifications_user_emailed', 'user_id', 'emailed_at'),
+    )
+
+    def mark_read(self):
+        """Mark notification as read"""
+        if not self.read_at:
+            self.read_at = datetime.utcnow()
+
+    def to_dict(self):
+        """Convert to dictionary"""
+        return {
+            'id': str(self.id),
+            'kind': self.kind,
+            'lead_id': str(self.lead_id),
+            'lead': self.lead.to_dict() if self.lead else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'read_at': self.read_at.isoformat() if self.read_at else None
+        }
+
+    def __repr__(self):
+        return f'<Notification {self.id}: {self.user_id} - {self.lead_id}>'
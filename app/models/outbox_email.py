@@ -0,0 +1,68 @@
+from datetime import datetime
+from app import db
+from flask_mail import Message
+import json
+import uuid
+
+class OutboxEmail(db.Model):
+    """An outgoing email waiting to be delivered by the outbox workers."""
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    subject = db.Column(db.String(255), nullable=False)
+    sender = db.Column(db.String(200))
+    recipients = db.Column(db.Text, nullable=False)  # JSON list of addresses
+    text_body = db.Column(db.Text)
+    html_body = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(32), index=True)
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    def set_recipients(self, recipients):
+        """Set recipients as a JSON string"""
+        self.recipients = json.dumps(list(recipients))
+
+    def get_recipients(self):
+        """Get recipients as a list"""
+        if not self.recipients:
+            return []
+        return json.loads(self.recipients)
+
+    def to_message(self):
+        """Build the Flask-Mail message for this email"""
+        msg = Message(self.subject, sender=self.sender, recipients=self.get_recipients())
+        msg.body = self.text_body
+        msg.html = self.html_body
+        return msg
+
+    def mark_sent(self):
+        """Mark the email as delivered"""
+        self.status = 'sent'
+        self.sent_at = datetime.utcnow()
+        self.claim_token = None
+        self.last_error = None
+
+    def mark_retry(self, error_message, next_attempt_at):
+        """Record a failed attempt and schedule the next one"""
+        self.status = 'pending'
+        self.claim_token = None
+        self.last_error = error_message
+        self.next_attempt_at = next_attempt_at
+
+    def mark_failed(self, error_message):
+        """Give up on the email"""
+        self.status = 'failed'
+        self.claim_token = None
+        self.last_error = error_message
+
+    def __repr__(self):
+        return f'<OutboxEmail {self.id}: {self.subject}>'
@@ -1,5 +1,7 @@
 from datetime import datetime
 from app import db
+from sqlalchemy.ext.hybrid import hybrid_property
+from app.utils.pricing import from_cents, to_cents
 import uuid
 
 class Payment(db.Model):
@@ -8,11 +10,11 @@ class Payment(db.Model):
     id = db.Column(db.UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('users.id'), nullable=False)
     lead_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('leads.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount_cents = db.Column(db.Integer, nullable=False)  # Amount charged, in the currency's minor unit
     currency = db.Column(db.String(3), default='USD')
     payment_method = db.Column(db.String(50), nullable=False)
     payment_processor = db.Column(db.String(50), nullable=False)
-    processor_payment_id = db.Column(db.String(100), nullable=False)
+    processor_payment_id = db.Column(db.String(100), nullable=False, index=True)  # Webhook lookups
     status = db.Column(db.String(20), default='pending')  # pending, completed, failed, refunded
     payment_intent_id = db.Column(db.String(100))
     client_secret = db.Column(db.String(100))
@@ -21,6 +23,24 @@ class Payment(db.Model):
     completed_at = db.Column(db.DateTime)
     refunded_at = db.Column(db.DateTime)
     
+    __table_args__ = (
+        # The payment behind a lead reservation
+        db.Index('ix_payments_lead_user', 'lead_id', 'user_id'),
+    )
+    
+    @hybrid_property
+    def amount(self):
+        """Amount in dollars"""
+        return from_cents(self.amount_cents)
+    
+    @amount.setter
+    def amount(self, value):
+        self.amount_cents = to_cents(value)
+    
+    @amount.expression
+    def amount(cls):
+        return cls.amount_cents / 100.0
+    
     def to_dict(self):
         """Convert to dictionary"""
         return {
@@ -28,6 +48,7 @@ class Payment(db.Model):
             'user_id': str(self.user_id),
             'lead_id': str(self.lead_id),
             'amount': self.amount,
+            'amount_cents': self.amount_cents,
             'currency': self.currency,
             'payment_method': self.payment_method,
             'payment_processor': self.payment_processor,
@@ -0,0 +1,18 @@
+from datetime import datetime
+from app import db
+
+class ServerSession(db.Model):
+    """Server-side storage for Flask sessions, shared by every app host."""
+    __tablename__ = 'sessions'
+
+    sid = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def is_expired(self):
+        """Check if the session has expired"""
+        return self.expires_at <= datetime.utcnow()
+
+    def __repr__(self):
+        return f'<ServerSession {self.sid[:8]}...>'
@@ -1,5 +1,6 @@
 from datetime import datetime
 from app import db
+from app.models.user_service import UserServiceArea, UserServiceType
 from flask import current_app
 import json
 import uuid
@@ -26,37 +27,88 @@ class User(db.Model):
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
     service_radius = db.Column(db.Integer, nullable=False, default=25)  # Default 25 mile radius
-    service_areas = db.Column(db.Text, nullable=False) # JSON string of service areas
-    service_types = db.Column(db.Text, nullable=False) # JSON string of service types
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     reserved_leads = db.relationship('Lead', foreign_keys='Lead.reserved_by_id', back_populates='reserved_by', lazy='dynamic')
     payments = db.relationship('Payment', backref='user', lazy='dynamic')
+    service_area_links = db.relationship('UserServiceArea', cascade='all, delete-orphan',
+                                         order_by='UserServiceArea.position', lazy='selectin')
+    service_type_links = db.relationship('UserServiceType', cascade='all, delete-orphan',
+                                         order_by='UserServiceType.position', lazy='selectin')
+    
+    __table_args__ = (
+        # Bounding-box prefilter when matching plumbers to a lead's location
+        db.Index('ix_users_lat_lng', 'latitude', 'longitude'),
+    )
     
     def __init__(self, **kwargs):
+        # Service areas/types used to be JSON text columns; keep accepting them as keyword arguments
+        service_areas = kwargs.pop('service_areas', None)
+        service_types = kwargs.pop('service_types', None)
         super(User, self).__init__(**kwargs)
+        if service_areas is not None:
+            self.set_service_areas(service_areas)
+        if service_types is not None:
+            self.set_service_types(service_types)
+    
+    @staticmethod
+    def _normalize_values(values):
+        """Accept a list or a legacy JSON string and return a de-duplicated list"""
+        if isinstance(values, str):
+            values = json.loads(values) if values else []
+        seen = []
+        for value in values or []:
+            if value and value not in seen:
+                seen.append(value)
+        return seen
+    
+    @staticmethod
+    def _sync_links(links, values, make_link, key):
+        """Update a link collection in place so unchanged rows are kept rather than re-inserted"""
+        existing = {getattr(link, key): link for link in links}
+        links[:] = []
+        for position, value in enumerate(values):
+            link = existing.get(value) or make_link(value)
+            link.position = position
+            links.append(link)
     
     def set_service_areas(self, areas):
-        """Set service areas as a JSON string"""
-        self.service_areas = json.dumps(areas)
+        """Set service areas from a list"""
+        self._sync_links(self.service_area_links, self._normalize_values(areas),
+                         lambda area: UserServiceArea(area=area), 'area')
         
     def get_service_areas(self):
         """Get service areas as a list"""
-        if not self.service_areas:
-            return []
-        return json.loads(self.service_areas)
+        return [link.area for link in self.service_area_links]
     
     def set_service_types(self, types):
-        """Set service types as a JSON string"""
-        self.service_types = json.dumps(types)
+        """Set service types from a list"""
+        self._sync_links(self.service_type_links, self._normalize_values(types),
+                         lambda service_type: UserServiceType(service_type=service_type), 'service_type')
         
     def get_service_types(self):
         """Get service types as a list"""
-        if not self.service_types:
-            return []
-        return json.loads(self.service_types)
+        return [link.service_type for link in self.service_type_links]
+    
+    @classmethod
+    def serving(cls, area=None, service_type=None):
+        """Query active plumbers covering an area and/or offering a service type.
+
+        Both lookups go through the indexed association tables instead of
+        parsing every user's settings in Python.
+        """
+        query = cls.query.filter(cls.is_active == True, cls.is_admin == False)
+        if area:
+            query = query.filter(cls.id.in_(
+                db.session.query(UserServiceArea.user_id).filter(UserServiceArea.area == area)
+            ))
+        if service_type:
+            query = query.filter(cls.id.in_(
+                db.session.query(UserServiceType.user_id).filter(UserServiceType.service_type == service_type)
+            ))
+        return query
     
     def is_verified(self, verification_status=None):
         """Check if the user's email is verified.
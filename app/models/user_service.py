@@ -0,0 +1,34 @@
+from app import db
+
+class UserServiceArea(db.Model):
+    """A service area (ZIP code or city) covered by a plumber."""
+    __tablename__ = 'user_service_areas'
+
+    user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    area = db.Column(db.String(100), primary_key=True)
+    position = db.Column(db.Integer, nullable=False, default=0)  # Preserves the order the plumber chose
+
+    # Reverse lookup: "all plumbers serving area X"
+    __table_args__ = (
+        db.Index('ix_user_service_areas_area', 'area', 'user_id'),
+    )
+
+    def __repr__(self):
+        return f'<UserServiceArea {self.user_id}: {self.area}>'
+
+
+class UserServiceType(db.Model):
+    """A service type offered by a plumber."""
+    __tablename__ = 'user_service_types'
+
+    user_id = db.Column(db.UUID(as_uuid=True), db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    service_type = db.Column(db.String(100), primary_key=True)
+    position = db.Column(db.Integer, nullable=False, default=0)  # Preserves the order the plumber chose
+
+    # Reverse lookup: "all plumbers offering service type X"
+    __table_args__ = (
+        db.Index('ix_user_service_types_service_type', 'service_type', 'user_id'),
+    )
+
+    def __repr__(self):
+        return f'<UserServiceType {self.user_id}: {self.service_type}>'
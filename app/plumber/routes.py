@@ -1,11 +1,14 @@
-from flask import render_template, redirect, url_for, flash, request, session
+from flask import render_template, redirect, url_for, flash, request, session, current_app, Response, jsonify
 from app.plumber import bp
 from app.models.lead import Lead
 from app.models.user import User
+from app.routes.plumber import calculate_distance
+from app.utils.regions import bounding_box, regions_within
 from sqlalchemy import func
 from app import db
 import json
-from app.utils.pricing import calculate_lead_price
+import time
+from app.utils.pricing import price_leads
 
 @bp.route('/dashboard')
 def dashboard():
@@ -23,11 +26,13 @@ def dashboard():
         flash('Please update your location information in your profile to view nearby leads.', 'warning')
         nearby_leads = []
     else:
-        # Get nearby leads
+        # Get nearby leads (only the regions in range, then the bounding box, narrow the index scan)
+        min_lat, max_lat, min_lng, max_lng = bounding_box(user.latitude, user.longitude, user.service_radius)
         nearby_leads = Lead.query.filter(
+            Lead.region.in_(regions_within(user.latitude, user.longitude, user.service_radius)),
             Lead.status == 'available',
-            Lead.latitude.isnot(None),
-            Lead.longitude.isnot(None),
+            Lead.latitude.between(min_lat, max_lat),
+            Lead.longitude.between(min_lng, max_lng),
             func.earth_distance(
                 func.ll_to_earth(Lead.latitude, Lead.longitude),
                 func.ll_to_earth(user.latitude, user.longitude)
@@ -43,8 +48,7 @@ def dashboard():
     return render_template('plumber/dashboard.html',
                          user=user,
                          reserved_leads=reserved_leads,
-                         nearby_leads=nearby_leads,
-                         calculate_lead_price=calculate_lead_price)
+                         nearby_leads=nearby_leads)
 
 @bp.route('/reserved-leads')
 def reserved_leads():
@@ -76,14 +80,16 @@ def nearby_leads():
             func.ll_to_earth(user.latitude, user.longitude)
         ).label('distance_meters')
 
-        # Get nearby leads with distance calculation
+        # Get nearby leads with distance calculation (only the regions in range, then the bounding box, narrow the index scan)
+        min_lat, max_lat, min_lng, max_lng = bounding_box(user.latitude, user.longitude, user.service_radius)
         leads_query = db.session.query(
             Lead,
             distance_calc
         ).filter(
+            Lead.region.in_(regions_within(user.latitude, user.longitude, user.service_radius)),
             Lead.status == 'available',
-            Lead.latitude.isnot(None),
-            Lead.longitude.isnot(None),
+            Lead.latitude.between(min_lat, max_lat),
+            Lead.longitude.between(min_lng, max_lng),
             distance_calc <= user.service_radius * 1609.34  # Convert miles to meters
         ).order_by(distance_calc)  # Sort by nearest first
         
@@ -93,6 +99,70 @@ def nearby_leads():
             lead.distance = distance_meters / 1609.34  # Convert meters to miles
             leads.append(lead)
     
+    # Price the whole page at once from one pricing snapshot
     return render_template('plumber/nearby_leads.html',
                          leads=leads,
-                         calculate_lead_price=calculate_lead_price) 
\ No newline at end of file
+                         lead_pricing=price_leads(leads))
+
+def _lead_feed_filter(user):
+    """Build a predicate selecting the lead events relevant to a plumber"""
+    user_id = str(user.id)
+    latitude, longitude, radius = user.latitude, user.longitude, user.service_radius
+    service_types = set(user.get_service_types())
+    service_areas = set(user.get_service_areas())
+    
+    def matches(event):
+        # Always show what happens to the plumber's own reservations
+        if event.get('reserved_by_id') == user_id:
+            return True
+        if service_types and event.get('service_type') not in service_types:
+            return False
+        if event.get('latitude') is None or event.get('longitude') is None or not latitude or not longitude:
+            return event.get('zip_code') in service_areas
+        return calculate_distance(latitude, longitude, event['latitude'], event['longitude']) <= radius
+    
+    return matches
+
+@bp.route('/lead-feed')
+def lead_feed():
+    """Stream lead created/reserved/released/claimed events as server-sent events"""
+    if not session.get('user'):
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    user = User.query.get(session['user']['id'])
+    if not user:
+        return jsonify({'error': 'Authentication required'}), 401
+    
+    events = current_app.extensions['lead_events']
+    if events.broker.subscriber_count() >= current_app.config['LEAD_FEED_MAX_SUBSCRIBERS']:
+        return jsonify({'error': 'Live feed is busy, try again later'}), 503
+    
+    matches = _lead_feed_filter(user)
+    heartbeat = current_app.config['LEAD_FEED_HEARTBEAT_SECONDS']
+    deadline = time.monotonic() + current_app.config['LEAD_FEED_MAX_DURATION_SECONDS']
+    subscription = events.subscribe()
+    
+    # The stream does not touch the database; give the connection back now
+    db.session.close()
+    
+    def stream():
+        try:
+            yield 'retry: 5000\n\n'
+            while time.monotonic() < deadline:
+                event = subscription.get(timeout=heartbeat)
+                if subscription.overflowed or (event and event['type'] == 'resync'):
+                    # Events were lost; tell the client to reload its lead list
+                    yield 'event: resync\ndata: {}\n\n'
+                    return
+                if event is None:
+                    yield ': keepalive\n\n'
+                elif matches(event):
+                    data = {key: value for key, value in event.items() if key not in ('latitude', 'longitude')}
+                    yield f"event: {event['type']}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            subscription.close()
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
@@ -26,9 +26,9 @@ def available():
     # Apply sorting
     sort_by = request.args.get('sort', 'created_at')
     if sort_by == 'price_asc':
-        query = query.order_by(Lead.price.asc())
+        query = query.order_by(Lead.price_cents.asc())
     elif sort_by == 'price_desc':
-        query = query.order_by(Lead.price.desc())
+        query = query.order_by(Lead.price_cents.desc())
     else:
         query = query.order_by(Lead.created_at.desc())
     
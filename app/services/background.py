@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from threading import BoundedSemaphore
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundExecutor:
+    """
+    Bounded thread pool for fire-and-forget work that needs the app context.
+
+    At most ``max_workers`` jobs run at once and at most ``max_queue`` more
+    wait; anything beyond that is rejected instead of spawning more threads.
+    Callers must be able to tolerate a rejected job, e.g. because the work is
+    also persisted and picked up by the periodic task runner.
+    """
+
+    def __init__(self, name, max_workers=2, max_queue=100):
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = BoundedSemaphore(max_workers + max_queue)
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func to run in an app context. Returns False if the pool is full."""
+        if not self._slots.acquire(blocking=False):
+            logger.warning(f"{self.name}: queue full, job {func.__name__} not scheduled")
+            return False
+
+        app = current_app._get_current_object()
+
+        def run():
+            try:
+                with app.app_context():
+                    func(*args, **kwargs)
+            except Exception:
+                logger.exception(f"{self.name}: job {func.__name__} failed")
+            finally:
+                self._slots.release()
+
+        try:
+            self._executor.submit(run)
+        except RuntimeError:
+            # Interpreter shutting down
+            self._slots.release()
+            return False
+        return True
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs and optionally wait for running ones."""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,266 @@
+"""
+Lead lifecycle events.
+
+Lead inserts, status transitions and other edits are collected while the
+session flushes and published once the transaction commits, so subscribers never see changes
+that were rolled back. Events are dispatched to an in-process broker whose
+subscribers (the plumber live feed) each get a bounded queue; a subscriber
+that falls too far behind is dropped and has to reconnect. The backend
+decides how events reach the brokers of other processes: 'memory' keeps them
+in-process, 'postgres' fans them out with LISTEN/NOTIFY.
+"""
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+from threading import Lock, Thread
+import json
+import logging
+import queue
+import select
+import time
+
+logger = logging.getLogger(__name__)
+
+# Event types by the status a lead moved to
+_STATUS_EVENTS = {
+    'reserved': 'lead.reserved',
+    'available': 'lead.released',
+    'claimed': 'lead.claimed',
+}
+
+
+def build_lead_event(event_type, lead):
+    """Build the event payload for a lead."""
+    return {
+        'type': event_type,
+        'lead_id': str(lead.id),
+        'title': lead.title,
+        'status': lead.status,
+        'service_type': lead.service_type,
+        'urgency': lead.urgency,
+        'price': lead.price,
+        'city': lead.city,
+        'state': lead.state,
+        'zip_code': lead.zip_code,
+        'latitude': lead.latitude,
+        'longitude': lead.longitude,
+        'reserved_by_id': str(lead.reserved_by_id) if lead.reserved_by_id else None,
+        'at': datetime.utcnow().isoformat()
+    }
+
+
+class Subscription:
+    """A subscriber's bounded event queue."""
+
+    def __init__(self, broker, maxsize):
+        self._broker = broker
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.overflowed = True
+            return False
+
+    def get(self, timeout=None):
+        """Next event, or None if nothing arrived within timeout."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self._broker.unsubscribe(self)
+
+
+class EventBroker:
+    """Fans events out to the subscribers in this process."""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._listeners = []
+        self._lock = Lock()
+
+    def add_listener(self, callback):
+        """Call callback(event) synchronously for every event, e.g. to invalidate caches."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def subscribe(self):
+        subscription = Subscription(self, self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def dispatch(self, event):
+        with self._lock:
+            listeners = list(self._listeners)
+            subscribers = list(self._subscribers)
+        for callback in listeners:
+            try:
+                callback(event)
+            except Exception:
+                logger.exception('Lead event listener failed')
+        for subscription in subscribers:
+            if not subscription.put(event):
+                # Too slow: drop it rather than buffer without bound
+                logger.warning('Lead event subscriber overflowed, dropping it')
+                self.unsubscribe(subscription)
+
+
+class MemoryEventBackend:
+    """Delivers events to subscribers in this process only."""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def publish(self, events):
+        for evt in events:
+            self.broker.dispatch(evt)
+
+    def start(self):
+        pass
+
+
+class PostgresEventBackend:
+    """
+    Delivers events to every process through Postgres LISTEN/NOTIFY.
+
+    Publishing issues pg_notify on the channel; a listener thread, started
+    with the first subscriber, dispatches notifications to the local broker
+    (including the ones this process sent).
+    """
+
+    def __init__(self, broker, engine, channel='lead_events'):
+        self.broker = broker
+        self.engine = engine
+        self.channel = channel
+        self._listener = None
+        self._lock = Lock()
+
+    def publish(self, events):
+        with self.engine.begin() as conn:
+            for evt in events:
+                conn.execute(text('SELECT pg_notify(:channel, :payload)'),
+                             {'channel': self.channel, 'payload': json.dumps(evt)})
+
+    def start(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = Thread(target=self._listen_forever, name='lead-events-listener', daemon=True)
+                self._listener.start()
+
+    def _listen_forever(self):
+        while True:
+            try:
+                self._listen()
+            except Exception as e:
+                logger.error(f"Lead event listener error, reconnecting: {str(e)}")
+                time.sleep(5)
+
+    def _listen(self):
+        raw = self.engine.raw_connection()
+        try:
+            conn = raw.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {self.channel}')
+            # Anything sent while we were not listening is lost; tell listeners to start over
+            self.broker.dispatch({'type': 'resync'})
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    self.broker.dispatch(json.loads(notification.payload))
+        finally:
+            raw.invalidate()
+
+
+class LeadEvents:
+    """Flask extension holding the broker and backend for lead events."""
+
+    def __init__(self, app=None):
+        self.broker = None
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.broker = EventBroker(app.config.get('LEAD_EVENTS_QUEUE_SIZE', 100))
+        backend = app.config.get('LEAD_EVENTS_BACKEND', 'memory')
+        if backend == 'postgres':
+            from app import db
+            with app.app_context():
+                engine = db.engine
+            self.backend = PostgresEventBackend(self.broker, engine)
+        elif backend == 'memory':
+            self.backend = MemoryEventBackend(self.broker)
+        else:
+            raise ValueError(f"Unknown LEAD_EVENTS_BACKEND: {backend}")
+        app.extensions['lead_events'] = self
+
+    def start(self):
+        """Start receiving events from other processes (no-op for the memory backend)."""
+        self.backend.start()
+
+    def subscribe(self):
+        """Subscribe to lead events published from now on."""
+        self.start()
+        return self.broker.subscribe()
+
+    def publish(self, events):
+        try:
+            self.backend.publish(events)
+        except Exception as e:
+            # Events are best effort; clients resync when they reconnect
+            logger.error(f"Failed to publish {len(events)} lead events: {str(e)}")
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_lead_events(session, flush_context):
+    from app.models.lead import Lead
+
+    pending = session.info.setdefault('lead_events', [])
+    for obj in session.new:
+        if isinstance(obj, Lead):
+            # Flagged duplicates are stored but never offered: caches still hear about them, feeds don't
+            pending.append(build_lead_event('lead.created' if obj.status == 'available' else 'lead.updated', obj))
+    for obj in session.dirty:
+        if not isinstance(obj, Lead) or not session.is_modified(obj):
+            continue
+        history = inspect(obj).attrs.status.history
+        if history.has_changes() and obj.status in _STATUS_EVENTS:
+            pending.append(build_lead_event(_STATUS_EVENTS[obj.status], obj))
+        else:
+            # Any other edit still matters to caches and delta clients
+            pending.append(build_lead_event('lead.updated', obj))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_lead_events(session):
+    events = session.info.pop('lead_events', None)
+    if not events:
+        return
+    extension = current_app.extensions.get('lead_events')
+    if extension:
+        extension.publish(events)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_lead_events(session, previous_transaction):
+    session.info.pop('lead_events', None)
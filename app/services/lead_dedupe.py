@@ -0,0 +1,120 @@
+"""
+Duplicate lead detection.
+
+Every lead carries hashes of its normalized address, phone and email plus a
+SimHash of its title and description. A new lead is compared only against
+recent leads sharing one of those hashes, found through indexed lookups, so
+the cost per insert does not grow with the table. A candidate is a
+duplicate when it shares the address, phone or email and the texts are
+within LEAD_DEDUPE_MAX_DISTANCE bits of each other, so the same customer
+asking for a different job is not caught.
+
+LEAD_DEDUPE_MODE decides what happens to a duplicate: 'flag' stores it with
+status 'duplicate' and duplicate_of_id set, so it is never offered to
+plumbers; 'merge' drops it and points the caller at the original; 'off'
+disables the check.
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import or_
+from app import db
+from app.models.lead import Lead, FINGERPRINT_FIELDS
+from app.utils.dedupe import hamming_distance, lead_fingerprint
+
+HASH_KEYS = ('address_hash', 'phone_hash', 'email_hash')
+
+
+def is_duplicate(fingerprint, candidate, max_distance):
+    """Decide whether two lead fingerprints describe the same job."""
+    # Same customer (address, phone or email) ...
+    if not any(fingerprint.get(key) and fingerprint.get(key) == candidate.get(key) for key in HASH_KEYS):
+        return False
+    # ... asking for the same thing; a second, different job is not a duplicate
+    a, b = fingerprint.get('content_simhash'), candidate.get('content_simhash')
+    return a is not None and b is not None and hamming_distance(a, b) <= max_distance
+
+
+def find_duplicates(fingerprints):
+    """
+    Find the recent lead each fingerprint duplicates.
+
+    Fingerprints carrying an 'id' also become candidates for the ones after
+    them, so duplicates within a single batch are caught too.
+
+    Args:
+        fingerprints (list): Dicts as returned by lead_fingerprint()
+
+    Returns:
+        list: The original lead id for each fingerprint, or None
+    """
+    window = timedelta(days=current_app.config.get('LEAD_DEDUPE_WINDOW_DAYS', 30))
+    max_distance = current_app.config.get('LEAD_DEDUPE_MAX_DISTANCE', 12)
+
+    conditions = []
+    for key in HASH_KEYS:
+        values = {fingerprint[key] for fingerprint in fingerprints if fingerprint.get(key)}
+        if values:
+            conditions.append(getattr(Lead, key).in_(values))
+
+    candidates = []
+    if conditions:
+        rows = db.session.query(
+            Lead.id, Lead.address_hash, Lead.phone_hash, Lead.email_hash, Lead.content_simhash
+        ).filter(
+            Lead.created_at >= datetime.utcnow() - window,
+            Lead.duplicate_of_id.is_(None),
+            or_(*conditions)
+        ).order_by(Lead.created_at).all()
+        candidates = [dict(row._mapping) for row in rows]
+
+    # Candidates by hash value, so each fingerprint only looks at leads sharing a hash
+    by_hash = {}
+
+    def add_candidate(candidate):
+        for key in HASH_KEYS:
+            if candidate.get(key):
+                by_hash.setdefault((key, candidate[key]), []).append(candidate)
+
+    for candidate in candidates:
+        add_candidate(candidate)
+
+    results = []
+    for fingerprint in fingerprints:
+        match = None
+        for key in HASH_KEYS:
+            for candidate in by_hash.get((key, fingerprint.get(key)), []) if fingerprint.get(key) else []:
+                if candidate['id'] != fingerprint.get('id') and is_duplicate(fingerprint, candidate, max_distance):
+                    match = candidate['id']
+                    break
+            if match:
+                break
+        results.append(match)
+        if match is None and fingerprint.get('id'):
+            add_candidate(fingerprint)
+    return results
+
+
+def check_new_lead(lead):
+    """
+    Check an unsaved lead for duplicates and apply LEAD_DEDUPE_MODE.
+
+    In 'flag' mode the lead is marked as a duplicate and should still be
+    saved; in 'merge' mode it should be discarded in favour of the original.
+
+    Returns:
+        tuple: (action, original_id) with action 'flagged' or 'merged', or (None, None)
+    """
+    mode = current_app.config.get('LEAD_DEDUPE_MODE', 'flag')
+    if mode == 'off':
+        return None, None
+
+    fingerprint = lead_fingerprint({field: getattr(lead, field) for field in FINGERPRINT_FIELDS})
+    original_id = find_duplicates([fingerprint])[0]
+    if original_id is None:
+        return None, None
+
+    if mode == 'merge':
+        return 'merged', original_id
+    lead.status = 'duplicate'
+    lead.duplicate_of_id = original_id
+    return 'flagged', original_id
@@ -0,0 +1,214 @@
+"""
+Bulk lead ingestion.
+
+Rows are validated individually and inserted in chunks with one multi-row
+INSERT and one transaction per chunk, so a bad row is reported without
+failing its neighbours and a database error only fails its own chunk.
+Missing coordinates are geocoded (through the geocoding cache) before the
+chunk's transaction starts, or, for the bulk API, left to the notification
+workers, which geocode each lead as they fan it out. Duplicates of recent
+leads (and of earlier rows in the same chunk) are flagged or dropped per
+LEAD_DEDUPE_MODE. Imported leads are published as lead.created events and
+handed to the notification workers like single submissions.
+"""
+from datetime import datetime
+from flask import current_app
+from itertools import islice
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.models.change_sequence import ChangeSequence
+from app.models.lead import Lead
+from app.services.events import build_lead_event
+from app.services.lead_dedupe import find_duplicates
+from app.services.notifications import notify_new_leads
+from app.utils.dedupe import lead_fingerprint
+from app.utils.geocoding import geocode_address
+from app.utils.pricing import calculate_claim_price_cents, from_cents, pricing_snapshot, to_cents
+from app.utils.regions import region_key
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = [
+    'title', 'description', 'customer_name', 'customer_email',
+    'customer_phone', 'address', 'city', 'state', 'zip_code',
+    'service_type'
+]
+OPTIONAL_TEXT_FIELDS = ['service_details', 'notes']
+URGENCY_LEVELS = ('low', 'normal', 'medium', 'high')
+DEFAULT_LEAD_PRICE = 20.0  # Same default as submit_lead
+
+
+def _parse_float(data, field, errors, default=None):
+    value = data.get(field)
+    if value is None or value == '':
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        errors.append(f'{field} must be a number')
+        return None
+
+
+def validate_lead_row(data):
+    """
+    Validate and normalize one incoming lead.
+
+    Args:
+        data (dict): Raw lead fields (JSON object or CSV row)
+
+    Returns:
+        tuple: (values, errors) where values is None if there are errors
+    """
+    if not isinstance(data, dict):
+        return None, ['Lead must be an object']
+
+    errors = []
+    values = {}
+    for field in REQUIRED_FIELDS:
+        value = data.get(field)
+        if value is None or not str(value).strip():
+            errors.append(f'Must include {field} field')
+        else:
+            values[field] = str(value).strip()
+
+    for field in OPTIONAL_TEXT_FIELDS:
+        values[field] = str(data[field]).strip() if data.get(field) else None
+    values['service_details'] = values['service_details'] or ''
+
+    urgency = str(data.get('urgency') or 'normal').strip().lower()
+    if urgency not in URGENCY_LEVELS:
+        errors.append(f"urgency must be one of {', '.join(URGENCY_LEVELS)}")
+    values['urgency'] = urgency
+
+    price = _parse_float(data, 'price', errors, default=DEFAULT_LEAD_PRICE)
+    if price is not None and price < 0:
+        errors.append('price must not be negative')
+    values['price_cents'] = to_cents(price)
+
+    values['latitude'] = _parse_float(data, 'latitude', errors)
+    values['longitude'] = _parse_float(data, 'longitude', errors)
+    if (values['latitude'] is None) != (values['longitude'] is None):
+        errors.append('latitude and longitude must be given together')
+    elif values['latitude'] is not None and not (-90 <= values['latitude'] <= 90 and -180 <= values['longitude'] <= 180):
+        errors.append('latitude/longitude out of range')
+
+    # Enforce the column sizes here rather than failing the whole chunk in the database
+    for field, value in values.items():
+        length = getattr(Lead.__table__.c[field].type, 'length', None)
+        if length and isinstance(value, str) and len(value) > length:
+            errors.append(f'{field} is longer than {length} characters')
+
+    return (None if errors else values), errors
+
+
+def import_leads(rows, source='import', chunk_size=None, geocode=None, notify=True):
+    """
+    Validate and insert leads in chunks.
+
+    Args:
+        rows (iterable): Lead dicts, e.g. a parsed JSON array or a csv.DictReader
+        source (str): Value stored in Lead.source
+        chunk_size (int): Rows per INSERT/transaction (default LEAD_IMPORT_CHUNK_SIZE)
+        geocode (bool): Geocode rows without coordinates (default LEAD_IMPORT_GEOCODE)
+        notify (bool): Hand the new leads to the notification workers; pass False
+            in short-lived processes and let the periodic task runner notify
+
+    Returns:
+        dict: {'created': int, 'failed': int, 'leads': [{'index', 'id', 'lead_price'}],
+               'duplicates': [{'index', 'duplicate_of'}], 'errors': [{'index', 'errors'}]}
+              with zero-based row indexes
+    """
+    chunk_size = chunk_size or current_app.config.get('LEAD_IMPORT_CHUNK_SIZE', 500)
+    if geocode is None:
+        geocode = current_app.config.get('LEAD_IMPORT_GEOCODE', True)
+
+    result = {'created': 0, 'failed': 0, 'leads': [], 'duplicates': [], 'errors': []}
+    numbered = enumerate(rows)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            break
+        _import_chunk(chunk, source, geocode, notify, result)
+
+    result['failed'] = len(result['errors'])
+    return result
+
+
+def _import_chunk(chunk, source, geocode, notify, result):
+    records = []
+    for index, data in chunk:
+        values, errors = validate_lead_row(data)
+        if errors:
+            result['errors'].append({'index': index, 'errors': errors})
+        else:
+            records.append((index, values))
+    if not records:
+        return
+
+    # Network and pricing work happens before the transaction takes the change counter lock
+    now = datetime.utcnow()
+    snapshot = pricing_snapshot()
+    for _, values in records:
+        if geocode and values['latitude'] is None:
+            values['latitude'], values['longitude'] = geocode_address(
+                values['address'], values['city'], values['state'], values['zip_code'])
+        values.update(
+            claim_price_cents=calculate_claim_price_cents(values['price_cents'], snapshot),
+            id=uuid.uuid4(),
+            status='available',
+            source=source,
+            contact_release_count=0,
+            created_at=now,
+            updated_at=now
+        )
+
+    # Core inserts bypass the fingerprint and region hooks as well, so compute them here
+    dedupe_mode = current_app.config.get('LEAD_DEDUPE_MODE', 'flag')
+    for _, values in records:
+        values.update(lead_fingerprint(values), duplicate_of_id=None,
+                      region=region_key(values['latitude'], values['longitude'], values['state']))
+    if dedupe_mode != 'off':
+        originals = find_duplicates([values for _, values in records])
+        kept = []
+        for (index, values), original_id in zip(records, originals):
+            if original_id is None:
+                kept.append((index, values))
+                continue
+            result['duplicates'].append({'index': index, 'duplicate_of': str(original_id)})
+            if dedupe_mode == 'flag':
+                values.update(status='duplicate', duplicate_of_id=original_id)
+                kept.append((index, values))
+        records = kept
+        if not records:
+            return
+
+    try:
+        # Core inserts bypass the ORM flush hook, so allocate change sequence values here
+        first = ChangeSequence.allocate(db.session, 'leads', len(records))
+        for offset, (_, values) in enumerate(records):
+            values['change_seq'] = first + offset
+        db.session.execute(insert(Lead.__table__), [values for _, values in records])
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logger.error(f"Lead import chunk of {len(records)} rows failed: {str(e)}")
+        for index, _ in records:
+            result['errors'].append({'index': index, 'errors': ['Database error, chunk rolled back']})
+        return
+
+    result['created'] += len(records)
+    result['leads'].extend(
+        {'index': index, 'id': str(values['id']), 'lead_price': from_cents(values['claim_price_cents'])}
+        for index, values in records
+    )
+
+    # Flagged duplicates are stored but never offered to plumbers
+    available = [values for _, values in records if values['status'] == 'available']
+    current_app.extensions['lead_events'].publish(
+        [build_lead_event('lead.created', Lead(**values)) for values in available]
+    )
+    if notify and available:
+        notify_new_leads([values['id'] for values in available])
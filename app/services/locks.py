@@ -0,0 +1,211 @@
+"""
+Named locks shared by every app host and background worker.
+
+A lock is a lease: a row in ``lock_leases`` that one process holds until it
+releases it or its time-to-live runs out, so a crashed or stuck holder blocks
+the others for at most LOCK_TTL_SECONDS. Every acquisition also gets a
+fencing token from a shared counter, larger than any token handed out
+before. A holder that may have outlived its lease (a slow Stripe call, a
+stalled sweep) calls ``lease.fence(db.session)`` in the transaction that
+writes the protected rows: the transaction then only goes through while the
+lease is still the current one, and it keeps the lease row locked until it
+commits, so nobody can take over in between.
+
+Leases are taken, renewed and released with conditional statements in short
+transactions of their own, so other hosts see them at once and they work the
+same on PostgreSQL and SQLite. Those transactions run on a second pooled
+connection while the caller's db.session usually holds one already, so a
+request holding a lock needs two connections at once (see DB_POOL_SIZE). Expiry is judged by the hosts' clocks; keep
+TTLs well above the clock skew between hosts.
+
+Locks in use:
+
+- ``lead:<id>``: every change to a lead's reservation state, from the API,
+  the browser routes, Stripe webhooks, refunds and the expired reservation
+  sweep. Lead.reserve, release, claim, reopen and update_status take the
+  lease and fence with it, so a writer cannot skip the lock
+- ``task:<name>``: a background task, so every node can run the task loop
+  but only one of them does each round's work
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+import logging
+import os
+import socket
+import time
+
+from app import db
+from app.models.change_sequence import ChangeSequence
+from app.models.lock_lease import LockLease
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SEQUENCE = 'lock_tokens'
+
+
+class LockUnavailable(Exception):
+    """The lock is held by someone else."""
+
+
+class LockLost(Exception):
+    """The lease expired or was taken over before its holder was done."""
+
+
+def lead_lock_name(lead_id):
+    """Name of the lock guarding a lead's reservation state."""
+    return f"lead:{lead_id}"
+
+
+class Lease:
+    """A held lock. Used as a context manager, it is released on exit."""
+
+    def __init__(self, service, name, token, expires_at):
+        self.service = service
+        self.name = name
+        self.token = token
+        self.expires_at = expires_at
+
+    def fence(self, session):
+        """
+        Make session's transaction conditional on this lease still being current.
+
+        Raises:
+            LockLost: If the lease expired or someone else holds the lock now
+        """
+        table = LockLease.__table__
+        result = session.execute(
+            update(table)
+            .where(table.c.name == self.name, table.c.token == self.token,
+                   table.c.expires_at > datetime.utcnow())
+            .values(expires_at=table.c.expires_at)
+        )
+        if result.rowcount != 1:
+            self.service.record(self.name, 'lost')
+            raise LockLost(f"Lost lock {self.name} (token {self.token})")
+
+    def renew(self, ttl=None):
+        """
+        Extend the lease by ttl seconds from now.
+
+        Raises:
+            LockLost: If the lease already expired or was taken over
+        """
+        self.service.renew(self, ttl)
+
+    def release(self):
+        """Release the lock (a no-op if the lease already expired)."""
+        self.service.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def __repr__(self):
+        return f'<Lease {self.name}: {self.token}>'
+
+
+class LockService:
+    """Acquires, renews and releases leases on named locks (see module docstring)."""
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def init_app(self, app):
+        """Register the service on the app."""
+        app.extensions['locks'] = self
+
+    def acquire(self, name, ttl=None, wait=0):
+        """
+        Take a lock.
+
+        Args:
+            name (str): Lock name, e.g. lead_lock_name(lead.id)
+            ttl (float): Seconds the lease lasts unless renewed (default LOCK_TTL_SECONDS)
+            wait (float): Seconds to keep retrying while someone else holds the lock
+
+        Returns:
+            Lease: The lease, or None if the lock was still held elsewhere after wait seconds
+        """
+        ttl = ttl or current_app.config.get('LOCK_TTL_SECONDS', 60)
+        deadline = time.monotonic() + wait
+        delay = 0.01
+        while True:
+            lease = self._try_acquire(name, ttl)
+            remaining = deadline - time.monotonic()
+            if lease is not None or remaining <= 0:
+                self.record(name, 'acquired' if lease is not None else 'busy')
+                return lease
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.5)
+
+    @contextmanager
+    def hold(self, name, ttl=None, wait=0):
+        """
+        Hold a lock for the duration of a with block.
+
+        Raises:
+            LockUnavailable: If the lock was still held elsewhere after wait seconds
+        """
+        lease = self.acquire(name, ttl, wait)
+        if lease is None:
+            raise LockUnavailable(f"Lock {name} is held by someone else")
+        with lease:
+            yield lease
+
+    def hold_lead(self, lead_id, wait=0):
+        """Hold a lead's lock, needed by every change to its reservation state (see Lead.fence)."""
+        return self.hold(lead_lock_name(lead_id), wait=wait)
+
+    def _try_acquire(self, name, ttl):
+        table = LockLease.__table__
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl)
+        try:
+            with db.engine.begin() as conn:
+                # Give up early while the lock is held, without contending for the token counter
+                if conn.execute(select(table.c.token).where(table.c.name == name, table.c.expires_at > now)).first():
+                    return None
+                conn.execute(delete(table).where(table.c.name == name, table.c.expires_at <= now))
+                token = ChangeSequence.allocate(conn, TOKEN_SEQUENCE)
+                conn.execute(insert(table).values(name=name, owner=self.owner, token=token,
+                                                  acquired_at=now, expires_at=expires_at))
+        except IntegrityError:
+            # Another process took it between the check and the insert
+            return None
+        return Lease(self, name, token, expires_at)
+
+    def renew(self, lease, ttl=None):
+        """Extend a lease; raises LockLost if it already expired or was taken over."""
+        table = LockLease.__table__
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl or current_app.config.get('LOCK_TTL_SECONDS', 60))
+        with db.engine.begin() as conn:
+            renewed = conn.execute(
+                update(table)
+                .where(table.c.name == lease.name, table.c.token == lease.token, table.c.expires_at > now)
+                .values(expires_at=expires_at)
+            ).rowcount
+        if not renewed:
+            self.record(lease.name, 'lost')
+            raise LockLost(f"Lost lock {lease.name} (token {lease.token})")
+        lease.expires_at = expires_at
+
+    def release(self, lease):
+        """Release a lease; later holders' leases are left alone."""
+        table = LockLease.__table__
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(delete(table).where(table.c.name == lease.name, table.c.token == lease.token))
+        except Exception as e:
+            # The lease runs out on its own
+            logger.warning(f"Failed to release lock {lease.name}: {str(e)}")
+
+    def record(self, name, result):
+        """Count an acquisition attempt or lost lease, by kind of lock."""
+        current_app.extensions['metrics'].inc('lock_acquisitions_total',
+                                              (('lock', name.split(':', 1)[0]), ('result', result)))
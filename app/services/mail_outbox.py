@@ -0,0 +1,176 @@
+"""
+Persistent email outbox.
+
+send_email() stores messages in the email_outbox table and nudges a small
+worker pool. Workers claim due messages in batches, deliver each batch over a
+single SMTP connection and reschedule failures with exponential backoff. The
+periodic task runner drains the outbox as well, so nothing is lost if the
+process exits before a worker gets to it.
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, or_, select, update
+from threading import Event, Lock
+from app import db, mail
+from app.models.outbox_email import OutboxEmail
+from app.services.background import BackgroundExecutor
+from app.utils.metrics import external_call
+import logging
+import smtplib
+import uuid
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = Lock()
+_work_available = Event()
+
+# Errors that mean the SMTP connection itself is unusable
+_CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # No waiting queue: a running drain keeps going until the outbox is empty
+            _executor = BackgroundExecutor(
+                'mail-outbox',
+                max_workers=current_app.config.get('MAIL_OUTBOX_WORKERS', 2),
+                max_queue=0
+            )
+        return _executor
+
+
+def enqueue_email(subject, sender, recipients, text_body, html_body, commit=True):
+    """
+    Store an email in the outbox.
+
+    Args:
+        subject (str): Email subject
+        sender (str): Sender address (defaults to MAIL_DEFAULT_SENDER)
+        recipients (list): Recipient addresses
+        text_body (str): Plain text body
+        html_body (str): HTML body
+        commit (bool): Commit the current session; pass False to enqueue as
+            part of a larger transaction
+
+    Returns:
+        OutboxEmail: The stored email
+    """
+    email = OutboxEmail(
+        subject=subject,
+        sender=sender or current_app.config.get('MAIL_DEFAULT_SENDER'),
+        text_body=text_body,
+        html_body=html_body,
+        next_attempt_at=datetime.utcnow()
+    )
+    email.set_recipients(recipients)
+    db.session.add(email)
+    if commit:
+        db.session.commit()
+    return email
+
+
+def kick_outbox():
+    """Ask the worker pool to drain the outbox soon."""
+    _work_available.set()
+    _get_executor().submit(drain_outbox)
+
+
+def _retry_delay(attempts):
+    """Exponential backoff: base, 2x base, 4x base, ... capped at six hours."""
+    base = current_app.config.get('MAIL_OUTBOX_RETRY_BASE_SECONDS', 60)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), 6 * 3600))
+
+
+def _claim_batch(batch_size):
+    """Atomically claim up to batch_size due emails for this worker."""
+    now = datetime.utcnow()
+    stale_claim = now - timedelta(seconds=current_app.config.get('MAIL_OUTBOX_CLAIM_TIMEOUT', 600))
+    due = or_(
+        and_(OutboxEmail.status == 'pending', OutboxEmail.next_attempt_at <= now),
+        # Claimed by a worker that died before finishing
+        and_(OutboxEmail.status == 'sending', OutboxEmail.claimed_at < stale_claim)
+    )
+
+    candidate_ids = db.session.execute(
+        select(OutboxEmail.id)
+        .where(due)
+        .order_by(OutboxEmail.next_attempt_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not candidate_ids:
+        db.session.commit()
+        return []
+
+    # The conditional UPDATE makes the claim safe even without row locks (SQLite)
+    token = uuid.uuid4().hex
+    db.session.execute(
+        update(OutboxEmail)
+        .where(OutboxEmail.id.in_(candidate_ids), due)
+        .values(status='sending', claim_token=token, claimed_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return OutboxEmail.query.filter_by(claim_token=token).all()
+
+
+def deliver_batch(batch_size=None):
+    """
+    Claim and deliver one batch of due emails over a single SMTP connection.
+
+    Returns:
+        int: Number of emails claimed (0 when the outbox has nothing due)
+    """
+    batch_size = batch_size or current_app.config.get('MAIL_OUTBOX_BATCH_SIZE', 50)
+    max_attempts = current_app.config.get('MAIL_OUTBOX_MAX_ATTEMPTS', 5)
+
+    emails = _claim_batch(batch_size)
+    if not emails:
+        return 0
+
+    for email in emails:
+        email.attempts += 1
+
+    remaining = list(emails)
+    try:
+        with mail.connect() as conn:
+            while remaining:
+                email = remaining[0]
+                try:
+                    with external_call('smtp'):
+                        conn.send(email.to_message())
+                    email.mark_sent()
+                except _CONNECTION_ERRORS:
+                    raise
+                except Exception as e:
+                    logger.error(f"Failed to send email {email.id}: {str(e)}")
+                    if email.attempts >= max_attempts:
+                        email.mark_failed(str(e))
+                    else:
+                        email.mark_retry(str(e), datetime.utcnow() + _retry_delay(email.attempts))
+                remaining.pop(0)
+    except Exception as e:
+        # Connecting failed or the connection dropped: reschedule whatever is left
+        logger.error(f"SMTP connection error, rescheduling {len(remaining)} emails: {str(e)}")
+        for email in remaining:
+            if email.attempts >= max_attempts:
+                email.mark_failed(str(e))
+            else:
+                email.mark_retry(str(e), datetime.utcnow() + _retry_delay(email.attempts))
+
+    db.session.commit()
+    return len(emails)
+
+
+def drain_outbox(batch_size=None):
+    """Deliver batches until nothing is due. Returns the number of emails processed."""
+    processed = 0
+    while True:
+        _work_available.clear()
+        claimed = deliver_batch(batch_size)
+        processed += claimed
+        if not claimed and not _work_available.is_set():
+            return processed
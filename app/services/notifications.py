@@ -0,0 +1,247 @@
+"""
+New-lead notification pipeline.
+
+submit_lead hands the new lead to a small worker pool which works out the
+eligible plumbers (service radius and service types, or service-area ZIP when
+the lead has no coordinates), records one in-app notification per plumber and
+then sends email digests. Notifications are de-duplicated per plumber and
+lead, in-app notifications are capped per plumber per hour, and each plumber
+gets at most one digest email per interval (a shorter one for urgent leads).
+The periodic task runner repeats both steps to pick up anything the workers
+missed.
+"""
+from datetime import datetime, timedelta
+from flask import current_app, render_template
+from sqlalchemy import exists, func, insert, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, noload
+from threading import Lock
+from app import db
+from app.models.lead import Lead
+from app.models.notification import Notification
+from app.models.user import User
+from app.models.user_service import UserServiceArea, UserServiceType
+from app.routes.plumber import calculate_distance
+from app.utils.regions import bounding_box
+from app.services.background import BackgroundExecutor
+from app.services.mail_outbox import enqueue_email, kick_outbox
+from app.utils.geocoding import geocode_address
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = Lock()
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = BackgroundExecutor(
+                'lead-notify',
+                max_workers=current_app.config.get('NOTIFY_WORKERS', 2),
+                max_queue=current_app.config.get('NOTIFY_QUEUE_SIZE', 100)
+            )
+        return _executor
+
+
+def notify_new_lead(lead):
+    """Schedule notification of a newly created lead to matching plumbers."""
+    _get_executor().submit(fan_out_lead, lead.id)
+
+
+def notify_new_leads(lead_ids):
+    """Schedule notification of a batch of new leads as a single job."""
+    _get_executor().submit(fan_out_leads, list(lead_ids))
+
+
+def fan_out_leads(lead_ids):
+    """Fan out each lead in turn. Returns the number of notifications created."""
+    return sum(fan_out_lead(lead_id) for lead_id in lead_ids)
+
+
+def find_eligible_plumbers(lead):
+    """
+    Find the active plumbers a lead should be offered to.
+
+    Plumbers without service types accept every type. With coordinates, a
+    bounding box on the indexed user coordinates narrows the candidates before
+    the exact distance check against each plumber's service radius; without
+    coordinates the lead's ZIP code is matched against service areas.
+
+    Args:
+        lead (Lead): The lead to match
+
+    Returns:
+        list: Matching User instances
+    """
+    query = User.query.options(
+        noload(User.service_area_links), noload(User.service_type_links)
+    ).filter(User.is_active == True, User.is_admin == False)
+
+    has_types = exists().where(UserServiceType.user_id == User.id)
+    offers_type = exists().where(
+        UserServiceType.user_id == User.id,
+        UserServiceType.service_type == lead.service_type
+    )
+    query = query.filter(or_(~has_types, offers_type))
+
+    if lead.latitude is None or lead.longitude is None:
+        return query.filter(User.id.in_(
+            db.session.query(UserServiceArea.user_id).filter(UserServiceArea.area == lead.zip_code)
+        )).all()
+
+    max_radius = current_app.config.get('NOTIFY_MAX_RADIUS_MILES', 100)
+    min_lat, max_lat, min_lng, max_lng = bounding_box(lead.latitude, lead.longitude, max_radius)
+    candidates = query.filter(
+        User.latitude.between(min_lat, max_lat),
+        User.longitude.between(min_lng, max_lng)
+    ).all()
+
+    return [
+        user for user in candidates
+        if calculate_distance(user.latitude, user.longitude, lead.latitude, lead.longitude) <= user.service_radius
+    ]
+
+
+def fan_out_lead(lead_id):
+    """
+    Create in-app notifications for a lead and send digests to the recipients.
+
+    Returns:
+        int: Number of notifications created
+    """
+    lead = Lead.query.get(lead_id)
+    if not lead or lead.notified_at:
+        return 0
+
+    now = datetime.utcnow()
+    if lead.status != 'available':
+        lead.notified_at = now
+        db.session.commit()
+        return 0
+
+    if lead.latitude is None or lead.longitude is None:
+        lead.latitude, lead.longitude = geocode_address(lead.address, lead.city, lead.state, lead.zip_code)
+
+    plumbers = find_eligible_plumbers(lead)
+    plumber_ids = [plumber.id for plumber in plumbers]
+
+    already_notified = set()
+    recent_counts = {}
+    if plumber_ids:
+        already_notified = {
+            user_id for (user_id,) in db.session.query(Notification.user_id).filter(
+                Notification.lead_id == lead.id,
+                Notification.kind == 'new_lead',
+                Notification.user_id.in_(plumber_ids)
+            )
+        }
+        recent_counts = dict(db.session.query(Notification.user_id, func.count(Notification.id)).filter(
+            Notification.user_id.in_(plumber_ids),
+            Notification.created_at >= now - timedelta(hours=1)
+        ).group_by(Notification.user_id).all())
+
+    max_per_hour = current_app.config.get('NOTIFY_MAX_PER_HOUR', 50)
+    rows = [
+        {'id': uuid.uuid4(), 'user_id': user_id, 'lead_id': lead.id, 'kind': 'new_lead', 'created_at': now}
+        for user_id in plumber_ids
+        if user_id not in already_notified and recent_counts.get(user_id, 0) < max_per_hour
+    ]
+
+    try:
+        if rows:
+            db.session.execute(insert(Notification.__table__), rows)
+        lead.notified_at = now
+        db.session.commit()
+    except IntegrityError:
+        # Another worker fanned out the same lead concurrently
+        db.session.rollback()
+        return 0
+
+    logger.info(f"Lead {lead.id}: notified {len(rows)} of {len(plumber_ids)} matching plumbers")
+    if rows:
+        send_notification_digests([row['user_id'] for row in rows])
+    return len(rows)
+
+
+def fan_out_pending_leads(max_age_hours=24):
+    """Fan out recent leads that no worker has processed yet."""
+    cutoff = datetime.utcnow() - timedelta(hours=max_age_hours)
+    lead_ids = [lead_id for (lead_id,) in db.session.query(Lead.id).filter(
+        Lead.notified_at.is_(None),
+        Lead.status == 'available',
+        Lead.created_at >= cutoff
+    ).order_by(Lead.created_at)]
+
+    return fan_out_leads(lead_ids)
+
+
+def send_notification_digests(user_ids=None):
+    """
+    Email each plumber a digest of their un-emailed lead notifications.
+
+    A plumber receives at most one digest per NOTIFY_DIGEST_INTERVAL_MINUTES,
+    or per NOTIFY_URGENT_DIGEST_INTERVAL_MINUTES when a pending lead is urgent.
+
+    Args:
+        user_ids (list): Only consider these plumbers (optional)
+
+    Returns:
+        int: Number of digest emails queued
+    """
+    now = datetime.utcnow()
+    digest_interval = timedelta(minutes=current_app.config.get('NOTIFY_DIGEST_INTERVAL_MINUTES', 30))
+    urgent_interval = timedelta(minutes=current_app.config.get('NOTIFY_URGENT_DIGEST_INTERVAL_MINUTES', 5))
+
+    pending_query = Notification.query.options(joinedload(Notification.lead)).filter(
+        Notification.kind == 'new_lead',
+        Notification.emailed_at.is_(None)
+    )
+    if user_ids is not None:
+        pending_query = pending_query.filter(Notification.user_id.in_(user_ids))
+
+    pending_by_user = {}
+    for notification in pending_query.order_by(Notification.created_at):
+        pending_by_user.setdefault(notification.user_id, []).append(notification)
+    if not pending_by_user:
+        return 0
+
+    last_sent = dict(db.session.query(Notification.user_id, func.max(Notification.emailed_at)).filter(
+        Notification.user_id.in_(list(pending_by_user)),
+        Notification.emailed_at.isnot(None)
+    ).group_by(Notification.user_id).all())
+    users = {user.id: user for user in User.query.options(
+        noload(User.service_area_links), noload(User.service_type_links)
+    ).filter(User.id.in_(list(pending_by_user)))}
+
+    base_url = current_app.config.get('APP_BASE_URL', '').rstrip('/')
+    queued = 0
+    for user_id, notifications in pending_by_user.items():
+        user = users.get(user_id)
+        leads = [n.lead for n in notifications if n.lead and n.lead.status == 'available']
+        interval = urgent_interval if any(lead.urgency == 'high' for lead in leads) else digest_interval
+        if user_id in last_sent and now - last_sent[user_id] < interval:
+            continue
+
+        if user and leads:
+            items = [{'lead': lead, 'url': f"{base_url}/leads/{lead.id}"} for lead in leads]
+            enqueue_email(
+                f'[PlumberLeads] {len(leads)} new lead{"s" if len(leads) != 1 else ""} near you',
+                sender=None,
+                recipients=[user.email],
+                text_body=render_template('email/new_leads_digest.txt', user=user, items=items),
+                html_body=render_template('email/new_leads_digest.html', user=user, items=items),
+                commit=False
+            )
+            queued += 1
+
+        # Leads that are no longer available are simply left out of the digest
+        for notification in notifications:
+            notification.emailed_at = now
+
+    db.session.commit()
+    if queued:
+        kick_outbox()
+    return queued
@@ -0,0 +1,144 @@
+"""
+Keyword search over leads.
+
+Searches title, description and service_details through a full-text index:
+a GIN index on a tsvector expression on PostgreSQL, and an external-content
+FTS5 table kept in sync by triggers on SQLite. Both are created with the
+leads table (and by the 'lead_search' migration step for existing
+databases). Keywords are reduced to word characters and prefix-matched, so
+user input can never produce query syntax errors.
+
+Facet counts by service type, urgency and city are computed in one
+statement over the matching rows (a CTE with one GROUP BY per facet joined
+by UNION ALL), which also yields the total.
+"""
+from sqlalchemy import DDL, column, event, func, literal, literal_column, select, table, union_all
+from app import db
+from app.models.lead import Lead
+import re
+
+TEXT_SEARCH_CONFIG = 'english'
+MAX_TERMS = 8
+FACETS = ('service_type', 'urgency', 'city')
+FACET_LIMIT = 10  # Values returned per facet, most frequent first
+
+# Must match the indexed expression exactly for PostgreSQL to use the index
+SEARCH_DOCUMENT_SQL = "coalesce(title, '') || ' ' || coalesce(description, '') || ' ' || coalesce(service_details, '')"
+SEARCH_VECTOR_SQL = f"to_tsvector('{TEXT_SEARCH_CONFIG}', {SEARCH_DOCUMENT_SQL})"
+
+POSTGRES_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_leads_search ON leads USING GIN ({SEARCH_VECTOR_SQL})",
+]
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS leads_fts USING fts5("
+    "title, description, service_details, content='leads', content_rowid='rowid')",
+    "CREATE TRIGGER IF NOT EXISTS leads_fts_insert AFTER INSERT ON leads BEGIN "
+    "INSERT INTO leads_fts (rowid, title, description, service_details) "
+    "VALUES (new.rowid, new.title, new.description, new.service_details); END",
+    "CREATE TRIGGER IF NOT EXISTS leads_fts_delete AFTER DELETE ON leads BEGIN "
+    "INSERT INTO leads_fts (leads_fts, rowid, title, description, service_details) "
+    "VALUES ('delete', old.rowid, old.title, old.description, old.service_details); END",
+    "CREATE TRIGGER IF NOT EXISTS leads_fts_update AFTER UPDATE OF title, description, service_details ON leads BEGIN "
+    "INSERT INTO leads_fts (leads_fts, rowid, title, description, service_details) "
+    "VALUES ('delete', old.rowid, old.title, old.description, old.service_details); "
+    "INSERT INTO leads_fts (rowid, title, description, service_details) "
+    "VALUES (new.rowid, new.title, new.description, new.service_details); END",
+]
+
+for statement in POSTGRES_DDL:
+    event.listen(Lead.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+for statement in SQLITE_DDL:
+    event.listen(Lead.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+_leads_fts = table('leads_fts', column('rowid'), column('rank'), column('leads_fts'))
+
+
+def install_search_index(connection):
+    """
+    Create the full-text index for an existing leads table.
+
+    Returns:
+        bool: True if the dialect supports lead search
+    """
+    dialect = connection.dialect.name
+    statements = POSTGRES_DDL if dialect == 'postgresql' else SQLITE_DDL if dialect == 'sqlite' else None
+    if statements is None:
+        return False
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+    if dialect == 'sqlite':
+        # Index the rows that existed before the triggers
+        connection.exec_driver_sql("INSERT INTO leads_fts (leads_fts) VALUES ('rebuild')")
+    return True
+
+
+def parse_terms(text):
+    """Lowercase keywords from free text, without query syntax."""
+    return re.findall(r'\w+', (text or '').lower())[:MAX_TERMS]
+
+
+def apply_search(query, terms):
+    """
+    Restrict a lead query to leads matching every term.
+
+    Args:
+        query (Query): Lead query, already filtered by the caller
+        terms (list): Keywords as returned by parse_terms()
+
+    Returns:
+        tuple: (query, rank) where rank orders the best matches first when sorted ascending
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        vector = literal_column(SEARCH_VECTOR_SQL)
+        tsquery = func.to_tsquery(literal_column(f"'{TEXT_SEARCH_CONFIG}'"), ' & '.join(f'{term}:*' for term in terms))
+        return query.filter(vector.op('@@')(tsquery)), -func.ts_rank(vector, tsquery)
+
+    # FTS5: quoted prefix terms, implicitly ANDed; rank is bm25 (lower is better)
+    match = ' '.join(f'"{term}"*' for term in terms)
+    query = query.join(_leads_fts, _leads_fts.c.rowid == literal_column('leads.rowid'))
+    return query.filter(_leads_fts.c.leads_fts.op('MATCH')(match)), _leads_fts.c.rank
+
+
+def search_leads(query, text, page=1, per_page=10):
+    """
+    Run a keyword search with facet counts.
+
+    Args:
+        query (Query): Lead query with the caller's access and field filters applied
+        text (str): Free-text keywords
+        page (int): Page number, starting at 1
+        per_page (int): Leads per page
+
+    Returns:
+        dict: {'leads': [Lead], 'total': int, 'facets': {facet: [{'value', 'count'}]}}
+    """
+    terms = parse_terms(text)
+    if not terms:
+        return {'leads': [], 'total': 0, 'facets': {facet: [] for facet in FACETS}}
+
+    query, rank = apply_search(query, terms)
+
+    # One pass over the matches for every facet
+    matches = query.order_by(None).with_entities(*[getattr(Lead, facet) for facet in FACETS]).cte('matches')
+    facet_rows = db.session.execute(union_all(*[
+        select(literal(facet).label('facet'), matches.c[facet].label('value'), func.count().label('count'))
+        .group_by(matches.c[facet])
+        for facet in FACETS
+    ])).all()
+
+    facets = {facet: [] for facet in FACETS}
+    for row in facet_rows:
+        facets[row.facet].append({'value': row.value, 'count': row.count})
+    for values in facets.values():
+        values.sort(key=lambda item: (-item['count'], str(item['value'])))
+    # service_type is never NULL, so its counts add up to the number of matches
+    total = sum(item['count'] for item in facets['service_type'])
+    for facet in FACETS:
+        del facets[facet][FACET_LIMIT:]
+
+    leads = []
+    if total > (page - 1) * per_page:
+        leads = query.order_by(rank, Lead.created_at.desc()).offset((page - 1) * per_page).limit(per_page).all()
+
+    return {'leads': leads, 'total': total, 'facets': facets}
@@ -0,0 +1,302 @@
+"""
+Server-side session storage.
+
+Sessions are kept out of the cookie (which only carries a signed session id)
+and stored in a pluggable backend:
+
+- ``memory``: in-process LRU, for single-process development
+- ``sql``: the ``sessions`` table, shared by every app host
+- ``tiered``: a short-lived in-process LRU in front of the ``sessions`` table
+
+Payloads are compact tagged JSON (zlib-compressed past a size threshold) and
+are only written back when the session changed or its expiry needs extending.
+"""
+from datetime import datetime, timedelta, timezone
+import logging
+import secrets
+import zlib
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import delete, insert, select, update
+from werkzeug.datastructures import CallbackDict
+
+from app import db
+from app.models.server_session import ServerSession
+from app.utils.lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_PLAIN = b'j'
+_COMPRESSED = b'z'
+
+
+def encode_session(data, compress_threshold=512):
+    """Serialize session data to bytes, compressing large payloads."""
+    raw = session_json_serializer.dumps(dict(data)).encode('utf-8')
+    if compress_threshold is not None and len(raw) >= compress_threshold:
+        return _COMPRESSED + zlib.compress(raw)
+    return _PLAIN + raw
+
+
+def decode_session(payload):
+    """Deserialize bytes produced by encode_session."""
+    payload = bytes(payload)
+    marker, body = payload[:1], payload[1:]
+    if marker == _COMPRESSED:
+        body = zlib.decompress(body)
+    return session_json_serializer.loads(body.decode('utf-8'))
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its server-side id and expiry."""
+
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.modified = False
+
+
+class SessionBackend:
+    """Storage interface for serialized sessions."""
+
+    def load(self, sid):
+        """Return (payload, expires_at) for a live session, or None."""
+        raise NotImplementedError
+
+    def save(self, sid, payload, expires_at):
+        """Create or replace a session."""
+        raise NotImplementedError
+
+    def delete(self, sid):
+        """Remove a session."""
+        raise NotImplementedError
+
+    def cleanup_expired(self, batch_size=1000):
+        """Delete expired sessions and return how many were removed."""
+        return 0
+
+
+class MemorySessionBackend(SessionBackend):
+    """Sessions held in an in-process LRU. Not shared between processes."""
+
+    def __init__(self, maxsize=10000):
+        self.cache = LRUCache(maxsize=maxsize)
+
+    def load(self, sid):
+        entry = self.cache.get(sid)
+        if entry and entry[1] > datetime.utcnow():
+            return entry
+        return None
+
+    def save(self, sid, payload, expires_at):
+        ttl = max((expires_at - datetime.utcnow()).total_seconds(), 0)
+        self.cache.set(sid, (payload, expires_at), ttl=ttl)
+
+    def delete(self, sid):
+        self.cache.delete(sid)
+
+
+class SQLSessionBackend(SessionBackend):
+    """Sessions stored in the ``sessions`` table.
+
+    Uses its own short connection so saving the session never commits (or is
+    rolled back with) the request's ORM transaction.
+    """
+
+    table = ServerSession.__table__
+
+    def load(self, sid):
+        with db.engine.connect() as conn:
+            row = conn.execute(
+                select(self.table.c.data, self.table.c.expires_at)
+                .where(self.table.c.sid == sid, self.table.c.expires_at > datetime.utcnow())
+            ).first()
+        return (row.data, row.expires_at) if row else None
+
+    def save(self, sid, payload, expires_at):
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            result = conn.execute(
+                update(self.table)
+                .where(self.table.c.sid == sid)
+                .values(data=payload, expires_at=expires_at, updated_at=now)
+            )
+            if result.rowcount == 0:
+                conn.execute(insert(self.table).values(
+                    sid=sid, data=payload, expires_at=expires_at, updated_at=now
+                ))
+
+    def delete(self, sid):
+        with db.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.sid == sid))
+
+    def cleanup_expired(self, batch_size=1000):
+        """Delete expired sessions in batches to keep each transaction short."""
+        removed = 0
+        while True:
+            with db.engine.begin() as conn:
+                sids = conn.execute(
+                    select(self.table.c.sid)
+                    .where(self.table.c.expires_at <= datetime.utcnow())
+                    .limit(batch_size)
+                ).scalars().all()
+                if sids:
+                    conn.execute(delete(self.table).where(self.table.c.sid.in_(sids)))
+            removed += len(sids)
+            if len(sids) < batch_size:
+                return removed
+
+
+class TieredSessionBackend(SessionBackend):
+    """In-process LRU in front of another backend.
+
+    Cached entries live for only a few seconds so a logout or update on
+    another host is picked up quickly, while bursts of requests from the same
+    browser (page, XHR, polling) are served from memory.
+    """
+
+    def __init__(self, store, maxsize=10000, ttl=5):
+        self.store = store
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def load(self, sid):
+        entry = self.cache.get(sid)
+        if entry is None:
+            entry = self.store.load(sid)
+            if entry is not None:
+                self.cache.set(sid, entry)
+        if entry and entry[1] > datetime.utcnow():
+            return entry
+        return None
+
+    def save(self, sid, payload, expires_at):
+        self.store.save(sid, payload, expires_at)
+        self.cache.set(sid, (payload, expires_at))
+
+    def delete(self, sid):
+        self.cache.delete(sid)
+        self.store.delete(sid)
+
+    def cleanup_expired(self, batch_size=1000):
+        return self.store.cleanup_expired(batch_size)
+
+
+def build_session_backend(config):
+    """Create the session backend selected by SESSION_BACKEND."""
+    backend = config.get('SESSION_BACKEND', 'tiered')
+    cache_size = config.get('SESSION_CACHE_SIZE', 10000)
+    if backend == 'memory':
+        return MemorySessionBackend(maxsize=cache_size)
+    if backend == 'sql':
+        return SQLSessionBackend()
+    if backend == 'tiered':
+        return TieredSessionBackend(SQLSessionBackend(), maxsize=cache_size,
+                                    ttl=config.get('SESSION_CACHE_TTL', 5))
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface storing session data in a SessionBackend."""
+
+    salt = 'plumberleads-session'
+
+    def __init__(self, backend, compress_threshold=512, refresh_interval=300):
+        self.backend = backend
+        self.compress_threshold = compress_threshold
+        self.refresh_interval = refresh_interval
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt, key_derivation='hmac')
+
+    def get_expiration_time(self, app, session):
+        """Cookie expiry: sessions are permanent unless SESSION_PERMANENT is turned off."""
+        if session.permanent or app.config.get('SESSION_PERMANENT', True):
+            return datetime.now(timezone.utc) + app.permanent_session_lifetime
+        return None
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie or not app.secret_key:
+            return ServerSideSession()
+
+        try:
+            sid = self._signer(app).unsign(cookie).decode('utf-8')
+        except BadSignature:
+            return ServerSideSession()
+
+        try:
+            entry = self.backend.load(sid)
+            if entry is None:
+                return ServerSideSession()
+            payload, expires_at = entry
+            return ServerSideSession(decode_session(payload), sid=sid, expires_at=expires_at)
+        except Exception as e:
+            logger.error(f"Failed to load session: {str(e)}")
+            return ServerSideSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+
+        # An emptied session (e.g. logout) is removed from storage and from the browser
+        if not session:
+            if session.sid and session.modified:
+                self.backend.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=secure, samesite=samesite)
+            return
+
+        response.vary.add('Cookie')
+        expires_at = datetime.utcnow() + app.permanent_session_lifetime
+
+        # Unchanged sessions are only rewritten once their expiry is worth extending
+        stale = (session.expires_at is None or
+                 expires_at - session.expires_at > timedelta(seconds=self.refresh_interval))
+        if session.sid and not session.modified and not stale:
+            return
+
+        if not session.sid:
+            session.sid = secrets.token_urlsafe(32)
+        self.backend.save(session.sid, encode_session(session, self.compress_threshold), expires_at)
+        session.expires_at = expires_at
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid.encode('utf-8')).decode('utf-8'),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=secure,
+            samesite=samesite,
+        )
+
+
+class ServerSessions:
+    """Flask extension wiring the server-side session interface into an app."""
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = build_session_backend(app.config)
+        app.session_interface = ServerSideSessionInterface(
+            self.backend,
+            compress_threshold=app.config.get('SESSION_COMPRESS_THRESHOLD', 512),
+            refresh_interval=app.config.get('SESSION_REFRESH_INTERVAL', 300),
+        )
+        app.extensions['server_sessions'] = self
+
+    def cleanup_expired(self, batch_size=1000):
+        """Delete expired sessions from the configured backend."""
+        return self.backend.cleanup_expired(batch_size)
@@ -1,19 +1,167 @@
 from supabase import create_client, Client
-from flask import current_app
+from supabase.lib.client_options import ClientOptions
+from flask import current_app, g
+from queue import Empty, LifoQueue
+from threading import BoundedSemaphore, Lock
+from app.utils.lru import LRUCache
+import hashlib
+import jwt
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# Process-wide client pools, keyed by (url, key)
+_pools = {}
+_pools_lock = Lock()
+
+# Claims of locally verified access tokens, keyed by a hash of the token
+_token_cache = None
+_token_cache_lock = Lock()
+
+
+class SupabasePoolTimeout(Exception):
+    """Raised when no pooled Supabase client becomes free in time."""
+
+
+class SupabaseClientPool:
+    """
+    Bounded pool of reusable Supabase clients.
+
+    Each client keeps its HTTP connections alive between uses. A client is
+    handed to one request at a time and its auth session is cleared when it
+    is returned, so one user's sign-in never leaks into another request.
+    """
+
+    def __init__(self, url, key, size=10, timeout=5):
+        self.url = url
+        self.key = key
+        self.timeout = timeout
+        self._idle = LifoQueue()
+        self._slots = BoundedSemaphore(size)
+
+    def _create_client(self) -> Client:
+        # Session state is per request, so no persistence or background refresh timers
+        options = ClientOptions(auto_refresh_token=False, persist_session=False)
+        client = create_client(self.url, self.key, options=options)
+        # Auth calls are the ones made per request; time them like the other external services
+        current_app.extensions['metrics'].instrument_http_client(client.auth._http_client, 'supabase')
+        return client
+
+    def acquire(self) -> Client:
+        """Check out a client, creating one if none is idle."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise SupabasePoolTimeout(f"No Supabase client available after {self.timeout}s")
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            try:
+                return self._create_client()
+            except Exception:
+                self._slots.release()
+                raise
+
+    def release(self, client: Client):
+        """Return a client to the pool after clearing its auth session."""
+        try:
+            client.auth._remove_session()
+            self._idle.put(client)
+        except Exception as e:
+            logger.error(f"Discarding Supabase client: {str(e)}")
+        finally:
+            self._slots.release()
+
+
+def get_supabase_pool() -> SupabaseClientPool:
+    """Get the process-wide client pool for the configured project."""
+    url = current_app.config['SUPABASE_URL']
+    key = current_app.config['SUPABASE_KEY']
+
+    if not url or not key:
+        raise ValueError("Supabase URL and key must be configured")
+
+    with _pools_lock:
+        pool = _pools.get((url, key))
+        if pool is None:
+            pool = SupabaseClientPool(
+                url, key,
+                size=current_app.config.get('SUPABASE_POOL_SIZE', 10),
+                timeout=current_app.config.get('SUPABASE_POOL_TIMEOUT', 5)
+            )
+            _pools[(url, key)] = pool
+        return pool
+
+
 def get_supabase_client() -> Client:
-    """Get or create a Supabase client instance."""
+    """Get the Supabase client for the current request.
+
+    The client is checked out of the process-wide pool on first use and
+    returned when the app context is torn down.
+    """
     try:
-        url = current_app.config['SUPABASE_URL']
-        key = current_app.config['SUPABASE_KEY']
-        
-        if not url or not key:
-            raise ValueError("Supabase URL and key must be configured")
-            
-        return create_client(url, key)
+        if 'supabase_client' not in g:
+            pool = get_supabase_pool()
+            g.supabase_client = pool.acquire()
+            g.supabase_pool = pool
+        return g.supabase_client
     except Exception as e:
         logger.error(f"Failed to initialize Supabase client: {str(e)}")
-        raise 
\ No newline at end of file
+        raise
+
+
+def release_supabase_client(exception=None):
+    """Return the request's Supabase client to its pool (teardown handler)."""
+    client = g.pop('supabase_client', None)
+    pool = g.pop('supabase_pool', None)
+    if client is not None and pool is not None:
+        pool.release(client)
+
+
+def _get_token_cache():
+    global _token_cache
+    with _token_cache_lock:
+        if _token_cache is None:
+            _token_cache = LRUCache(maxsize=current_app.config.get('SUPABASE_TOKEN_CACHE_SIZE', 10000))
+        return _token_cache
+
+
+def verify_access_token(token):
+    """
+    Verify a Supabase access token locally and return its claims.
+
+    Tokens are validated against the project's JWT secret (signature,
+    audience and expiry) without calling Supabase. Verified claims are cached
+    until the token expires.
+
+    Args:
+        token (str): The JWT access token
+
+    Returns:
+        dict: The token claims, or None if the token is invalid or expired
+    """
+    secret = current_app.config.get('SUPABASE_JWT_SECRET')
+    if not token or not secret:
+        return None
+
+    cache = _get_token_cache()
+    cache_key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    claims = cache.get(cache_key)
+    if claims is not None:
+        return claims
+
+    try:
+        claims = jwt.decode(
+            token,
+            secret,
+            algorithms=['HS256'],
+            audience=current_app.config.get('SUPABASE_JWT_AUDIENCE', 'authenticated'),
+            options={'require': ['exp', 'sub']}
+        )
+    except jwt.PyJWTError as e:
+        logger.info(f"Rejected access token: {str(e)}")
+        return None
+
+    ttl = claims['exp'] - time.time()
+    if ttl > 0:
+        cache.set(cache_key, claims, ttl=ttl)
+    return claims
@@ -0,0 +1,72 @@
+// Live lead feed for the plumber dashboards.
+// Listens to /plumber/lead-feed and keeps the nearby leads list up to date.
+
+(function() {
+    const container = document.querySelector('[data-lead-feed]');
+    if (!container || !window.EventSource) {
+        return;
+    }
+
+    const source = new EventSource(container.dataset.leadFeed);
+
+    function findItem(leadId) {
+        return container.querySelector(`[data-lead-id="${leadId}"]`);
+    }
+
+    function getList() {
+        let list = container.querySelector('.list-group');
+        if (!list) {
+            const empty = container.querySelector('.text-muted');
+            if (empty) {
+                empty.remove();
+            }
+            list = document.createElement('div');
+            list.className = 'list-group';
+            container.appendChild(list);
+        }
+        return list;
+    }
+
+    function addLead(lead) {
+        if (findItem(lead.lead_id)) {
+            return;
+        }
+        const item = document.createElement('div');
+        item.className = 'list-group-item d-flex justify-content-between align-items-center lead-feed-new';
+        item.dataset.leadId = lead.lead_id;
+
+        const link = document.createElement('a');
+        link.href = `/leads/${lead.lead_id}`;
+        link.className = 'text-decoration-none text-dark flex-grow-1';
+        link.textContent = lead.title;
+        if (lead.urgency === 'high') {
+            link.textContent += ' (urgent)';
+        }
+
+        const price = document.createElement('span');
+        price.className = 'me-2';
+        price.textContent = `$${Number(lead.price).toFixed(2)}`;
+
+        item.appendChild(link);
+        item.appendChild(price);
+        getList().prepend(item);
+    }
+
+    function removeLead(lead) {
+        const item = findItem(lead.lead_id);
+        if (item) {
+            item.remove();
+        }
+    }
+
+    source.addEventListener('lead.created', event => addLead(JSON.parse(event.data)));
+    source.addEventListener('lead.released', event => addLead(JSON.parse(event.data)));
+    source.addEventListener('lead.reserved', event => removeLead(JSON.parse(event.data)));
+    source.addEventListener('lead.claimed', event => removeLead(JSON.parse(event.data)));
+
+    // The server dropped us after falling behind: reload to get a fresh list
+    source.addEventListener('resync', () => {
+        source.close();
+        window.location.reload();
+    });
+})();
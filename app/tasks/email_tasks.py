@@ -0,0 +1,14 @@
+from app import create_app
+from app.services.mail_outbox import drain_outbox
+
+def deliver_pending_emails(app=None):
+    """Deliver queued emails, including retries whose backoff has elapsed"""
+    app = app or create_app()
+    
+    with app.app_context():
+        delivered = drain_outbox()
+        if delivered:
+            print(f"Processed {delivered} outbox emails")
+
+if __name__ == '__main__':
+    deliver_pending_emails()
@@ -1,34 +1,80 @@
-from datetime import datetime
-from app import db
+from app import db, locks
 from app.models.lead import Lead
 from app.models.payment import Payment
+from app.services.locks import LockLost, lead_lock_name
 from app import create_app
 
-def release_expired_reservations():
-    """Release leads that have been reserved for more than 60 minutes"""
-    app = create_app()
+SWEEPER_LOCK = 'task:release_expired_reservations'
+
+def release_expired_reservations(app=None):
+    """Release leads that have been reserved for more than 60 minutes without being paid for"""
+    app = app or create_app()
     
     with app.app_context():
-        # Get all reserved leads
-        reserved_leads = Lead.query.filter_by(status='reserved').all()
+        # Every node runs the sweep; whoever holds the lock does this round's work
+        sweeper = locks.acquire(SWEEPER_LOCK)
+        if sweeper is None:
+            return
         
-        for lead in reserved_leads:
-            if lead.is_reservation_expired():
-                # Get the associated payment
-                payment = Payment.query.filter_by(
-                    lead_id=lead.id,
-                    user_id=lead.reserved_by_id
-                ).first()
+        with sweeper:
+            # Only the expired reservations (indexed on status and reserved_at)
+            expired_ids = [lead_id for lead_id, in db.session.query(Lead.id).filter(
+                Lead.status == 'reserved',
+                Lead.reserved_at < Lead.reservation_cutoff()
+            )]
+            db.session.rollback()
+            
+            released = 0
+            for lead_id in expired_ids:
+                # Stop if this node stalled long enough for another one to take over the sweep
+                try:
+                    sweeper.renew()
+                except LockLost:
+                    print("Lost the reservation sweeper lock, leaving the sweep to another node")
+                    break
                 
-                if payment:
-                    # Mark payment as failed
-                    payment.mark_failed('Reservation expired')
+                # Skip leads a plumber is completing or releasing right now; the next sweep retries them
+                lease = locks.acquire(lead_lock_name(lead_id))
+                if lease is None:
+                    continue
                 
-                # Release the lead
-                lead.release()
+                with lease:
+                    released += release_expired_lead(lead_id, lease)
+            
+            if released:
+                print(f"Released {released} expired reservations")
+
+def release_expired_lead(lead_id, lease):
+    """Release one lead if it is still reserved and expired; returns 1 if it was released."""
+    lead = db.session.get(Lead, lead_id)
+    if lead is None or lead.status != 'reserved' or not lead.is_reservation_expired():
+        db.session.rollback()
+        return 0
+    
+    # A charge that succeeded without its claim being recorded still pays for the lead
+    payments = Payment.query.filter(
+        Payment.lead_id == lead.id,
+        Payment.user_id == lead.reserved_by_id,
+        Payment.status.in_(['pending', 'completed'])
+    ).all()
+    
+    try:
+        if any(payment.status == 'completed' for payment in payments):
+            lead.claim(lead.reserved_by_id, lease)
+            db.session.commit()
+            print(f"Claimed expired reservation of lead {lead.id}: its payment had already completed")
+            return 0
+        
+        for payment in payments:
+            # Mark payment as failed
+            payment.mark_failed('Reservation expired')
         
-        # Commit all changes
-        db.session.commit()
+        # Release the lead (commits the payment too)
+        lead.release(lease)
+    except LockLost:
+        db.session.rollback()
+        return 0
+    return 1
 
 if __name__ == '__main__':
     release_expired_reservations() 
\ No newline at end of file
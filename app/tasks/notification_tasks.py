@@ -0,0 +1,15 @@
+from app import create_app
+from app.services.notifications import fan_out_pending_leads, send_notification_digests
+
+def send_lead_notifications(app=None):
+    """Notify plumbers about leads the workers missed and send due email digests"""
+    app = app or create_app()
+    
+    with app.app_context():
+        notified = fan_out_pending_leads()
+        digests = send_notification_digests()
+        if notified or digests:
+            print(f"Created {notified} lead notifications, queued {digests} digest emails")
+
+if __name__ == '__main__':
+    send_lead_notifications()
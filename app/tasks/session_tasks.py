@@ -0,0 +1,13 @@
+from app import create_app, sess
+
+def cleanup_expired_sessions(app=None):
+    """Delete expired server-side sessions in batches"""
+    app = app or create_app()
+    
+    with app.app_context():
+        removed = sess.cleanup_expired(app.config['SESSION_CLEANUP_BATCH_SIZE'])
+        if removed:
+            print(f"Removed {removed} expired sessions")
+
+if __name__ == '__main__':
+    cleanup_expired_sessions()
@@ -0,0 +1,201 @@
+from flask import current_app, g, request, session
+from flask_sqlalchemy.session import Session
+from functools import wraps
+from threading import Lock
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from app.utils.lru import LRUCache
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+
+# A replica that has replayed everything it received reports no lag, even if the primary has been idle
+_POSTGRES_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+_SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RoutingSession(Session):
+    """
+    db.session that sends plain reads to the replica bind inside @read_replica views.
+
+    Everything else (flushes, SELECT ... FOR UPDATE, raw connections and any
+    statement outside a replica view) goes to the primary, so a view that
+    happens to write still writes to the right database.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get(REPLICA_BIND) and not self._flushing and _is_plain_read(clause):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _is_plain_read(clause):
+    return getattr(clause, 'is_select', False) and getattr(clause, '_for_update_arg', None) is None
+
+
+class DatabaseRouter:
+    """
+    Read/write routing between the primary database and a read replica.
+
+    List and report views marked with @read_replica read from the
+    ``replica`` bind (SQLALCHEMY_BINDS) while its replication lag is within
+    REPLICA_MAX_LAG_SECONDS; the lag is measured at most every
+    REPLICA_LAG_CHECK_SECONDS per process, and a replica that cannot be
+    reached counts as lagging. A view that hits a database error on the
+    replica in between (other threads keep the last measurement while one
+    re-measures) marks it unavailable until the next check and is run
+    again on the primary. Everything else, including reservations, claims
+    and webhooks, stays on the primary.
+
+    After a user's own successful mutation (any non-GET request), their
+    reads stay on the primary for REPLICA_STICKY_SECONDS so they see what
+    they just wrote. The window is remembered in this process and, for
+    cookie sessions, in the server-side session so other hosts honour it.
+    Bearer token clients have no server-side session, so behind a load
+    balancer their next read can land on another process and may briefly
+    miss their own write; API clients that need it should use the object
+    the write returned, or re-read after REPLICA_MAX_LAG_SECONDS.
+    Without a replica bind every view reads from the primary.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._lag = None
+        self._lag_checked = float('-inf')
+        self._sticky = LRUCache(maxsize=10000)
+
+    def init_app(self, app):
+        """Register the stickiness hook."""
+        self._sticky = LRUCache(maxsize=app.config.get('SESSION_CACHE_SIZE', 10000),
+                                ttl=app.config.get('REPLICA_STICKY_SECONDS', 10))
+        app.after_request(self._after_request)
+        app.extensions['db_router'] = self
+
+    def replica_engine(self):
+        """The replica engine, or None when no replica is configured."""
+        return current_app.extensions['sqlalchemy'].engines.get(REPLICA_BIND)
+
+    def replica_lag(self):
+        """Replication lag in seconds as of the last check, or None if unknown."""
+        interval = current_app.config.get('REPLICA_LAG_CHECK_SECONDS', 1)
+        if time.monotonic() - self._lag_checked < interval:
+            return self._lag
+        # One thread measures; the others keep using the previous value meanwhile
+        if not self._lock.acquire(blocking=False):
+            return self._lag
+        try:
+            self._lag_checked = time.monotonic()
+            self._lag = self._measure_lag()
+        finally:
+            self._lock.release()
+        return self._lag
+
+    def mark_unavailable(self):
+        """Read from the primary until the next lag check, e.g. after a replica error."""
+        self._lag = None
+        self._lag_checked = time.monotonic()
+
+    def _measure_lag(self):
+        engine = self.replica_engine()
+        if engine.dialect.name != 'postgresql':
+            return 0.0
+        try:
+            with engine.connect() as conn:
+                lag = conn.execute(_POSTGRES_LAG_SQL).scalar()
+        except Exception as e:
+            logger.warning(f"Replica lag check failed, reading from the primary: {str(e)}")
+            return None
+        return float(lag) if lag is not None else None
+
+    def choose(self, user_id=None):
+        """
+        Pick the database for a read-only view.
+
+        Returns:
+            tuple: ('replica' or 'primary', reason)
+        """
+        if self.replica_engine() is None:
+            return 'primary', 'no_replica'
+        if user_id is not None and self.is_sticky(user_id):
+            return 'primary', 'read_your_writes'
+        lag = self.replica_lag()
+        if lag is None or lag > current_app.config.get('REPLICA_MAX_LAG_SECONDS', 5):
+            return 'primary', 'lag'
+        return 'replica', 'ok'
+
+    def is_sticky(self, user_id):
+        """Whether the user wrote recently enough that the replica may not have it yet."""
+        if self._sticky.get(str(user_id)):
+            return True
+        return session.get('primary_until', 0) > time.time()
+
+    def stick_to_primary(self, user_id):
+        """Keep the user's reads on the primary for REPLICA_STICKY_SECONDS."""
+        self._sticky.set(str(user_id), True)
+        # Only for logged-in browser sessions; setting it would otherwise create a session
+        if session.get('user'):
+            session['primary_until'] = time.time() + current_app.config.get('REPLICA_STICKY_SECONDS', 10)
+
+    def _after_request(self, response):
+        if request.method in _SAFE_METHODS or response.status_code >= 400:
+            return response
+        user_id = current_user_id()
+        if user_id is not None and self.replica_engine() is not None:
+            self.stick_to_primary(user_id)
+        return response
+
+
+def current_user_id():
+    """Id of the user the request authenticated as, if any."""
+    user_id = g.get('current_user_id')
+    if user_id is None and session.get('user'):
+        user_id = session['user'].get('id')
+    return user_id
+
+
+def reading_from_replica():
+    """Whether db.session currently sends reads to the replica."""
+    return bool(current_app.extensions['sqlalchemy'].session.info.get(REPLICA_BIND))
+
+
+def read_replica(f):
+    """Serve a read-only view from the replica when it is fresh enough (see DatabaseRouter)."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        router = current_app.extensions.get('db_router')
+        if router is None:
+            return f(*args, **kwargs)
+
+        target, reason = router.choose(current_user_id())
+        current_app.extensions['metrics'].inc(
+            'db_read_routing_total', (('endpoint', request.endpoint), ('target', target), ('reason', reason)))
+        if target != 'replica':
+            return f(*args, **kwargs)
+
+        db_session = current_app.extensions['sqlalchemy'].session
+        db_session.info[REPLICA_BIND] = True
+        try:
+            return f(*args, **kwargs)
+        except OperationalError as e:
+            # The replica went away since the last lag check; these views only read, so run it again
+            logger.warning(f"Replica read failed in {request.endpoint}, retrying on the primary: {str(e)}")
+            router.mark_unavailable()
+            db_session.rollback()
+            current_app.extensions['metrics'].inc(
+                'db_read_routing_total', (('endpoint', request.endpoint), ('target', 'primary'), ('reason', 'replica_error')))
+        finally:
+            db_session.info.pop(REPLICA_BIND, None)
+        return f(*args, **kwargs)
+    return decorated_function
@@ -0,0 +1,106 @@
+import hashlib
+import re
+
+# Common street suffix/unit spellings reduced to one form
+ADDRESS_ABBREVIATIONS = {
+    'street': 'st', 'avenue': 'ave', 'av': 'ave', 'road': 'rd', 'drive': 'dr',
+    'boulevard': 'blvd', 'lane': 'ln', 'court': 'ct', 'place': 'pl', 'terrace': 'ter',
+    'highway': 'hwy', 'parkway': 'pkwy', 'circle': 'cir', 'apartment': 'apt', 'suite': 'ste',
+    'unit': 'apt', 'north': 'n', 'south': 's', 'east': 'e', 'west': 'w'
+}
+
+SIMHASH_BITS = 64
+_SIMHASH_MASK = (1 << SIMHASH_BITS) - 1
+
+def _hash(value):
+    """Short stable hash of a normalized value, or None for empty values."""
+    if not value:
+        return None
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:32]
+
+def normalize_address(address, city, state, zip_code):
+    """
+    Normalize a postal address for comparison.
+
+    Args:
+        address (str): Street address
+        city (str): City
+        state (str): State
+        zip_code (str): ZIP code
+
+    Returns:
+        str: Lowercase address without punctuation, with abbreviated suffixes
+            and a five digit ZIP, or an empty string if there is no street address
+    """
+    words = re.sub(r'[^a-z0-9 ]', ' ', (address or '').lower()).split()
+    if not words:
+        return ''
+    words = [ADDRESS_ABBREVIATIONS.get(word, word) for word in words]
+    zip5 = re.sub(r'\D', '', zip_code or '')[:5]
+    return ' '.join(words + (city or '').lower().split() + [(state or '').lower().strip(), zip5])
+
+def normalize_phone(phone):
+    """Digits only, without a leading US country code."""
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 11 and digits.startswith('1'):
+        digits = digits[1:]
+    return digits if len(digits) >= 7 else ''
+
+def normalize_email(email):
+    """Lowercase address without a +tag in the local part."""
+    email = (email or '').strip().lower()
+    local, at, domain = email.partition('@')
+    if not at or not local or not domain:
+        return ''
+    return f"{local.split('+', 1)[0]}@{domain}"
+
+def simhash(text):
+    """
+    64-bit SimHash of a text's words and word bigrams.
+
+    Similar texts get fingerprints that differ in only a few bits, so near
+    duplicates can be found by Hamming distance.
+
+    Args:
+        text (str): Text to fingerprint
+
+    Returns:
+        int: Signed 64-bit fingerprint (fits a BIGINT column), or None for empty text
+    """
+    words = re.sub(r'[^a-z0-9 ]', ' ', (text or '').lower()).split()
+    if not words:
+        return None
+    # Words and word bigrams: a small edit moves only a few of the features
+    features = words + [' '.join(pair) for pair in zip(words, words[1:])]
+
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    fingerprint = sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+    return fingerprint - (1 << SIMHASH_BITS) if fingerprint >= 1 << (SIMHASH_BITS - 1) else fingerprint
+
+def hamming_distance(a, b):
+    """Number of differing bits between two fingerprints."""
+    return bin((a ^ b) & _SIMHASH_MASK).count('1')
+
+def lead_fingerprint(values):
+    """
+    Dedupe fingerprint columns for a lead.
+
+    Args:
+        values (dict): Lead fields (address, city, state, zip_code, customer_phone,
+            customer_email, title, description)
+
+    Returns:
+        dict: address_hash, phone_hash, email_hash and content_simhash
+    """
+    return {
+        'address_hash': _hash(normalize_address(values.get('address'), values.get('city'),
+                                                values.get('state'), values.get('zip_code'))),
+        'phone_hash': _hash(normalize_phone(values.get('customer_phone'))),
+        'email_hash': _hash(normalize_email(values.get('customer_email'))),
+        'content_simhash': simhash(f"{values.get('title') or ''} {values.get('description') or ''}")
+    }
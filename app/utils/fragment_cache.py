@@ -0,0 +1,39 @@
+from flask import render_template
+from markupsafe import Markup
+from app.utils.lru import LRUCache
+
+
+class FragmentCache:
+    """
+    Size-bounded LRU of rendered template fragments.
+
+    Callers key a fragment on everything its output depends on, typically
+    ``(kind, lead.id, lead.updated_at)``, so an edited lead simply misses and
+    re-renders while its stale entry ages out of the LRU. Fragments must not
+    contain per-user or per-request content such as CSRF tokens.
+
+    Args:
+        maxsize (int): Maximum number of fragments kept
+    """
+
+    def __init__(self, maxsize=5000):
+        self._fragments = LRUCache(maxsize=maxsize)
+
+    def init_app(self, app):
+        """Size the cache from config and expose ``cached_fragment`` to templates."""
+        self._fragments = LRUCache(maxsize=app.config.get('FRAGMENT_CACHE_SIZE', 5000))
+        app.add_template_global(self.render, 'cached_fragment')
+        app.extensions['fragment_cache'] = self
+
+    def render(self, template_name, key, **context):
+        """Render template_name with context, or return the cached output for key."""
+        cache_key = (template_name, key)
+        fragment = self._fragments.get(cache_key)
+        if fragment is None:
+            fragment = Markup(render_template(template_name, **context))
+            self._fragments.set(cache_key, fragment)
+        return fragment
+
+    def clear(self):
+        """Drop every cached fragment."""
+        self._fragments.clear()
@@ -0,0 +1,53 @@
+from geopy.geocoders import Nominatim
+from geopy.exc import GeocoderTimedOut
+from app.utils.lru import LRUCache
+from app.utils.metrics import external_call
+import logging
+
+logger = logging.getLogger(__name__)
+
+_geolocator = Nominatim(user_agent="plumberleads")
+
+# Addresses rarely move; failures are cached briefly so a bad batch doesn't hammer the geocoder
+_cache = LRUCache(maxsize=10000, ttl=7 * 24 * 3600)
+NEGATIVE_CACHE_TTL = 15 * 60
+
+def _cache_key(address, city, state, zip_code):
+    return ' '.join(f"{address}, {city}, {state} {zip_code}".lower().split())
+
+def geocode_address(address, city, state, zip_code, use_cache=True):
+    """
+    Convert address to coordinates using geopy.
+
+    Args:
+        address (str): Street address
+        city (str): City
+        state (str): State
+        zip_code (str): ZIP code
+        use_cache (bool): Serve repeated addresses from the in-process cache
+
+    Returns:
+        tuple: (latitude, longitude), or (None, None) if the address could not be geocoded
+    """
+    key = _cache_key(address, city, state, zip_code)
+    if use_cache:
+        cached = _cache.get(key)
+        if cached is not None:
+            return cached
+
+    try:
+        full_address = f"{address}, {city}, {state} {zip_code}"
+        with external_call('geocoder'):
+            location = _geolocator.geocode(full_address)
+        if location:
+            result = (location.latitude, location.longitude)
+            _cache.set(key, result)
+            return result
+        _cache.set(key, (None, None), ttl=NEGATIVE_CACHE_TTL)
+        return None, None
+    except GeocoderTimedOut:
+        logger.error("Geocoding timed out")
+        return None, None
+    except Exception as e:
+        logger.error(f"Geocoding error: {str(e)}")
+        return None, None
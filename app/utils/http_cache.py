@@ -0,0 +1,119 @@
+from flask import current_app, json, request
+from threading import Lock
+from app.utils.db_routing import reading_from_replica
+from app.utils.lru import LRUCache
+import hashlib
+import uuid
+
+
+class ResponseCache:
+    """
+    Conditional-request support and an LRU of rendered JSON bodies.
+
+    Cached responses are keyed by a set of "dimensions" (e.g. ``'leads'`` or
+    ``'zip_code:94105'``), each with a version counter that is bumped whenever
+    a lead in that dimension changes. The ETag of a response is derived from
+    the versions it was built from, so a client revalidating with
+    If-None-Match gets a 304 without the listing being queried or rendered
+    until one of its dimensions changes. Versions live in process memory; the
+    per-process epoch in every ETag keeps other processes and restarts from
+    answering 304 for a version they never produced. Bodies built from the
+    read replica may predate the versions, so they get a content ETag and
+    expire after REPLICA_MAX_LAG_SECONDS; other bodies expire after
+    HTTP_CACHE_TTL seconds in case an event was lost.
+
+    Versions are only bumped by the lead events this process receives, so
+    they are only used with a backend that fans events out across processes
+    (LEAD_EVENTS_BACKEND=postgres). With the in-process 'memory' backend a
+    change made by another worker, run_background_tasks.py or an import would
+    never reach this process; every response is then built and only gets a
+    content ETag, which still spares clients an unchanged body.
+
+    Args:
+        maxsize (int): Maximum number of rendered bodies kept
+    """
+
+    def __init__(self, maxsize=2048):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._versions = {}
+        self._lock = Lock()
+        self._bodies = LRUCache(maxsize=maxsize)
+        self.versioned = False
+
+    def init_app(self, app):
+        """Size the body cache from config and bump versions on lead events."""
+        self._bodies = LRUCache(maxsize=app.config.get('HTTP_CACHE_SIZE', 2048), ttl=app.config.get('HTTP_CACHE_TTL', 60))
+        self.versioned = app.config.get('LEAD_EVENTS_BACKEND', 'memory') != 'memory'
+        app.extensions['lead_events'].broker.add_listener(self.on_lead_event)
+        app.extensions['response_cache'] = self
+
+    def on_lead_event(self, event):
+        """Invalidate every dimension a lead event touches."""
+        if event['type'] == 'resync':
+            # Events may have been missed: invalidate everything
+            self.epoch = uuid.uuid4().hex[:8]
+            return
+        self.bump('leads', f"zip_code:{event.get('zip_code')}", f"service_type:{event.get('service_type')}")
+
+    def bump(self, *dimensions):
+        """Advance the version of each dimension."""
+        with self._lock:
+            for dimension in dimensions:
+                self._versions[dimension] = self._versions.get(dimension, 0) + 1
+
+    def versions(self, dimensions):
+        """Current versions of the given dimensions."""
+        with self._lock:
+            return tuple(self._versions.get(dimension, 0) for dimension in dimensions)
+
+    def json_response(self, key, dimensions, build, cache_control='private, no-cache'):
+        """
+        Return a conditional JSON response for key, building it only on a miss.
+
+        Args:
+            key (tuple): Identifies the resource, including everything the body depends on
+            dimensions (list): Version dimensions the body depends on
+            build (callable): Returns the JSON-serializable payload
+            cache_control (str): Cache-Control header value
+
+        Returns:
+            Response: 200 with the body, or 304 if the client's ETag is current
+        """
+        if not self.versioned:
+            body = json.dumps(build())
+            return self._conditional(body, hashlib.sha1(body.encode()).hexdigest(), cache_control)
+
+        # Versions are only trustworthy while we receive the other processes' events
+        current_app.extensions['lead_events'].start()
+
+        # Read the versions before building, so a change committed meanwhile yields a new ETag
+        dimensions = sorted(dimensions)
+        digest = hashlib.sha1(repr((self.epoch, key, dimensions, self.versions(dimensions))).encode())
+        version_etag = digest.hexdigest()
+
+        body, etag = self._bodies.get(version_etag, (None, version_etag))
+        if body is None and etag not in request.if_none_match:
+            body = json.dumps(build())
+            if reading_from_replica():
+                # A lagging replica may not have the change that bumped the versions yet, so the body
+                # must not stand for them: it gets a content ETag and only lives as long as the lag allowed
+                etag = hashlib.sha1(body.encode()).hexdigest()
+                self._bodies.set(version_etag, (body, etag), ttl=current_app.config.get('REPLICA_MAX_LAG_SECONDS', 5))
+            else:
+                self._bodies.set(version_etag, (body, etag))
+
+        return self._conditional(body or '', etag, cache_control)
+
+    def _conditional(self, body, etag, cache_control):
+        response = current_app.response_class(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        return response.make_conditional(request)
+
+    def static_json(self, payload, max_age=3600):
+        """Return a cacheable response for data that only changes with a deploy."""
+        body = json.dumps(payload)
+        response = current_app.response_class(body, mimetype='application/json')
+        response.set_etag(hashlib.sha1(body.encode()).hexdigest())
+        response.headers['Cache-Control'] = f'public, max-age={max_age}'
+        return response.make_conditional(request)
@@ -0,0 +1,338 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import current_app, has_app_context, request
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from threading import Lock
+import hmac
+import stripe
+import threading
+import time
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# name: (type, help, buckets)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests handled, by endpoint, method and status.', None),
+    'http_request_duration_seconds': ('histogram', 'Time spent in the Flask handler.', LATENCY_BUCKETS),
+    'http_response_size_bytes': ('histogram', 'Response body size, when known up front.', SIZE_BUCKETS),
+    'http_request_db_queries': ('histogram', 'SQL statements executed per request.', QUERY_COUNT_BUCKETS),
+    'http_request_db_seconds': ('histogram', 'Time spent in SQL statements per request.', LATENCY_BUCKETS),
+    'http_request_external_seconds': ('histogram', 'Time spent calling external services per request.', LATENCY_BUCKETS),
+    'db_query_duration_seconds': ('histogram', 'SQL statement latency, requests and background work alike.', LATENCY_BUCKETS),
+    'external_call_duration_seconds': ('histogram', 'External service call latency.', LATENCY_BUCKETS),
+    'external_call_errors_total': ('counter', 'External service calls that raised or returned a 5xx.', None),
+    'db_pool_checkout_seconds': ('histogram', 'Time to get a pooled connection: waiting for a free one, connecting and the pre-ping.', LATENCY_BUCKETS),
+    'db_pool_timeouts_total': ('counter', 'Checkouts that gave up after DB_POOL_TIMEOUT seconds.', None),
+    'db_connections_opened_total': ('counter', 'New database connections opened by the pool.', None),
+    'db_connections_invalidated_total': ('counter', 'Pooled connections discarded as dead (failed pre-ping or disconnect).', None),
+    'db_pool_connections': ('gauge', 'Pooled connections by state (checked_out, idle) and the most the pool may open (limit).', None),
+    'db_read_routing_total': ('counter', 'Read-only views by endpoint, the database they read from and why.', None),
+    'lock_acquisitions_total': ('counter', 'Lock acquisitions by kind of lock and result (acquired, busy), and leases lost before their holder was done (lost).', None),
+}
+
+
+class _Shard:
+    """Counters written by exactly one thread."""
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def merge(self, other):
+        for key, value in other.counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, series in other.histograms.items():
+            mine = self.histograms.setdefault(key, [0] * len(series))
+            for index, value in enumerate(series):
+                mine[index] += value
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = tuple(labels) + tuple(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Metrics:
+    """
+    Request, database and external call metrics in Prometheus text format.
+
+    Every thread records into its own shard, so the hot path is a couple of
+    dict updates without locks; the lock is only taken when a thread first
+    records and when /metrics is scraped, which sums the shards. Shards of
+    finished threads are folded into one, so thread-per-request servers
+    don't grow the list. Each worker process reports its own numbers.
+
+    SQL statements are timed with engine cursor events, external calls with
+    external_call() (and hooks on the Stripe and Supabase HTTP clients), and
+    both are also totalled per request. Connection pools report checkout
+    waits, opened and discarded connections, and their occupancy at scrape
+    time.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = Lock()
+        self._shards = []
+        self._retired = _Shard()
+        self._engines = []  # (pool label, engine) reported by pool_gauges()
+
+    def init_app(self, app):
+        """Register the request hooks, SQL timing, Stripe timing and the /metrics view."""
+        app.extensions['metrics'] = self
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        if app.config.get('METRICS_TOKEN') or not app.config.get('METRICS_REQUIRE_TOKEN', False):
+            app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+        else:
+            app.logger.warning('METRICS_TOKEN is not set, not serving /metrics')
+
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        with app.app_context():
+            for bind_key, engine in app.extensions['sqlalchemy'].engines.items():
+                self.instrument_engine(engine, bind_key or 'primary')
+        self._instrument_stripe()
+
+    # Recording
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def inc(self, name, labels=(), value=1):
+        """Add value to a counter."""
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        """Record one observation in a histogram."""
+        buckets = METRICS[name][2]
+        histograms = self._shard().histograms
+        key = (name, labels)
+        series = histograms.get(key)
+        if series is None:
+            # One slot per bucket, one for +Inf, then the sum
+            series = histograms[key] = [0] * (len(buckets) + 2)
+        series[bisect_left(buckets, value)] += 1
+        series[-1] += value
+
+    def request_state(self):
+        """Per-request totals of the current thread, or None outside a request."""
+        return getattr(self._local, 'request', None)
+
+    @contextmanager
+    def external_call(self, service):
+        """Time a call to an external service."""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc('external_call_errors_total', (('service', service),))
+            raise
+        finally:
+            self.record_external(service, time.perf_counter() - started)
+
+    def record_external(self, service, elapsed):
+        self.observe('external_call_duration_seconds', elapsed, (('service', service),))
+        state = self.request_state()
+        if state is not None:
+            state['external_seconds'] += elapsed
+
+    def instrument_http_client(self, http_client, service):
+        """Time every request made through an httpx client."""
+        def on_request(req):
+            req.extensions['metrics_started'] = time.perf_counter()
+
+        def on_response(response):
+            started = response.request.extensions.get('metrics_started')
+            if started is not None:
+                self.record_external(service, time.perf_counter() - started)
+            if response.status_code >= 500:
+                self.inc('external_call_errors_total', (('service', service),))
+
+        http_client.event_hooks['request'].append(on_request)
+        http_client.event_hooks['response'].append(on_response)
+
+    def instrument_engine(self, engine, name):
+        """Time connection checkouts and count new and discarded connections of an engine's pool."""
+        if getattr(engine, '_metrics_instrumented', False):
+            return
+        labels = (('pool', name),)
+        raw_connection = engine.raw_connection
+
+        # Every Connection checks out through here, so this covers queueing behind a full pool too;
+        # wrapping the engine rather than the pool survives engine.dispose()
+        def timed_raw_connection(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return raw_connection(*args, **kwargs)
+            except exc.TimeoutError:
+                self.inc('db_pool_timeouts_total', labels)
+                raise
+            finally:
+                self.observe('db_pool_checkout_seconds', time.perf_counter() - started, labels)
+
+        engine.raw_connection = timed_raw_connection
+        event.listen(engine, 'connect', lambda dbapi_connection, record: self.inc('db_connections_opened_total', labels))
+        event.listen(engine, 'invalidate', lambda dbapi_connection, record, exception:
+                     self.inc('db_connections_invalidated_total', labels))
+        engine._metrics_instrumented = True
+        self._engines.append((name, engine))
+
+    def pool_gauges(self):
+        """Current occupancy of every instrumented pool: {(metric, labels): value}."""
+        gauges = {}
+        for name, engine in self._engines:
+            pool = engine.pool
+            if not isinstance(pool, QueuePool):
+                continue
+            gauges[('db_pool_connections', (('pool', name), ('state', 'checked_out')))] = pool.checkedout()
+            gauges[('db_pool_connections', (('pool', name), ('state', 'idle')))] = pool.checkedin()
+            gauges[('db_pool_connections', (('pool', name), ('state', 'limit')))] = pool.size() + max(pool._max_overflow, 0)
+        return gauges
+
+    def _instrument_stripe(self):
+        # Every Stripe API call goes through the library's shared HTTP client
+        client = stripe.default_http_client or stripe.http_client.new_default_http_client(
+            verify_ssl_certs=stripe.verify_ssl_certs, proxy=stripe.proxy)
+        if getattr(client, '_metrics_instrumented', False):
+            return
+        send = client.request_with_retries
+
+        def request_with_retries(*args, **kwargs):
+            with self.external_call('stripe'):
+                return send(*args, **kwargs)
+
+        client.request_with_retries = request_with_retries
+        client._metrics_instrumented = True
+        stripe.default_http_client = client
+
+    # Request hooks
+
+    def _start_request(self):
+        self._local.request = {'started': time.perf_counter(), 'db_queries': 0, 'db_seconds': 0.0,
+                               'external_seconds': 0.0}
+
+    def _finish_request(self, response):
+        state = self._local.__dict__.pop('request', None)
+        if state is None:
+            return response
+
+        endpoint = (('endpoint', request.endpoint or 'unmatched'),)
+        self.inc('http_requests_total', endpoint + (('method', request.method), ('status', response.status_code)))
+        self.observe('http_request_duration_seconds', time.perf_counter() - state['started'], endpoint)
+        self.observe('http_request_db_queries', state['db_queries'], endpoint)
+        self.observe('http_request_db_seconds', state['db_seconds'], endpoint)
+        self.observe('http_request_external_seconds', state['external_seconds'], endpoint)
+        # Streamed responses have no length until they are sent
+        if response.content_length is not None:
+            self.observe('http_response_size_bytes', response.content_length, endpoint)
+        return response
+
+    # Exposition
+
+    def snapshot(self):
+        """Sum of every shard: (counters, histograms)."""
+        total = _Shard()
+        with self._lock:
+            live = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    self._retired.merge(shard)
+            self._shards = live
+            total.merge(self._retired)
+            shards = [shard for _, shard in live]
+
+        for shard in shards:
+            # Copies are atomic under the GIL, so the owning thread can keep writing
+            copy = _Shard()
+            copy.counters = shard.counters.copy()
+            copy.histograms = {key: list(series) for key, series in shard.histograms.copy().items()}
+            total.merge(copy)
+        return total.counters, total.histograms
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        counters, histograms = self.snapshot()
+        gauges = self.pool_gauges()
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind in ('counter', 'gauge'):
+                for (metric, labels), value in sorted((counters if kind == 'counter' else gauges).items(), key=str):
+                    if metric == name:
+                        lines.append(f'{name}{_format_labels(labels)} {value}')
+                continue
+            for (metric, labels), series in sorted(histograms.items(), key=str):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + ('+Inf',), series):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels, (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {series[-1]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        """Prometheus scrape endpoint, protected by METRICS_TOKEN when one is set."""
+        token = current_app.config.get('METRICS_TOKEN')
+        if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return current_app.response_class('Unauthorized\n', status=401, mimetype='text/plain')
+        return current_app.response_class(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _metrics():
+    return current_app.extensions.get('metrics') if has_app_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    metrics = _metrics()
+    if started is None or metrics is None:
+        return
+    elapsed = time.perf_counter() - started
+    metrics.observe('db_query_duration_seconds', elapsed)
+    state = metrics.request_state()
+    if state is not None:
+        state['db_queries'] += 1
+        state['db_seconds'] += elapsed
+
+
+@contextmanager
+def external_call(service):
+    """Time a call to an external service with the current app's metrics, if any."""
+    metrics = _metrics()
+    if metrics is None:
+        yield
+        return
+    with metrics.external_call(service):
+        yield
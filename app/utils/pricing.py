@@ -1,37 +1,120 @@
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
 from flask import current_app
 
+# Pricing settings captured once, so a page of leads is priced without repeated config lookups
+PricingSnapshot = namedtuple('PricingSnapshot', ['percentage', 'basis_points', 'minimum_cents'])
+
+def to_cents(amount):
+    """
+    Convert a dollar amount to integer cents, rounding half up.
+
+    Args:
+        amount (float|str|Decimal): Dollar amount
+
+    Returns:
+        int: Amount in cents, or None if amount is None
+    """
+    if amount is None:
+        return None
+    # Going through str avoids binary float artifacts (19.99 * 100 == 1998.9999...)
+    return int((Decimal(str(amount)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+def from_cents(cents):
+    """Convert integer cents to a dollar amount for display and JSON."""
+    return None if cents is None else cents / 100
+
+def pricing_snapshot():
+    """Return the cached pricing settings for the current app."""
+    snapshot = current_app.extensions.get('pricing_snapshot')
+    if snapshot is None:
+        percentage = float(current_app.config.get('LEAD_CLAIM_PERCENTAGE', 0.15))
+        snapshot = PricingSnapshot(
+            percentage=percentage,
+            basis_points=int((Decimal(str(percentage)) * 10000).quantize(Decimal('1'), rounding=ROUND_HALF_UP)),
+            minimum_cents=to_cents(current_app.config.get('MINIMUM_LEAD_PRICE', 30.00))
+        )
+        current_app.extensions['pricing_snapshot'] = snapshot
+    return snapshot
+
+def invalidate_pricing():
+    """Drop the cached pricing settings after LEAD_CLAIM_PERCENTAGE or MINIMUM_LEAD_PRICE change."""
+    current_app.extensions.pop('pricing_snapshot', None)
+
+def calculate_claim_price_cents(price_cents, snapshot=None):
+    """
+    Calculate the claim price in cents for a job price in cents.
+
+    Args:
+        price_cents (int): The total price of the job/project in cents
+        snapshot (PricingSnapshot): Pricing settings (default: the cached snapshot)
+
+    Returns:
+        int: The configured percentage of the job price, rounded half up, but at least the minimum
+    """
+    snapshot = snapshot or pricing_snapshot()
+    return max((price_cents * snapshot.basis_points + 5000) // 10000, snapshot.minimum_cents)
+
+def _pricing_details(price_cents, lead_price_cents, snapshot):
+    calculated_cents = (price_cents * snapshot.basis_points + 5000) // 10000
+    return {
+        'lead_price': from_cents(lead_price_cents),
+        'lead_price_cents': lead_price_cents,
+        'calculated_price': from_cents(calculated_cents),
+        'minimum_price': from_cents(snapshot.minimum_cents),
+        'percentage': snapshot.percentage,
+        'is_minimum_price': calculated_cents < snapshot.minimum_cents
+    }
+
+def lead_price_cents(lead, snapshot=None):
+    """
+    What a plumber pays to claim a lead, in cents: the claim price stored at write time.
+
+    Every listing and every charge goes through here, so the price shown is
+    the price charged.
+    """
+    if lead.claim_price_cents is not None:
+        return lead.claim_price_cents
+    return calculate_claim_price_cents(lead.price_cents, snapshot)
+
+def price_leads(leads):
+    """
+    Price a page of leads at once from one pricing snapshot.
+
+    Each lead is priced by lead_price_cents, so the price shown is the
+    price charged.
+
+    Args:
+        leads (iterable): Lead objects
+
+    Returns:
+        dict: Lead id -> pricing details as returned by calculate_lead_price
+    """
+    snapshot = pricing_snapshot()
+    return {
+        lead.id: _pricing_details(lead.price_cents, lead_price_cents(lead, snapshot), snapshot)
+        for lead in leads
+    }
+
 def calculate_lead_price(job_price):
     """
     Calculate the price a plumber needs to pay to claim a lead.
     Uses the configured percentage of the job price with a minimum price floor.
-    
+
     Args:
         job_price (float): The total price of the job/project
-        
+
     Returns:
         dict: Contains both the calculated lead price and the calculation details
             {
                 'lead_price': float,  # The final price to charge
+                'lead_price_cents': int,  # The final price to charge, in cents
                 'calculated_price': float,  # Price before minimum check
                 'minimum_price': float,  # Minimum price threshold
                 'percentage': float,  # Percentage used for calculation
                 'is_minimum_price': bool  # Whether minimum price was used
             }
     """
-    # Get configuration values with defaults
-    percentage = current_app.config.get('LEAD_CLAIM_PERCENTAGE', 0.15)
-    minimum_price = current_app.config.get('MINIMUM_LEAD_PRICE', 30.00)
-    
-    # Calculate price based on percentage
-    calculated_price = job_price * percentage
-    
-    # Use the higher of calculated price or minimum price
-    final_price = max(calculated_price, minimum_price)
-    
-    return {
-        'lead_price': final_price,
-        'calculated_price': calculated_price,
-        'minimum_price': minimum_price,
-        'percentage': percentage,
-        'is_minimum_price': calculated_price < minimum_price
-    } 
\ No newline at end of file
+    snapshot = pricing_snapshot()
+    price_cents = to_cents(job_price)
+    return _pricing_details(price_cents, calculate_claim_price_cents(price_cents, snapshot), snapshot)
@@ -0,0 +1,220 @@
+from contextlib import contextmanager
+from flask import current_app, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Collapse literals and expanded IN lists so statements differing only in values share a shape
+_SHAPE_PATTERNS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%\(\w+\)s|:\w+|\$\d+|%s'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(?...)'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a request runs more SQL statements than its budget allows."""
+
+
+def statement_shape(statement):
+    """Normalize a SQL statement so repeats of the same query compare equal."""
+    for pattern, replacement in _SHAPE_PATTERNS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def _call_site():
+    """Innermost application frame outside this module, for pointing at the code issuing a query."""
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        if frame.filename.startswith(_APP_ROOT) and not frame.filename.endswith('query_profiler.py'):
+            return f'{os.path.relpath(frame.filename, os.path.dirname(_APP_ROOT))}:{frame.lineno} in {frame.name}'
+    return 'unknown'
+
+
+class QueryLog:
+    """Statements seen while the log is active: count, time and repeats per shape."""
+
+    def __init__(self, repeat_threshold=5):
+        self.repeat_threshold = repeat_threshold
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = {}
+        self.repeats = {}  # shape -> call site of the repeat that crossed the threshold
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.seconds += elapsed
+        shape = statement_shape(statement)
+        seen = self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        if seen == self.repeat_threshold:
+            self.repeats[shape] = _call_site()
+
+    def n_plus_one(self):
+        """Shapes repeated at least repeat_threshold times, most frequent first."""
+        return sorted(((self.shapes[shape], shape, site) for shape, site in self.repeats.items()), reverse=True)
+
+
+class QueryProfiler:
+    """
+    SQL guardrails for development, staging and tests.
+
+    Every statement is counted against the current request (and any active
+    count_queries() block). At the end of a request, statement shapes
+    repeated QUERY_REPEAT_THRESHOLD times or more are logged as likely N+1
+    patterns together with the code that issued them. Statements slower than
+    SLOW_QUERY_THRESHOLD_MS are logged with their EXPLAIN plan, in requests
+    and background jobs alike. A request running more statements than its
+    budget (QUERY_BUDGET, or @query_budget on the view) is logged, or fails
+    with QueryBudgetExceeded when QUERY_BUDGET_RAISE is set, as in tests.
+
+    Disabled unless QUERY_PROFILER_ENABLED is set; it costs a regex per
+    statement, which is fine outside production.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def init_app(self, app):
+        """Register the request hooks and statement listeners when enabled."""
+        app.extensions['query_profiler'] = self
+        if not app.config.get('QUERY_PROFILER_ENABLED', False):
+            return
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def _active_logs(self):
+        logs = getattr(self._local, 'logs', None)
+        if logs is None:
+            logs = self._local.logs = []
+        return logs
+
+    @contextmanager
+    def count_queries(self):
+        """Collect the statements run inside the block into a QueryLog."""
+        log = QueryLog(current_app.config.get('QUERY_REPEAT_THRESHOLD', 5))
+        self._active_logs().append(log)
+        try:
+            yield log
+        finally:
+            self._active_logs().remove(log)
+
+    @contextmanager
+    def assert_max_queries(self, limit):
+        """Fail with QueryBudgetExceeded if the block runs more than limit statements."""
+        with self.count_queries() as log:
+            yield log
+        if log.count > limit:
+            raise QueryBudgetExceeded(_budget_message('block', log, limit))
+
+    def record(self, conn, cursor, statement, parameters, elapsed, executemany):
+        for log in self._active_logs():
+            log.record(statement, elapsed)
+
+        threshold = current_app.config.get('SLOW_QUERY_THRESHOLD_MS', 200) / 1000
+        if elapsed >= threshold:
+            plan = self.explain(conn, cursor, statement, parameters) if not executemany else None
+            logger.warning(f"Slow query ({elapsed * 1000:.0f} ms) from {_call_site()}: {statement}"
+                           + (f"\nPlan:\n{plan}" if plan else ''))
+
+    def explain(self, conn, cursor, statement, parameters):
+        """EXPLAIN a read statement on the same DBAPI connection, or None."""
+        if not current_app.config.get('SLOW_QUERY_EXPLAIN', True):
+            return None
+        if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return None
+
+        dialect = conn.dialect.name
+        prefix = 'EXPLAIN QUERY PLAN ' if dialect == 'sqlite' else 'EXPLAIN '
+        explain_cursor = cursor.connection.cursor()
+        # A failed statement aborts the whole transaction on PostgreSQL, so fence it with a savepoint
+        savepoint = dialect == 'postgresql'
+        try:
+            if savepoint:
+                explain_cursor.execute('SAVEPOINT query_profiler_explain')
+            explain_cursor.execute(prefix + statement, parameters)
+            rows = explain_cursor.fetchall()
+            if savepoint:
+                explain_cursor.execute('RELEASE SAVEPOINT query_profiler_explain')
+        except Exception as e:
+            if savepoint:
+                explain_cursor.execute('ROLLBACK TO SAVEPOINT query_profiler_explain')
+            return f'(EXPLAIN failed: {str(e)})'
+        finally:
+            explain_cursor.close()
+        return '\n'.join(' '.join(str(value) for value in row) for row in rows)
+
+    # Request hooks
+
+    def _start_request(self):
+        # A request that died with an exception never reached _finish_request
+        stale = self._local.__dict__.pop('request_log', None)
+        if stale in self._active_logs():
+            self._active_logs().remove(stale)
+
+        log = QueryLog(current_app.config.get('QUERY_REPEAT_THRESHOLD', 5))
+        self._local.request_log = log
+        self._active_logs().append(log)
+
+    def _finish_request(self, response):
+        log = self._local.__dict__.pop('request_log', None)
+        if log is None:
+            return response
+        self._active_logs().remove(log)
+
+        endpoint = request.endpoint or request.path
+        for count, shape, site in log.n_plus_one():
+            logger.warning(f"Possible N+1 in {endpoint}: {count} x {shape[:300]} (from {site})")
+
+        view = current_app.view_functions.get(request.endpoint)
+        limit = getattr(view, 'query_budget', None) or current_app.config.get('QUERY_BUDGET')
+        if limit and log.count > limit:
+            message = _budget_message(endpoint, log, limit)
+            if current_app.config.get('QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+def _budget_message(where, log, limit):
+    return f"{where} ran {log.count} SQL statements ({log.seconds * 1000:.0f} ms), budget is {limit}"
+
+
+def query_budget(limit):
+    """Give a view its own statement budget instead of QUERY_BUDGET."""
+    def decorator(f):
+        # Decorators built with functools.wraps (login_required, ...) carry the attribute outwards
+        f.query_budget = limit
+        return f
+    return decorator
+
+
+def _profiler():
+    return current_app.extensions.get('query_profiler') if has_app_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._profiler_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_profiler_started', None)
+    profiler = _profiler()
+    if started is None or profiler is None or not current_app.config.get('QUERY_PROFILER_ENABLED', False):
+        return
+    profiler.record(conn, cursor, statement, parameters, time.perf_counter() - started, executemany)
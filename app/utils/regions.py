@@ -0,0 +1,48 @@
+"""
+Geographic region keys for leads.
+
+A plumber only ever works leads within their service radius, so lead
+queries are regional. Every lead carries a region key: the
+REGION_DEGREES x REGION_DEGREES latitude/longitude cell it lies in (e.g.
+``'40:-74'`` for New York), or ``'state:NY'`` while it has no coordinates.
+Radius queries filter on the cells their bounding box touches, so they only
+read the region-led index entries of those cells, and each region's working
+set stays together as coverage grows to new cities. Only admin reports query
+across regions.
+"""
+import math
+
+REGION_DEGREES = 1  # Cell size; changing it means re-keying every lead (python migrate_db.py lead_regions)
+MILES_PER_DEGREE_LATITUDE = 69.0
+
+def region_key(latitude, longitude, state=None):
+    """
+    Region of a location.
+
+    Args:
+        latitude (float): Latitude, or None if the address was not geocoded
+        longitude (float): Longitude, or None
+        state (str): State, used when there are no coordinates
+
+    Returns:
+        str: Region key, or None if neither coordinates nor a state are known
+    """
+    if latitude is None or longitude is None:
+        return f"state:{state.strip().upper()}" if state and state.strip() else None
+    return f"{_cell(latitude)}:{_cell(longitude)}"
+
+def _cell(degrees):
+    return math.floor(degrees / REGION_DEGREES) * REGION_DEGREES
+
+def bounding_box(latitude, longitude, miles):
+    """(min_lat, max_lat, min_lng, max_lng) of a box containing every point within miles of a point."""
+    lat_delta = miles / MILES_PER_DEGREE_LATITUDE
+    lng_delta = miles / (MILES_PER_DEGREE_LATITUDE * max(math.cos(math.radians(latitude)), 0.01))
+    return latitude - lat_delta, latitude + lat_delta, longitude - lng_delta, longitude + lng_delta
+
+def regions_within(latitude, longitude, miles):
+    """Region keys of every cell with a point within miles of a location (leads without coordinates are never in range)."""
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, miles)
+    return [f"{lat}:{lng}"
+            for lat in range(_cell(min_lat), _cell(max_lat) + 1, REGION_DEGREES)
+            for lng in range(_cell(min_lng), _cell(max_lng) + 1, REGION_DEGREES)]
@@ -0,0 +1,160 @@
+from collections import Counter
+from flask import current_app, g, request
+from threading import Event, Lock
+import os
+import sys
+import threading
+import time
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def collapse_stack(frame, root=None):
+    """Render a frame's stack as 'root;outer;...;inner' for flamegraph tools."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    if root:
+        labels.append(root)
+    return ';'.join(reversed(labels))
+
+
+def format_collapsed(counts):
+    """One 'stack count' line per distinct stack, most frequent first."""
+    return ''.join(f'{stack} {count}\n' for stack, count in counts.most_common())
+
+
+class Sampler(threading.Thread):
+    """
+    Background thread sampling the stacks of other threads at a fixed interval.
+
+    Args:
+        interval (float): Seconds between samples
+        thread_ids (set): Only sample these threads (default: every thread but the sampler)
+    """
+
+    def __init__(self, interval=0.005, thread_ids=None):
+        super().__init__(name='sampling-profiler', daemon=True)
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.counts = Counter()
+        self.samples = 0
+        self._stop_event = Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            self.sample(own_id)
+
+    def sample(self, own_id):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                continue
+            root = names.get(thread_id, str(thread_id)) if self.thread_ids is None else None
+            self.counts[collapse_stack(frame, root)] += 1
+        self.samples += 1
+
+    def stop(self):
+        """Stop sampling and return the stack counts."""
+        self._stop_event.set()
+        self.join()
+        return self.counts
+
+
+class SamplingProfiler:
+    """
+    On-demand sampling profiler for a live worker.
+
+    Nothing runs until a profile is requested: the whole worker through
+    profile() (the admin profile endpoint), or a single request when an
+    admin adds ?profile=1. Samples come from sys._current_frames() in a
+    separate thread, so the profiled code is not instrumented and only
+    pays for the sampler taking the GIL once per interval. Output is the
+    collapsed-stack format read by flamegraph.pl and speedscope. One profile
+    runs per worker at a time.
+
+    profile() samples from the calling request's thread for the whole run,
+    so it only sees traffic on a threaded worker (gunicorn --threads, the
+    threaded dev server); a sync worker serves nothing else meanwhile and
+    the admin endpoint refuses to run there. ?profile=1 works on any worker.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+
+    def init_app(self, app):
+        """Register the ?profile=1 request hooks."""
+        app.extensions['sampling_profiler'] = self
+        if not app.config.get('PROFILER_ENABLED', True):
+            return
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._abandon_request)
+
+    def _interval(self, interval_ms=None):
+        interval_ms = interval_ms or current_app.config.get('PROFILER_INTERVAL_MS', 5)
+        return max(interval_ms, 1) / 1000
+
+    def profile(self, seconds, interval_ms=None):
+        """
+        Sample every thread of this worker for a while.
+
+        Args:
+            seconds (float): How long to sample
+            interval_ms (int): Milliseconds between samples (default PROFILER_INTERVAL_MS)
+
+        Returns:
+            tuple: (Counter of collapsed stacks, number of samples), or None if a profile is already running
+        """
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            # Sample from this thread, so the caller itself never shows up
+            sampler = Sampler(self._interval(interval_ms))
+            own_id = threading.get_ident()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                sampler.sample(own_id)
+                time.sleep(sampler.interval)
+            return sampler.counts, sampler.samples
+        finally:
+            self._lock.release()
+
+    # ?profile=1
+
+    def _start_request(self):
+        if request.args.get('profile') != '1':
+            return
+        from app.api.leads import get_current_user
+        user = get_current_user()
+        if not user or not user.is_admin or not self._lock.acquire(blocking=False):
+            return
+        g.request_sampler = Sampler(self._interval(), thread_ids={threading.get_ident()})
+        g.request_sampler.start()
+
+    def _finish_request(self, response):
+        sampler = g.pop('request_sampler', None)
+        if sampler is None:
+            return response
+        try:
+            counts = sampler.stop()
+        finally:
+            self._lock.release()
+
+        # The profile replaces the response body
+        profiled = current_app.response_class(format_collapsed(counts), mimetype='text/plain')
+        profiled.headers['X-Profile-Samples'] = str(sampler.samples)
+        profiled.headers['X-Profiled-Status'] = str(response.status_code)
+        return profiled
+
+    def _abandon_request(self, exception=None):
+        # The view raised past after_request: stop sampling without a report
+        sampler = g.pop('request_sampler', None)
+        if sampler is not None:
+            sampler.stop()
+            self._lock.release()
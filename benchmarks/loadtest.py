@@ -0,0 +1,508 @@
+#!/usr/bin/env python
+"""
+HTTP load test for the lead marketplace.
+
+Runs each scenario for a fixed time with a number of concurrent virtual
+users and reports throughput and latency percentiles per endpoint:
+
+    dashboard    plumbers polling their dashboard (delta sync, notifications, claimed leads)
+    listing      lead listing with filters and keyword search (plumbers and admins)
+    submission   bursts of public lead submissions
+    reservation  every virtual user racing to reserve the same leads
+    admin        admin statistics and reports
+
+By default the app is started in a separate process against the configured
+database (fill it with generate_data.py first; the run reserves and adds
+leads, so use a throwaway dataset). Supabase is replaced by locally signed
+access tokens, Stripe by a stub server, the geocoder by a lookup of the
+generator's metro areas and mail sending is suppressed, so no external calls
+are made.
+With --url an already running server is targeted instead; it must share
+the database, SUPABASE_JWT_SECRET and a Stripe stub with this script.
+
+Usage:
+    python benchmarks/loadtest.py [--scenario listing --scenario admin] [--users 20] [--duration 30]
+                                  [--url http://localhost:5000] [--generate 100000]
+                                  [--baseline benchmarks/baseline.json] [--save-baseline benchmarks/baseline.json]
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jwt
+import requests
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+from generate_data import METROS, SERVICE_TYPES, TITLES
+
+LOADTEST_JWT_SECRET = 'loadtest-jwt-secret'
+PERCENTILES = (50, 90, 95, 99)
+DEFAULT_TOLERANCE = 0.2  # Allowed slowdown/throughput loss against the baseline
+
+class StripeStub(BaseHTTPRequestHandler):
+    """Answers Stripe API calls with minimal objects of the requested type."""
+
+    OBJECTS = {'payment_intents': 'payment_intent', 'checkout': 'checkout.session', 'refunds': 'refund'}
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        resource = self.path.split('?')[0].strip('/').split('/')[1:2] or ['']
+        object_type = self.OBJECTS.get(resource[0], resource[0].rstrip('s'))
+        object_id = f"{object_type[:2]}_{uuid.uuid4().hex[:24]}"
+        body = json.dumps({
+            'id': object_id,
+            'object': object_type,
+            'client_secret': f"{object_id}_secret_loadtest",
+            'status': 'requires_payment_method',
+            'url': f"http://localhost/checkout/{object_id}",
+            'amount_total': 0
+        }).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_DELETE = _reply
+
+    def log_message(self, format, *args):
+        pass
+
+class GeocoderStub:
+    """Places addresses in the generator's metro areas instead of calling Nominatim."""
+
+    class Location:
+        def __init__(self, latitude, longitude):
+            self.latitude = latitude
+            self.longitude = longitude
+
+    def geocode(self, query, **kwargs):
+        for city, state, latitude, longitude, spread, _, _ in METROS:
+            if f"{city}, {state}" in query:
+                rng = random.Random(query)
+                return self.Location(latitude + rng.gauss(0, spread), longitude + rng.gauss(0, spread))
+        return None
+
+def start_stripe_stub():
+    """Serve StripeStub on a free local port and return its base URL."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StripeStub)
+    threading.Thread(target=server.serve_forever, name='stripe-stub', daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+def loadtest_config(config_class):
+    """The app config with fakes for the external services."""
+    class LoadTestConfig(config_class):
+        SUPABASE_JWT_SECRET = LOADTEST_JWT_SECRET
+        STRIPE_SECRET_KEY = 'sk_test_loadtest'
+        MAIL_SUPPRESS_SEND = True
+        MAIL_DEFAULT_SENDER = 'loadtest@plumberleads.local'  # The outbox workers still build every message
+        WTF_CSRF_ENABLED = False  # API clients don't send CSRF tokens
+        SESSION_COOKIE_SECURE = False
+        QUERY_PROFILER_ENABLED = False  # Measure the app, not the development guardrails
+        QUERY_BUDGET_RAISE = False
+    return LoadTestConfig
+
+def _serve(config_class, port, stripe_url):
+    import logging
+    import stripe
+    from werkzeug.serving import make_server
+    from app import create_app
+    from app.utils import geocoding
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    stripe.api_base = stripe_url
+    geocoding._geolocator = GeocoderStub()
+    app = create_app(config_class)
+    app.logger.setLevel(logging.ERROR)
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+def start_app(config_class, stripe_url):
+    """Run the app in a child process (so it doesn't share the GIL with the clients) and return its URL."""
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = multiprocessing.Process(target=_serve, args=(config_class, port, stripe_url), daemon=True)
+    process.start()
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{url}/health", timeout=1).ok:
+                return url, process
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('The app did not start within 30 seconds')
+
+def access_token(user_id, secret):
+    """A Supabase-style access token for a user, signed with the project's JWT secret."""
+    return jwt.encode({
+        'sub': str(user_id),
+        'aud': 'authenticated',
+        'exp': datetime.utcnow() + timedelta(hours=12)
+    }, secret, algorithm='HS256')
+
+def build_context(app, secret, plumber_sample=200, reservation_targets=200):
+    """
+    Pick the users and leads the scenarios work with.
+
+    Returns:
+        dict: plumber and admin tokens, reservation targets and their contenders
+    """
+    from app import db
+    from app.models.lead import Lead
+    from app.models.user import User
+    from app.routes.plumber import calculate_distance
+
+    with app.app_context():
+        plumbers = User.query.filter_by(is_admin=False, is_active=True).filter(
+            User.latitude.isnot(None)).order_by(User.created_at).limit(plumber_sample).all()
+        if not plumbers:
+            raise RuntimeError('No plumbers in the database, run generate_data.py first')
+
+        admin = User.query.filter_by(is_admin=True).first()
+        if admin is None:
+            admin = User(email='loadtest-admin@example.com', full_name='Load Test Admin', company_name='PlumberLeads',
+                         phone='555-000-0000', is_admin=True, business_description='Load test account',
+                         license_number='ADMIN-LOADTEST', address='1 Admin St', city='San Jose', state='CA',
+                         zip_code='95110')
+            db.session.add(admin)
+            db.session.commit()
+
+        # The busiest metro: its plumbers all race for the same available leads
+        by_city = {}
+        for plumber in plumbers:
+            by_city.setdefault((plumber.city, plumber.state), []).append(plumber)
+        city, state = max(by_city, key=lambda key: len(by_city[key]))
+        candidates = Lead.query.filter_by(status='available', city=city, state=state).filter(
+            Lead.latitude.isnot(None)).order_by(Lead.created_at.desc()).limit(reservation_targets * 5).all()
+        # Contenders must have every target within their service radius
+        targets, contenders = [], by_city[(city, state)]
+        for lead in candidates:
+            covering = [plumber for plumber in contenders
+                        if calculate_distance(plumber.latitude, plumber.longitude, lead.latitude, lead.longitude)
+                        <= plumber.service_radius]
+            if len(covering) >= max(len(contenders) // 2, 2):
+                targets.append(str(lead.id))
+                contenders = covering
+            if len(targets) == reservation_targets:
+                break
+
+        return {
+            'plumbers': [access_token(plumber.id, secret) for plumber in plumbers],
+            'admin': access_token(admin.id, secret),
+            'reservation_targets': targets,
+            'contenders': [access_token(plumber.id, secret) for plumber in contenders] if targets else [],
+            'winners': {},  # lead id -> successful reservations
+            'winners_lock': threading.Lock()
+        }
+
+class Recorder:
+    """Latency samples per endpoint, appended from every virtual user thread."""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, elapsed, ok):
+        with self._lock:
+            self.samples.setdefault(name, []).append(elapsed)
+            if not ok:
+                self.errors[name] = self.errors.get(name, 0) + 1
+
+class Client:
+    """One virtual user: a keep-alive HTTP session that times every request."""
+
+    def __init__(self, base_url, recorder, token=None):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.session = requests.Session()
+        if token:
+            self.session.headers['Authorization'] = f"Bearer {token}"
+
+    def request(self, name, method, path, expect=(200,), **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+        except requests.RequestException:
+            self.recorder.record(name, time.perf_counter() - started, False)
+            return None
+        self.recorder.record(name, time.perf_counter() - started, response.status_code in expect)
+        return response
+
+    def get(self, name, path, **kwargs):
+        return self.request(name, 'GET', path, **kwargs)
+
+    def post(self, name, path, **kwargs):
+        return self.request(name, 'POST', path, **kwargs)
+
+# Scenarios: setup(context, user_number) returns the virtual user's token and
+# state, step(client, state, rng) performs one iteration
+
+def dashboard_setup(context, number):
+    return context['plumbers'][number % len(context['plumbers'])], {'cursor': None}
+
+def dashboard_step(client, state, rng):
+    if state['cursor'] is None:
+        response = client.get('GET /api/leads', '/api/leads?per_page=20')
+        if response is not None and response.ok:
+            state['cursor'] = response.json()['cursor']
+        return
+    response = client.get('GET /api/leads?since', f"/api/leads?since={state['cursor']}")
+    if response is not None and response.ok:
+        state['cursor'] = response.json()['cursor']
+    client.get('GET /api/notifications', '/api/notifications?unread=true')
+    client.get('GET /api/leads/claimed', '/api/leads/claimed')
+
+def listing_setup(context, number):
+    # One in five virtual users is an admin browsing every lead
+    if number % 5 == 4:
+        return context['admin'], {'admin': True}
+    return context['plumbers'][number % len(context['plumbers'])], {'admin': False}
+
+def listing_step(client, state, rng):
+    if state['admin']:
+        metro = rng.choice(METROS)
+        filters = rng.choice([
+            f"service_type={rng.choice(SERVICE_TYPES)}",
+            f"zip_code={rng.choice(metro[6])}",
+            'status=available',
+            f"status=claimed&service_type={rng.choice(SERVICE_TYPES)}",
+        ])
+        client.get('GET /api/leads (admin filters)', f"/api/leads?{filters}&page={rng.randint(1, 20)}&per_page=50")
+    else:
+        client.get('GET /api/leads', f"/api/leads?page={rng.randint(1, 5)}&per_page=20")
+    term = rng.choice(rng.choice(list(TITLES.values()))).split()[-1]
+    client.get('GET /api/leads/search', f"/api/leads/search?q={term}&page={rng.randint(1, 3)}")
+
+def submission_setup(context, number):
+    return None, {'number': number}
+
+def submission_step(client, state, rng):
+    city, lead_state, _, _, _, _, zip_codes = rng.choice(METROS)
+    service_type = rng.choice(SERVICE_TYPES)
+    marker = uuid.UUID(int=rng.getrandbits(128)).hex[:12]
+    client.post('POST /api/leads/submit', '/api/leads/submit', expect=(200, 201), json={
+        'title': rng.choice(TITLES[service_type]),
+        'description': f"Load test request {marker} for {service_type.lower()}.",
+        'customer_name': f"Load Test {marker}",
+        'customer_email': f"loadtest-{marker}@example.com",
+        'customer_phone': f"555-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}",
+        'address': f"{rng.randint(100, 9999)} Main St",
+        'city': city,
+        'state': lead_state,
+        'zip_code': rng.choice(zip_codes),
+        'service_type': service_type,
+        'urgency': rng.choice(['low', 'medium', 'high']),
+        'price': rng.randint(100, 800)
+    })
+
+def reservation_setup(context, number):
+    if not context['contenders']:
+        raise RuntimeError('No available lead with at least two plumbers in range to race for')
+    return context['contenders'][number % len(context['contenders'])], {
+        'targets': context['reservation_targets'], 'index': 0, 'winners': context['winners'],
+        'winners_lock': context['winners_lock']}
+
+def reservation_step(client, state, rng):
+    # Everyone walks the same target list, so each lead is raced for by every virtual user;
+    # one reservation wins (200) and the rest find the lead taken (400) or still being reserved (409)
+    if state['index'] >= len(state['targets']):
+        time.sleep(0.05)
+        return
+    lead_id = state['targets'][state['index']]
+    state['index'] += 1
+    response = client.post('POST /api/leads/<id>/reserve', f"/api/leads/{lead_id}/reserve", expect=(200, 400, 409))
+    if response is not None and response.status_code == 200:
+        with state['winners_lock']:
+            state['winners'][lead_id] = state['winners'].get(lead_id, 0) + 1
+
+def admin_setup(context, number):
+    return context['admin'], {}
+
+def admin_step(client, state, rng):
+    days = rng.choice([7, 30, 90])
+    client.get('GET /api/admin/stats', f"/api/admin/stats?days={days}")
+    client.get('GET /api/admin/reports/user-activity', f"/api/admin/reports/user-activity?days={days}")
+    client.get('GET /api/admin/reports/lead-conversion', f"/api/admin/reports/lead-conversion?days={days}")
+
+SCENARIOS = {
+    'dashboard': (dashboard_setup, dashboard_step),
+    'listing': (listing_setup, listing_step),
+    'submission': (submission_setup, submission_step),
+    'reservation': (reservation_setup, reservation_step),
+    'admin': (admin_setup, admin_step),
+}
+
+def run_scenario(name, base_url, context, users, duration, seed):
+    """
+    Run one scenario with users concurrent virtual users for duration seconds.
+
+    Returns:
+        dict: endpoint -> latency and throughput summary
+    """
+    setup, step = SCENARIOS[name]
+    recorder = Recorder()
+    stop = threading.Event()
+    start = threading.Barrier(users + 1)
+
+    def virtual_user(number):
+        token, state = setup(context, number)
+        client = Client(base_url, recorder, token)
+        rng = random.Random(f"{seed}:{name}:{number}")
+        start.wait()
+        while not stop.is_set():
+            step(client, state, rng)
+
+    threads = [threading.Thread(target=virtual_user, args=(number,), daemon=True) for number in range(users)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.monotonic()
+    stop.wait(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    return summarize(recorder, elapsed)
+
+def _percentile(ordered, percentile):
+    # Nearest-rank percentile of a sorted list
+    return ordered[max(math.ceil(percentile / 100 * len(ordered)) - 1, 0)]
+
+def summarize(recorder, elapsed):
+    summary = {}
+    for endpoint, samples in sorted(recorder.samples.items()):
+        ordered = sorted(samples)
+        summary[endpoint] = {
+            'requests': len(ordered),
+            'errors': recorder.errors.get(endpoint, 0),
+            'rps': len(ordered) / elapsed,
+            **{f"p{percentile}_ms": _percentile(ordered, percentile) * 1000 for percentile in PERCENTILES},
+            'max_ms': ordered[-1] * 1000
+        }
+    return summary
+
+def print_results(results):
+    header = f"{'endpoint':<42} {'reqs':>7} {'errs':>5} {'req/s':>8}" + ''.join(
+        f" {f'p{percentile}':>8}" for percentile in PERCENTILES) + f" {'max':>8}"
+    for scenario, endpoints in results.items():
+        print(f"\n[{scenario}]")
+        print(header)
+        for endpoint, stats in endpoints.items():
+            print(f"{endpoint:<42} {stats['requests']:>7} {stats['errors']:>5} {stats['rps']:>8.1f}" + ''.join(
+                f" {stats[f'p{percentile}_ms']:>8.1f}" for percentile in PERCENTILES) + f" {stats['max_ms']:>8.1f}")
+    print('\nLatencies in milliseconds')
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a stored baseline.
+
+    Returns:
+        list: One message per endpoint whose p95 latency grew or throughput fell by more than tolerance
+    """
+    regressions = []
+    for scenario, endpoints in results.items():
+        for endpoint, stats in endpoints.items():
+            base = baseline.get(scenario, {}).get(endpoint)
+            if not base:
+                continue
+            if stats['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{scenario} {endpoint}: p95 {stats['p95_ms']:.1f} ms, baseline {base['p95_ms']:.1f} ms")
+            if stats['rps'] < base['rps'] * (1 - tolerance):
+                regressions.append(f"{scenario} {endpoint}: {stats['rps']:.1f} req/s, baseline {base['rps']:.1f} req/s")
+            if stats['errors'] > base.get('errors', 0):
+                regressions.append(f"{scenario} {endpoint}: {stats['errors']} errors, baseline {base.get('errors', 0)}")
+    return regressions
+
+def main():
+    from config import config
+
+    parser = argparse.ArgumentParser(description='Load test the lead marketplace API')
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                        help='Scenario to run (repeatable, default: all)')
+    parser.add_argument('--users', type=int, default=20, help='Concurrent virtual users per scenario')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds per scenario')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the virtual users')
+    parser.add_argument('--url', help='Target an already running server instead of starting one')
+    parser.add_argument('--generate', type=int, metavar='LEADS',
+                        help='Create the tables and generate this many leads first (see generate_data.py)')
+    parser.add_argument('--baseline', help='Compare against this baseline file and exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed relative p95 growth / throughput loss against the baseline')
+    parser.add_argument('--save-baseline', help='Write the results to this file')
+    args = parser.parse_args()
+
+    config_class = loadtest_config(config[os.environ.get('FLASK_ENV', 'default')])
+    if args.generate:
+        import generate_data
+        from app import create_app, db
+
+        with create_app(config_class).app_context():
+            db.create_all()
+        generate_data.generate(args.generate, max(args.generate // 200, 50), args.seed,
+                               datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0),
+                               365, os.cpu_count() or 1, False, config_class)
+
+    from app import create_app
+    app = create_app(config_class)
+    secret = os.environ.get('SUPABASE_JWT_SECRET') if args.url else LOADTEST_JWT_SECRET
+    if not secret:
+        parser.error('--url needs SUPABASE_JWT_SECRET set to the target server\'s value')
+    context = build_context(app, secret)
+
+    process = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        base_url, process = start_app(config_class, start_stripe_stub())
+
+    results = {}
+    try:
+        for name in args.scenario or list(SCENARIOS):
+            print(f"Running {name} with {args.users} users for {args.duration:.0f}s...")
+            results[name] = run_scenario(name, base_url, context, args.users, args.duration, args.seed)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+
+    print_results(results)
+    if 'reservation' in results:
+        double = sum(1 for wins in context['winners'].values() if wins > 1)
+        print(f"Leads reserved by more than one plumber: {double}")
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+if __name__ == '__main__':
+    main()
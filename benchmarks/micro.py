@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+Micro-benchmarks for helpers that run once per lead or plumber in list views.
+
+Each benchmark times one call of a helper on realistic objects built from
+generate_data.py rows (no database needed) and reports the per-item cost.
+Batch helpers are registered with the number of items they handle per call,
+so they can be compared directly with their one-at-a-time counterparts; add
+new helpers with the @benchmark decorator.
+
+Results can be saved as a baseline and later runs compared against it, so a
+helper that gets slower (for example Lead.to_dict after a model gains
+columns) fails the run.
+
+Usage:
+    python benchmarks/micro.py [--filter to_dict] [--repeat 5]
+                               [--baseline benchmarks/micro_baseline.json] [--save-baseline benchmarks/micro_baseline.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+PAGE_SIZE = 100  # Leads per page for the batch benchmarks
+DEFAULT_TOLERANCE = 0.25  # Allowed per-item slowdown against the baseline
+MIN_TIME = 0.2  # Seconds each timing run should last at least
+
+# name -> (factory, items per call); factory(fixtures) returns the callable to time
+BENCHMARKS = {}
+
+def benchmark(name, items=1):
+    """Register a benchmark; items is how many leads/plumbers one call handles."""
+    def decorator(factory):
+        BENCHMARKS[name] = (factory, items)
+        return factory
+    return decorator
+
+class Fixtures:
+    """Transient leads and plumbers built from generated rows."""
+
+    def __init__(self, seed=42):
+        import generate_data
+        from app.models.lead import Lead
+        from app.models.user import User
+        from app.utils.pricing import pricing_snapshot
+
+        end = datetime(2024, 1, 1)
+        users, areas, types = generate_data.generate_plumbers(20, seed, end)
+        areas_by_user, types_by_user = {}, {}
+        for area in areas:
+            areas_by_user.setdefault(area['user_id'], []).append(area['area'])
+        for service_type in types:
+            types_by_user.setdefault(service_type['user_id'], []).append(service_type['service_type'])
+        self.plumbers = [User(service_areas=areas_by_user[user['id']], service_types=types_by_user[user['id']], **user)
+                         for user in users]
+
+        plumbers_by_city = {}
+        for user in users:
+            plumbers_by_city.setdefault((user['city'], user['state']), []).append(user['id'])
+        leads, _, _ = generate_data.generate_chunk(0, PAGE_SIZE, seed, end, 365, plumbers_by_city, 1, pricing_snapshot())
+        self.leads = [Lead(**lead) for lead in leads]
+        self.lead = self.leads[0]
+        self.plumber = self.plumbers[0]
+
+@benchmark('calculate_distance')
+def bench_calculate_distance(fixtures):
+    from app.routes.plumber import calculate_distance
+    plumber, lead = fixtures.plumber, fixtures.lead
+    return lambda: calculate_distance(plumber.latitude, plumber.longitude, lead.latitude, lead.longitude)
+
+@benchmark('calculate_distance (page of leads)', items=PAGE_SIZE)
+def bench_calculate_distance_page(fixtures):
+    from app.routes.plumber import calculate_distance
+    plumber, leads = fixtures.plumber, fixtures.leads
+    return lambda: [calculate_distance(plumber.latitude, plumber.longitude, lead.latitude, lead.longitude)
+                    for lead in leads]
+
+@benchmark('calculate_lead_price')
+def bench_calculate_lead_price(fixtures):
+    from app.utils.pricing import calculate_lead_price
+    price = fixtures.lead.price
+    return lambda: calculate_lead_price(price)
+
+@benchmark('price_leads (page of leads)', items=PAGE_SIZE)
+def bench_price_leads(fixtures):
+    from app.utils.pricing import price_leads
+    leads = fixtures.leads
+    return lambda: price_leads(leads)
+
+@benchmark('Lead.to_dict')
+def bench_lead_to_dict(fixtures):
+    lead = fixtures.lead
+    return lambda: lead.to_dict()
+
+@benchmark('Lead.to_dict (page of leads)', items=PAGE_SIZE)
+def bench_lead_to_dict_page(fixtures):
+    leads = fixtures.leads
+    return lambda: [lead.to_dict() for lead in leads]
+
+@benchmark('User.get_service_areas')
+def bench_get_service_areas(fixtures):
+    plumber = fixtures.plumber
+    return lambda: plumber.get_service_areas()
+
+@benchmark('User.get_service_types')
+def bench_get_service_types(fixtures):
+    plumber = fixtures.plumber
+    return lambda: plumber.get_service_types()
+
+@benchmark('LeadHistory.log_status_change')
+def bench_log_status_change(fixtures):
+    from app.models.lead_history import LeadHistory
+    lead, user_id = fixtures.lead, fixtures.plumber.id
+    return lambda: LeadHistory.log_status_change(lead, 'available', 'reserved', user_id)
+
+@benchmark('LeadHistory.log_price_change')
+def bench_log_price_change(fixtures):
+    from app.models.lead_history import LeadHistory
+    lead, user_id = fixtures.lead, fixtures.plumber.id
+    return lambda: LeadHistory.log_price_change(lead, 250.0, 275.0, user_id)
+
+@benchmark('LeadHistory.log_reservation')
+def bench_log_reservation(fixtures):
+    from app.models.lead_history import LeadHistory
+    lead, user_id = fixtures.lead, fixtures.plumber.id
+    return lambda: LeadHistory.log_reservation(lead, user_id)
+
+def measure(function, repeat):
+    """
+    Time a callable.
+
+    Returns:
+        dict: best and median seconds per call over repeat runs
+    """
+    timer = timeit.Timer(function)
+    loops, elapsed = timer.autorange()
+    if elapsed < MIN_TIME:
+        loops = max(int(loops * MIN_TIME / max(elapsed, 1e-9)), 1)
+    runs = sorted(total / loops for total in timer.repeat(repeat=repeat, number=loops))
+    return {'best': runs[0], 'median': runs[len(runs) // 2]}
+
+def run(names, repeat):
+    """
+    Run the named benchmarks.
+
+    Returns:
+        dict: name -> best and median per-item cost in microseconds
+    """
+    fixtures = Fixtures()
+    results = {}
+    for name in names:
+        factory, items = BENCHMARKS[name]
+        timing = measure(factory(fixtures), repeat)
+        results[name] = {
+            'items': items,
+            'best_us': timing['best'] / items * 1e6,
+            'median_us': timing['median'] / items * 1e6
+        }
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+    Compare per-item costs with a stored baseline.
+
+    Returns:
+        list: One message per benchmark slower than its baseline by more than tolerance
+    """
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if base and stats['best_us'] > base['best_us'] * (1 + tolerance):
+            regressions.append(f"{name}: {stats['best_us']:.3f} us per item, baseline {base['best_us']:.3f} us")
+    return regressions
+
+def main():
+    from app import create_app
+    from config import TestingConfig
+
+    parser = argparse.ArgumentParser(description='Micro-benchmark per-lead helper functions')
+    parser.add_argument('--filter', help='Only run benchmarks whose name contains this text')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing runs per benchmark (the best one counts)')
+    parser.add_argument('--baseline', help='Compare against this baseline file and exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='Allowed relative per-item slowdown against the baseline')
+    parser.add_argument('--save-baseline', help='Write the results to this file')
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if not args.filter or args.filter.lower() in name.lower()]
+    with create_app(TestingConfig).app_context():
+        results = run(names, args.repeat)
+
+    print(f"{'benchmark':<40} {'items':>6} {'best us/item':>13} {'median us/item':>15} {'items/s':>12}")
+    for name, stats in results.items():
+        print(f"{name:<40} {stats['items']:>6} {stats['best_us']:>13.3f} {stats['median_us']:>15.3f} "
+              f"{1e6 / stats['best_us']:>12,.0f}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+if __name__ == '__main__':
+    main()
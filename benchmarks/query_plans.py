@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+"""
+Query-plan checks for the hot lead and payment queries.
+
+Runs each hot query the way the app issues it against the configured
+(seeded) database, captures the SQL, EXPLAINs it on the same connection and
+fails when the plan reads leads or payments with a sequential scan instead
+of an index. Dropping or reshaping an index otherwise only shows up as
+production latency.
+
+On PostgreSQL the plans are taken with enable_seqscan off, so a sequential
+scan means no index can serve the query at all, whatever the table size.
+On SQLite, EXPLAIN QUERY PLAN is used and a full "SCAN" of a checked table
+fails.
+
+Usage:
+    python benchmarks/query_plans.py [--generate 50000] [--output plans.json] [--verbose]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+CHECKED_TABLES = ('leads', 'payments')
+MIN_LEADS = 1000  # Below this the dataset says little about the plans
+
+# name -> function(sample) running the query; registered in the order they are checked
+HOT_QUERIES = {}
+
+def hot_query(name):
+    def decorator(function):
+        HOT_QUERIES[name] = function
+        return function
+    return decorator
+
+@hot_query('available leads for a plumber (service areas and types)')
+def available_leads_for_plumber(sample):
+    from flask import current_app
+    from app.api.leads import filter_plumber_leads
+    from app.models.lead import Lead
+
+    with current_app.test_request_context('/api/leads'):
+        query = filter_plumber_leads(Lead.query.filter_by(status='available'), sample['plumber'])
+        query.order_by(Lead.created_at.desc()).paginate(page=1, per_page=10, error_out=False)
+
+@hot_query('available leads by ZIP code and service type')
+def available_leads_by_zip_and_type(sample):
+    from app.models.lead import Lead
+
+    Lead.query.filter_by(status='available', zip_code=sample['zip_code'], service_type=sample['service_type']) \
+        .order_by(Lead.created_at.desc()).limit(10).all()
+
+@hot_query('leads by status, newest first')
+def leads_by_status(sample):
+    from app.models.lead import Lead
+
+    Lead.query.filter_by(status='claimed').order_by(Lead.created_at.desc()).limit(10).all()
+
+@hot_query('claimed leads of a plumber')
+def claimed_leads_of_plumber(sample):
+    from app.models.lead import Lead
+
+    Lead.query.filter_by(claimed_by_id=sample['claimer_id']).order_by(Lead.claimed_at.desc()).limit(10).all()
+
+@hot_query('reserved leads of a plumber')
+def reserved_leads_of_plumber(sample):
+    from app.models.lead import Lead
+
+    Lead.query.filter_by(reserved_by_id=sample['claimer_id'], status='reserved').all()
+
+@hot_query('payment by processor payment id')
+def payment_by_processor_id(sample):
+    from app.models.payment import Payment
+
+    Payment.query.filter_by(processor_payment_id=sample['processor_payment_id']).first()
+
+@hot_query('payment for a reservation')
+def payment_for_reservation(sample):
+    from app.models.payment import Payment
+
+    Payment.query.filter_by(lead_id=sample['paid_lead_id'], user_id=sample['claimer_id']).first()
+
+@hot_query('expired reservation sweep')
+def expired_reservations(sample):
+    from app.models.lead import Lead
+
+    Lead.query.filter(Lead.status == 'reserved', Lead.reserved_at < datetime.utcnow() - timedelta(minutes=60)).all()
+
+@hot_query('nearby leads within the service radius')
+def nearby_leads(sample):
+    from sqlalchemy import func
+    from app import db
+    from app.models.lead import Lead
+    from app.utils.regions import bounding_box, regions_within
+
+    plumber = sample['plumber']
+    min_lat, max_lat, min_lng, max_lng = bounding_box(plumber.latitude, plumber.longitude, plumber.service_radius)
+    filters = [Lead.region.in_(regions_within(plumber.latitude, plumber.longitude, plumber.service_radius)),
+               Lead.status == 'available', Lead.latitude.between(min_lat, max_lat), Lead.longitude.between(min_lng, max_lng)]
+    if db.engine.dialect.name == 'postgresql':
+        # Same exact check as the plumber nearby-leads page
+        filters.append(func.earth_distance(
+            func.ll_to_earth(Lead.latitude, Lead.longitude),
+            func.ll_to_earth(plumber.latitude, plumber.longitude)
+        ) <= plumber.service_radius * 1609.34)
+    Lead.query.filter(*filters).all()
+
+def pick_sample():
+    """Users, leads and payments the hot queries look up."""
+    from sqlalchemy import func
+    from app import db
+    from app.models.lead import Lead
+    from app.models.payment import Payment
+    from app.models.user import User
+    from app.models.user_service import UserServiceArea
+
+    lead_count = Lead.query.count()
+    if lead_count < MIN_LEADS:
+        raise RuntimeError(f"Only {lead_count} leads in the database, generate at least {MIN_LEADS} "
+                           f"(python generate_data.py, or --generate)")
+
+    plumber = User.query.filter(User.is_admin == False, User.latitude.isnot(None),
+                                User.id.in_(db.session.query(UserServiceArea.user_id))).first()
+    payment = Payment.query.first()
+    lead = Lead.query.filter_by(status='available').first()
+    if plumber is None or payment is None or lead is None:
+        raise RuntimeError('The dataset needs plumbers with service areas, payments and available leads')
+    claimer_id = db.session.query(Lead.claimed_by_id).filter(Lead.claimed_by_id.isnot(None)) \
+        .group_by(Lead.claimed_by_id).order_by(func.count().desc()).limit(1).scalar()
+
+    return {
+        'plumber': plumber,
+        'claimer_id': claimer_id or plumber.id,
+        'processor_payment_id': payment.processor_payment_id,
+        'paid_lead_id': payment.lead_id,
+        'zip_code': lead.zip_code,
+        'service_type': lead.service_type
+    }
+
+@contextmanager
+def capture_statements(engine):
+    """Collect (statement, parameters) of every SELECT run on the engine inside the block."""
+    from sqlalchemy import event
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+def explain(connection, statement, parameters):
+    """
+    EXPLAIN a statement on a DBAPI connection.
+
+    Returns:
+        tuple: (plan text lines, list of (table, reason) for sequential scans of checked tables)
+    """
+    cursor = connection.cursor()
+    try:
+        if connection.__class__.__module__.startswith('sqlite3'):
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            details = [row[3] for row in cursor.fetchall()]
+            scans = [(table, detail) for detail in details for table in CHECKED_TABLES
+                     if detail.split()[:2] == ['SCAN', table]]
+            return details, scans
+
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+        plan = cursor.fetchone()[0]
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        lines, scans = [], []
+
+        def walk(node, depth):
+            relation = node.get('Relation Name')
+            index = node.get('Index Name')
+            lines.append('  ' * depth + node['Node Type'] + (f" on {relation}" if relation else '')
+                         + (f" using {index}" if index else ''))
+            if node['Node Type'] == 'Seq Scan' and relation in CHECKED_TABLES:
+                scans.append((relation, lines[-1].strip()))
+            for child in node.get('Plans', []):
+                walk(child, depth + 1)
+
+        walk(plan[0]['Plan'], 0)
+        return lines, scans
+    finally:
+        cursor.close()
+
+def check_plans(names=None):
+    """
+    Run and EXPLAIN the hot queries.
+
+    Returns:
+        dict: query name -> statements with their SQL, plan and sequential scans
+    """
+    from app import db
+
+    sample = pick_sample()
+    results = {}
+    for name, function in HOT_QUERIES.items():
+        if names and name not in names:
+            continue
+        with capture_statements(db.engine) as statements:
+            function(sample)
+        db.session.rollback()
+
+        checked = []
+        with db.engine.connect() as connection:
+            dbapi_connection = connection.connection.driver_connection
+            if db.engine.dialect.name == 'postgresql':
+                connection.exec_driver_sql('SET enable_seqscan = off')
+            for statement, parameters in statements:
+                plan, scans = explain(dbapi_connection, statement, parameters)
+                checked.append({'sql': statement, 'plan': plan, 'sequential_scans': [table for table, _ in scans]})
+            if db.engine.dialect.name == 'postgresql':
+                connection.exec_driver_sql('RESET enable_seqscan')
+            connection.rollback()
+        results[name] = checked
+    return results
+
+def main():
+    from app import create_app, db
+    from config import config
+
+    parser = argparse.ArgumentParser(description='Check that the hot queries are served by indexes')
+    parser.add_argument('--generate', type=int, metavar='LEADS',
+                        help='Create the tables and generate this many leads first (see generate_data.py)')
+    parser.add_argument('--output', help='Write the SQL and plans of every query to this JSON file')
+    parser.add_argument('--verbose', action='store_true', help='Print the SQL and plan of passing queries too')
+    args = parser.parse_args()
+
+    class PlanConfig(config[os.environ.get('FLASK_ENV', 'default')]):
+        QUERY_PROFILER_ENABLED = False
+
+    app = create_app(PlanConfig)
+    if args.generate:
+        import generate_data
+
+        with app.app_context():
+            db.create_all()
+        generate_data.generate(args.generate, max(args.generate // 200, 50), 42,
+                               datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0),
+                               365, os.cpu_count() or 1, False, PlanConfig)
+
+    with app.app_context():
+        if db.engine.dialect.name not in ('postgresql', 'sqlite'):
+            parser.error(f"Plans can only be checked on PostgreSQL and SQLite, not {db.engine.dialect.name}")
+        results = check_plans()
+
+    failures = 0
+    for name, statements in results.items():
+        scanned = sorted({table for statement in statements for table in statement['sequential_scans']})
+        failures += bool(scanned)
+        print(f"{'FAIL' if scanned else 'ok  '} {name}" + (f" (sequential scan of {', '.join(scanned)})" if scanned else ''))
+        if scanned or args.verbose:
+            for statement in statements:
+                # The column list is noise when reading a plan
+                sql = re.sub(r'^SELECT .*?\sFROM', 'SELECT ... FROM', statement['sql'].strip(), count=1, flags=re.S)
+                print('\n'.join('       ' + line for line in sql.splitlines()))
+                print('\n'.join('     > ' + line for line in statement['plan']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved plans to {args.output}")
+    if failures:
+        print(f"{failures} of {len(results)} hot queries are not served by an index")
+        sys.exit(1)
+    print(f"All {len(results)} hot queries use indexes")
+
+if __name__ == '__main__':
+    main()
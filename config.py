@@ -8,6 +8,30 @@ from datetime import timedelta
 # Load environment variables from .env file
 load_dotenv()
 
+def engine_options(database_uri, pool_size, max_overflow, pool_timeout, pool_recycle, pre_ping, statement_timeout_ms):
+    """SQLAlchemy engine options for the primary database (Flask-SQLAlchemy applies them to the replica bind too)."""
+    options = {'pool_pre_ping': pre_ping}
+    if database_uri.startswith('sqlite'):
+        # A local file: no server to time out, fail over or run out of connections
+        return options
+    options.update(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout, pool_recycle=pool_recycle)
+    if statement_timeout_ms and database_uri.startswith(('postgresql', 'postgres')):
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout_ms}'}
+    return options
+
+def without_statement_timeout(config_class):
+    """
+    config_class for command line tools (migrate_db.py, generate_data.py) whose whole-table
+    backfills and index builds legitimately run far longer than any web request.
+    """
+    class BatchConfig(config_class):
+        DB_STATEMENT_TIMEOUT_MS = 0
+        SQLALCHEMY_ENGINE_OPTIONS = engine_options(config_class.SQLALCHEMY_DATABASE_URI, config_class.DB_POOL_SIZE,
+                                                   config_class.DB_MAX_OVERFLOW, config_class.DB_POOL_TIMEOUT,
+                                                   config_class.DB_POOL_RECYCLE, config_class.DB_POOL_PRE_PING, 0)
+    BatchConfig.__name__ = config_class.__name__
+    return BatchConfig
+
 class Config:
     """Base configuration."""
     # Flask settings
@@ -26,6 +50,27 @@ class Config:
         # To work with SQLAlchemy 1.4+, update postgres:// to postgresql://
         SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace('postgres://', 'postgresql://')
     
+    # Read replica for list and report endpoints (see app/utils/db_routing.py); unset = primary only
+    SQLALCHEMY_REPLICA_URI = os.environ.get('DATABASE_REPLICA_URL')
+    if SQLALCHEMY_REPLICA_URI and SQLALCHEMY_REPLICA_URI.startswith('postgres://'):
+        SQLALCHEMY_REPLICA_URI = SQLALCHEMY_REPLICA_URI.replace('postgres://', 'postgresql://')
+    SQLALCHEMY_BINDS = {'replica': SQLALCHEMY_REPLICA_URI} if SQLALCHEMY_REPLICA_URI else {}
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))  # Staler replicas are bypassed
+    REPLICA_LAG_CHECK_SECONDS = float(os.environ.get('REPLICA_LAG_CHECK_SECONDS', 1))  # Per process
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))  # Reads stay on the primary after a user's write; keep above REPLICA_MAX_LAG_SECONDS. Per process for bearer token clients
+    
+    # Connection pool, per process (pool size + overflow, times workers, must fit the server's max_connections).
+    # A request can hold two connections at once (db.session's and a short one for a lock lease or the
+    # session store), so keep pool size + overflow at least twice the threads per worker
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))  # Extra connections opened under bursts, closed when returned
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))  # Seconds to wait for a free connection before failing
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # Seconds before a connection is replaced; below proxy idle timeouts
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'True').lower() in ['true', '1', 't']  # Replace dead connections (e.g. after a failover) on checkout
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))  # PostgreSQL statement_timeout; 0 = none
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+                                               DB_POOL_RECYCLE, DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT_MS)
+    
     # File upload settings
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or os.path.join(os.path.abspath(os.path.dirname(__file__)), 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB
@@ -39,6 +84,13 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
     
+    # Email outbox delivery
+    MAIL_OUTBOX_WORKERS = int(os.environ.get('MAIL_OUTBOX_WORKERS', 2))
+    MAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('MAIL_OUTBOX_BATCH_SIZE', 50))  # Emails sent per SMTP connection
+    MAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('MAIL_OUTBOX_MAX_ATTEMPTS', 5))
+    MAIL_OUTBOX_RETRY_BASE_SECONDS = int(os.environ.get('MAIL_OUTBOX_RETRY_BASE_SECONDS', 60))
+    MAIL_OUTBOX_CLAIM_TIMEOUT = int(os.environ.get('MAIL_OUTBOX_CLAIM_TIMEOUT', 600))  # Seconds before a stuck claim is retried
+    
     # Stripe settings
     STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
     STRIPE_PUBLIC_KEY = os.environ.get('STRIPE_PUBLIC_KEY')
@@ -48,12 +100,72 @@ class Config:
     # Supabase settings
     SUPABASE_URL = os.environ.get('SUPABASE_URL')
     SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
+    SUPABASE_JWT_SECRET = os.environ.get('SUPABASE_JWT_SECRET')  # Used to verify access tokens locally
+    SUPABASE_POOL_SIZE = int(os.environ.get('SUPABASE_POOL_SIZE', 10))
+    SUPABASE_POOL_TIMEOUT = float(os.environ.get('SUPABASE_POOL_TIMEOUT', 5))  # Seconds to wait for a free client
+    SUPABASE_TOKEN_CACHE_SIZE = int(os.environ.get('SUPABASE_TOKEN_CACHE_SIZE', 10000))
     
     # Local development mode
     LOCAL_DEV = os.environ.get('LOCAL_DEV', 'False').lower() in ['true', '1', 't']
     
     # Lead reservation settings
     LEAD_RESERVATION_EXPIRY_MINUTES = int(os.environ.get('LEAD_RESERVATION_EXPIRY_MINUTES', 15))
+    
+    # Locks shared by every host (see app/services/locks.py)
+    LOCK_TTL_SECONDS = int(os.environ.get('LOCK_TTL_SECONDS', 60))  # Lease length; above the slowest Stripe call and the hosts' clock skew
+    LOCK_WAIT_SECONDS = float(os.environ.get('LOCK_WAIT_SECONDS', 5))  # How long payment completion, release and webhooks wait for a busy lead
+
+    # New lead notifications
+    APP_BASE_URL = os.environ.get('APP_BASE_URL', 'http://localhost:5000')  # Used for links in emails sent outside a request
+    NOTIFY_WORKERS = int(os.environ.get('NOTIFY_WORKERS', 2))
+    NOTIFY_QUEUE_SIZE = int(os.environ.get('NOTIFY_QUEUE_SIZE', 100))
+    NOTIFY_MAX_RADIUS_MILES = int(os.environ.get('NOTIFY_MAX_RADIUS_MILES', 100))  # Upper bound of any plumber's service radius
+    NOTIFY_MAX_PER_HOUR = int(os.environ.get('NOTIFY_MAX_PER_HOUR', 50))  # In-app notifications per plumber
+    NOTIFY_DIGEST_INTERVAL_MINUTES = int(os.environ.get('NOTIFY_DIGEST_INTERVAL_MINUTES', 30))
+    NOTIFY_URGENT_DIGEST_INTERVAL_MINUTES = int(os.environ.get('NOTIFY_URGENT_DIGEST_INTERVAL_MINUTES', 5))
+
+    # Live lead feed (server-sent events)
+    LEAD_EVENTS_BACKEND = os.environ.get('LEAD_EVENTS_BACKEND', 'memory')  # memory (single process) or postgres (LISTEN/NOTIFY)
+    LEAD_EVENTS_QUEUE_SIZE = int(os.environ.get('LEAD_EVENTS_QUEUE_SIZE', 100))  # Events buffered per subscriber
+    LEAD_FEED_HEARTBEAT_SECONDS = int(os.environ.get('LEAD_FEED_HEARTBEAT_SECONDS', 15))
+    LEAD_FEED_MAX_DURATION_SECONDS = int(os.environ.get('LEAD_FEED_MAX_DURATION_SECONDS', 900))  # Clients reconnect after this
+    LEAD_FEED_MAX_SUBSCRIBERS = int(os.environ.get('LEAD_FEED_MAX_SUBSCRIBERS', 500))
+    
+    # HTTP response caching
+    HTTP_CACHE_SIZE = int(os.environ.get('HTTP_CACHE_SIZE', 2048))  # Rendered JSON bodies kept in memory; only with LEAD_EVENTS_BACKEND=postgres
+    HTTP_CACHE_TTL = int(os.environ.get('HTTP_CACHE_TTL', 60))  # Seconds a rendered body is kept, in case an invalidating event was lost
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 5000))  # Rendered lead cards/details kept in memory
+    LEADS_PER_PAGE = int(os.environ.get('LEADS_PER_PAGE', 24))
+    REFERENCE_DATA_MAX_AGE = int(os.environ.get('REFERENCE_DATA_MAX_AGE', 3600))  # Seconds clients may reuse service areas/types
+
+    # Bulk lead import
+    PARTNER_API_KEYS = os.environ.get('PARTNER_API_KEYS', '')  # Comma separated key:source pairs for POST /api/leads/bulk
+    LEAD_IMPORT_MAX_ROWS = int(os.environ.get('LEAD_IMPORT_MAX_ROWS', 5000))  # Per request
+    LEAD_IMPORT_CHUNK_SIZE = int(os.environ.get('LEAD_IMPORT_CHUNK_SIZE', 500))  # Rows per INSERT/transaction
+    LEAD_IMPORT_GEOCODE = os.environ.get('LEAD_IMPORT_GEOCODE', 'True').lower() in ['true', '1', 't']  # CSV imports; the bulk API never geocodes inline
+
+    # Duplicate lead detection
+    LEAD_DEDUPE_MODE = os.environ.get('LEAD_DEDUPE_MODE', 'flag')  # off, flag (store as status 'duplicate') or merge (drop)
+    LEAD_DEDUPE_WINDOW_DAYS = int(os.environ.get('LEAD_DEDUPE_WINDOW_DAYS', 30))  # How far back to look for the original
+    LEAD_DEDUPE_MAX_DISTANCE = int(os.environ.get('LEAD_DEDUPE_MAX_DISTANCE', 12))  # SimHash bits that may differ (unrelated texts differ in ~32)
+
+    # Performance metrics on /metrics (Prometheus text format)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True').lower() in ['true', '1', 't']
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token required to scrape; unset leaves /metrics open
+    METRICS_REQUIRE_TOKEN = False  # Without METRICS_TOKEN, don't serve /metrics at all
+
+    # SQL profiling (development, staging and tests; see app/utils/query_profiler.py)
+    QUERY_PROFILER_ENABLED = os.environ.get('QUERY_PROFILER_ENABLED', 'False').lower() in ['true', '1', 't']
+    SLOW_QUERY_THRESHOLD_MS = int(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 200))  # Log statements slower than this with their plan
+    SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'True').lower() in ['true', '1', 't']
+    QUERY_REPEAT_THRESHOLD = int(os.environ.get('QUERY_REPEAT_THRESHOLD', 5))  # Same statement shape this often in one request = likely N+1
+    QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', 0)) or None  # Statements allowed per request (None = unlimited; views can set their own)
+    QUERY_BUDGET_RAISE = False  # Fail the request instead of logging when the budget is exceeded
+
+    # Sampling profiler (idle until an admin asks for a profile)
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'True').lower() in ['true', '1', 't']  # Allow ?profile=1 on requests
+    PROFILER_INTERVAL_MS = int(os.environ.get('PROFILER_INTERVAL_MS', 5))  # Milliseconds between stack samples
+    PROFILER_MAX_SECONDS = int(os.environ.get('PROFILER_MAX_SECONDS', 60))  # Longest /api/admin/profile run (threaded workers only; it holds a request thread throughout)
 
     MINIMUM_LEAD_PRICE = float(os.environ.get('MINIMUM_LEAD_PRICE', 30.00))
     LEAD_CLAIM_PERCENTAGE = float(os.environ.get('LEAD_CLAIM_PERCENTAGE', 0.15))
@@ -71,7 +183,12 @@ class Config:
     ]
 
     # Session configuration
-    SESSION_TYPE = 'filesystem'
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'tiered')  # memory, sql or tiered (LRU + sql)
+    SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 10000))
+    SESSION_CACHE_TTL = int(os.environ.get('SESSION_CACHE_TTL', 5))  # Seconds a session may be served from the local LRU
+    SESSION_REFRESH_INTERVAL = int(os.environ.get('SESSION_REFRESH_INTERVAL', 300))  # Seconds before an unchanged session's expiry is extended
+    SESSION_COMPRESS_THRESHOLD = 512  # Bytes
+    SESSION_CLEANUP_BATCH_SIZE = int(os.environ.get('SESSION_CLEANUP_BATCH_SIZE', 1000))
     SESSION_PERMANENT = True
     PERMANENT_SESSION_LIFETIME = timedelta(days=1)
     SESSION_COOKIE_SECURE = True  # Set to True in production
@@ -91,6 +208,7 @@ class DevelopmentConfig(Config):
     """Development configuration."""
     DEBUG = True
     TESTING = False
+    QUERY_PROFILER_ENABLED = True
 
 
 class TestingConfig(Config):
@@ -98,7 +216,13 @@ class TestingConfig(Config):
     DEBUG = False
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///test.db'
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, Config.DB_POOL_SIZE, Config.DB_MAX_OVERFLOW,
+                                               Config.DB_POOL_TIMEOUT, Config.DB_POOL_RECYCLE, Config.DB_POOL_PRE_PING,
+                                               Config.DB_STATEMENT_TIMEOUT_MS)
     WTF_CSRF_ENABLED = False
+    MAIL_SUPPRESS_SEND = True
+    QUERY_PROFILER_ENABLED = True
+    QUERY_BUDGET_RAISE = True
 
 
 class ProductionConfig(Config):
@@ -109,11 +233,19 @@ class ProductionConfig(Config):
     # Set SQLite as a fallback if DATABASE_URL is not set
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///plumberleads.db'
     
+    # Larger pool and a tighter statement timeout for production traffic
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 15000))
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI, DB_POOL_SIZE, DB_MAX_OVERFLOW, Config.DB_POOL_TIMEOUT,
+                                               Config.DB_POOL_RECYCLE, Config.DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT_MS)
+    
     # Security settings for production
     SESSION_COOKIE_SECURE = True
     REMEMBER_COOKIE_SECURE = True
     SESSION_COOKIE_HTTPONLY = True
     REMEMBER_COOKIE_HTTPONLY = True
+    METRICS_REQUIRE_TOKEN = True
 
 
 # Configuration dictionary
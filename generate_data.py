@@ -0,0 +1,414 @@
+#!/usr/bin/env python
+"""
+Synthetic data generator for PlumberLeads performance testing.
+Creates plumbers and leads (with lead history and payments) clustered
+around the metro areas used by init_db.py, with a realistic status mix.
+
+Rows are generated in fixed chunks of CHUNK_SIZE leads, each from its own
+random stream derived from the seed, so the same --seed, --end and counts
+always produce the same data whatever the number of workers. Chunks are
+written with COPY on PostgreSQL and multi-row INSERTs elsewhere, one
+transaction per chunk.
+
+Usage:
+    python generate_data.py --leads 1000000 [--plumbers 500] [--seed 42] [--days 365]
+                            [--end 2024-01-01] [--workers 4] [--defer-indexes]
+"""
+
+import argparse
+import csv
+import io
+import multiprocessing
+import os
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import lru_cache
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+CHUNK_SIZE = 10000  # Leads per random stream and per transaction
+
+# Metro areas from init_db.py: (city, state, latitude, longitude, spread in degrees, weight, ZIP codes)
+METROS = [
+    ('San Jose', 'CA', 37.3382, -121.8863, 0.06, 12, ['95110', '95123', '95125', '95128', '95131', '95112', '95118', '95136']),
+    ('New York', 'NY', 40.7128, -74.0060, 0.08, 30, ['10001', '10002', '10003', '10011', '10016', '10019', '10025', '10027']),
+    ('Los Angeles', 'CA', 34.0522, -118.2437, 0.10, 22, ['90001', '90004', '90012', '90019', '90026', '90034', '90042', '90064']),
+    ('Chicago', 'IL', 41.8781, -87.6298, 0.08, 16, ['60601', '60605', '60607', '60614', '60618', '60625', '60640', '60647']),
+    ('Houston', 'TX', 29.7604, -95.3698, 0.10, 12, ['77001', '77002', '77004', '77006', '77019', '77024', '77036', '77057']),
+    ('Phoenix', 'AZ', 33.4484, -112.0740, 0.09, 8, ['85001', '85003', '85006', '85008', '85013', '85016', '85018', '85021']),
+]
+METRO_WEIGHTS = [metro[5] for metro in METROS]
+
+SERVICE_TYPES = [
+    'Residential Plumbing', 'Commercial Plumbing', 'Emergency Repairs', 'Water Heater Installation',
+    'Pipe Repair', 'Drain Cleaning', 'Sewer Line Repair', 'Fixture Installation',
+    'Gas Line Services', 'Water Treatment'
+]
+
+TITLES = {
+    'Residential Plumbing': ['Need plumber for leaking faucet', 'Toilet constantly running', 'Low water pressure issue'],
+    'Commercial Plumbing': ['Commercial kitchen plumbing issue', 'Office restroom plumbing repair', 'Restaurant grease trap service'],
+    'Emergency Repairs': ['Burst pipe emergency', 'Flooded basement after pipe failure', 'Emergency plumbing repair'],
+    'Water Heater Installation': ['Water heater replacement needed', 'Leaking water heater', 'Tankless water heater installation'],
+    'Pipe Repair': ['Pipe leak under sink', 'Corroded pipes need replacing', 'Frozen pipe repair'],
+    'Drain Cleaning': ['Clogged drain in kitchen', 'Shower drain clogged', 'Garbage disposal not working'],
+    'Sewer Line Repair': ['Sewer line backup', 'Sewer smell in yard', 'Main sewer line inspection'],
+    'Fixture Installation': ['New bathroom fixture installation', 'Install new kitchen sink', 'Replace bathroom vanity faucet'],
+    'Gas Line Services': ['Gas line installation for stove', 'Gas leak check', 'Gas line for outdoor grill'],
+    'Water Treatment': ['Water filtration system installation', 'Water softener installation', 'Well water testing and treatment'],
+}
+
+STREETS = ['Main St', 'Oak St', 'Maple Ave', 'Park Ave', 'Market St', 'Elm St', 'Cedar Ln', 'Lake Dr',
+           'Hill Rd', 'Washington Blvd', 'Lincoln Way', 'Sunset Blvd', 'Pine Ct', 'River Rd', 'Church St']
+FIRST_NAMES = ['James', 'Maria', 'Robert', 'Linda', 'Michael', 'Patricia', 'David', 'Jennifer', 'Carlos', 'Aisha',
+               'Wei', 'Priya', 'Thomas', 'Sarah', 'Daniel', 'Fatima', 'Kevin', 'Emily', 'Luis', 'Hannah']
+LAST_NAMES = ['Smith', 'Johnson', 'Garcia', 'Nguyen', 'Brown', 'Lee', 'Martinez', 'Davis', 'Patel', 'Wilson',
+              'Lopez', 'Kim', 'Anderson', 'Thomas', 'Chen', 'Moore', 'Jackson', 'Khan', 'White', 'Clark']
+
+URGENCY_LEVELS = ['low', 'medium', 'high']
+URGENCY_WEIGHTS = [30, 50, 20]
+
+# Share of leads ending up in each status
+STATUS_MIX = {'available': 55, 'reserved': 5, 'claimed': 22, 'completed': 15, 'closed': 3}
+STATUSES = list(STATUS_MIX)
+STATUS_WEIGHTS = list(STATUS_MIX.values())
+
+def _uuid(rng):
+    """Random UUID4 drawn from rng, so ids are reproducible too."""
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+def _phone(rng, area_code):
+    return f"{area_code}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}"
+
+@lru_cache(maxsize=None)
+def _content_simhash(title, description):
+    # Titles and descriptions come from small templates, so each text is fingerprinted once
+    from app.utils.dedupe import simhash
+    return simhash(f"{title} {description}")
+
+def _fingerprint(values):
+    """lead_fingerprint() without recomputing the SimHash of repeated texts."""
+    from app.utils.dedupe import lead_fingerprint
+    fingerprint = lead_fingerprint(dict(values, title=None, description=None))
+    fingerprint['content_simhash'] = _content_simhash(values['title'], values['description'])
+    return fingerprint
+
+def generate_plumbers(count, seed, end):
+    """
+    Generate plumber rows, their service areas and service types.
+
+    Returns:
+        tuple: (users, service_areas, service_types) as lists of column dicts
+    """
+    rng = random.Random(f"{seed}:plumbers")
+    users, areas, types = [], [], []
+    for index in range(count):
+        city, state, latitude, longitude, spread, _, zip_codes = rng.choices(METROS, weights=METRO_WEIGHTS)[0]
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        user_id = _uuid(rng)
+        created_at = end - timedelta(days=rng.uniform(30, 720))
+        users.append({
+            'id': user_id,
+            'email': f"plumber{index + 1}.{seed}@example.com",
+            'full_name': f"{first} {last}",
+            'company_name': f"{last} {rng.choice(['Plumbing', 'Plumbing & Heating', 'Pipe Works', 'Rooter'])}",
+            'phone': _phone(rng, '555'),
+            'is_active': True,
+            'is_admin': False,
+            'business_description': f"Licensed plumbers serving the {city} area",
+            'license_number': f"{state}-{rng.randint(10000, 99999)}",
+            'has_insurance': rng.random() < 0.8,
+            'address': f"{rng.randint(100, 9999)} {rng.choice(STREETS)}",
+            'city': city,
+            'state': state,
+            'zip_code': rng.choice(zip_codes),
+            'latitude': latitude + rng.gauss(0, spread),
+            'longitude': longitude + rng.gauss(0, spread),
+            'service_radius': rng.choice([10, 15, 25, 35, 50]),
+            'created_at': created_at,
+            'updated_at': created_at
+        })
+        served = [f"{city}, {state}"] + rng.sample(zip_codes, rng.randint(2, 5))
+        areas.extend({'user_id': user_id, 'area': area, 'position': position} for position, area in enumerate(served))
+        offered = rng.sample(SERVICE_TYPES, rng.randint(2, 5))
+        types.extend({'user_id': user_id, 'service_type': service_type, 'position': position}
+                     for position, service_type in enumerate(offered))
+    return users, areas, types
+
+def generate_chunk(chunk, lead_count, seed, end, days, plumbers_by_city, first_change_seq, snapshot):
+    """
+    Generate one chunk of leads with their history and payments.
+
+    Args:
+        chunk (int): Chunk number; the random stream and lead numbers derive from it
+        lead_count (int): Leads in this chunk
+        plumbers_by_city (dict): (city, state) -> list of plumber ids, for reserved and claimed leads
+        first_change_seq (int): change_seq of lead number 0
+
+    Returns:
+        tuple: (leads, history, payments) as lists of column dicts
+    """
+    from app.utils.pricing import calculate_claim_price_cents
+    from app.utils.regions import region_key
+
+    rng = random.Random(f"{seed}:leads:{chunk}")
+    leads, history, payments = [], [], []
+    for offset in range(lead_count):
+        number = chunk * CHUNK_SIZE + offset
+        city, state, latitude, longitude, spread, _, zip_codes = rng.choices(METROS, weights=METRO_WEIGHTS)[0]
+        service_type = rng.choice(SERVICE_TYPES)
+        urgency = rng.choices(URGENCY_LEVELS, weights=URGENCY_WEIGHTS)[0]
+        status = rng.choices(STATUSES, weights=STATUS_WEIGHTS)[0]
+        created_at = end - timedelta(seconds=rng.uniform(0, days * 86400))
+        # Job values are skewed: mostly a few hundred dollars, with a long tail
+        price_cents = min(max(int(rng.lognormvariate(5.5, 0.6)), 50), 20000) * 100
+        lead = {
+            'id': _uuid(rng),
+            'title': rng.choice(TITLES[service_type]),
+            'description': f"Customer needs assistance with {service_type.lower()}. This is a {urgency} priority request.",
+            'service_type': service_type,
+            'service_details': "Detailed information about the service request would go here.",
+            'urgency': urgency,
+            'price_cents': price_cents,
+            'claim_price_cents': calculate_claim_price_cents(price_cents, snapshot),
+            'status': status,
+            'address': f"{rng.randint(100, 9999)} {rng.choice(STREETS)}",
+            'city': city,
+            'state': state,
+            'zip_code': rng.choice(zip_codes),
+            'latitude': latitude + rng.gauss(0, spread),
+            'longitude': longitude + rng.gauss(0, spread),
+            'customer_name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            'customer_email': f"customer{number + 1}.{seed}@example.com",
+            'customer_phone': _phone(rng, '555'),
+            'source': rng.choices(['website', 'import', 'partner'], weights=[70, 20, 10])[0],
+            'notes': None,
+            'created_at': created_at,
+            'updated_at': created_at,
+            'reserved_at': None,
+            'reserved_by_id': None,
+            'contact_release_count': 0,
+            'claimed_at': None,
+            'claimed_by_id': None,
+            'notified_at': created_at + timedelta(seconds=rng.uniform(5, 120)),
+            'change_seq': first_change_seq + number,
+            'duplicate_of_id': None
+        }
+        lead.update(_fingerprint(lead), region=region_key(lead['latitude'], lead['longitude'], state))
+
+        def log(field_name, old_value, new_value, change_type, user_id, at):
+            history.append({'id': _uuid(rng), 'lead_id': lead['id'], 'user_id': user_id, 'field_name': field_name,
+                            'old_value': old_value, 'new_value': new_value, 'change_type': change_type, 'created_at': at})
+
+        plumbers = plumbers_by_city.get((city, state))
+        if status in ('reserved', 'claimed', 'completed') and plumbers:
+            plumber_id = rng.choice(plumbers)
+            reserved_at = created_at + timedelta(minutes=rng.uniform(5, 48 * 60))
+            lead.update(reserved_at=reserved_at, reserved_by_id=plumber_id, updated_at=reserved_at)
+            log('status', 'available', 'reserved', 'status_change', plumber_id, reserved_at)
+            if status != 'reserved':
+                claimed_at = reserved_at + timedelta(minutes=rng.uniform(1, 30))
+                lead.update(claimed_at=claimed_at, claimed_by_id=plumber_id, contact_release_count=1,
+                            updated_at=claimed_at, notes="Plumber has contacted the customer and scheduled an appointment.")
+                log('status', 'reserved', 'claimed', 'claim', plumber_id, claimed_at)
+                log('contact_release_count', '0', '1', 'contact_release', plumber_id, claimed_at)
+                payments.append({
+                    'id': _uuid(rng),
+                    'user_id': plumber_id,
+                    'lead_id': lead['id'],
+                    'amount_cents': lead['claim_price_cents'],
+                    'currency': 'USD',
+                    'payment_method': 'credit_card',
+                    'payment_processor': 'stripe',
+                    'processor_payment_id': f"pi_{rng.getrandbits(96):024x}",
+                    'status': 'completed',
+                    'created_at': reserved_at,
+                    'completed_at': claimed_at
+                })
+                if status == 'completed':
+                    completed_at = claimed_at + timedelta(days=rng.uniform(1, 14))
+                    lead['updated_at'] = completed_at
+                    log('status', 'claimed', 'completed', 'status_change', plumber_id, completed_at)
+        elif status != 'available':
+            # Reserved/claimed leads in a metro without plumbers stay available
+            lead['status'] = 'closed' if status == 'closed' else 'available'
+            if lead['status'] == 'closed':
+                closed_at = created_at + timedelta(days=rng.uniform(1, 30))
+                lead['updated_at'] = closed_at
+                log('status', 'available', 'closed', 'status_change', None, closed_at)
+
+        if rng.random() < 0.2:
+            old_price = price_cents / 100 + rng.randint(-50, 50)
+            if old_price > 0:
+                log('price', str(old_price), str(price_cents / 100), 'price_update', None,
+                    created_at + timedelta(minutes=rng.uniform(1, 60)))
+        leads.append(lead)
+    return leads, history, payments
+
+def _copy_rows(connection, table, rows):
+    """Load rows with COPY ... FROM STDIN (PostgreSQL)."""
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # csv writes None as an empty unquoted field, which COPY reads as NULL
+        writer.writerow(row[column] for column in columns)
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+def write_rows(connection, table, rows):
+    """Bulk load rows into a table: COPY on PostgreSQL, executemany INSERT elsewhere."""
+    if not rows:
+        return
+    if connection.dialect.name == 'postgresql':
+        _copy_rows(connection, table, rows)
+    else:
+        from sqlalchemy import insert
+        connection.execute(insert(table), rows)
+
+# Worker state, set once per process by _init_worker
+_worker = {}
+
+def _init_worker(settings):
+    from app import create_app
+
+    _worker.update(settings)
+    _worker['app'] = create_app(settings['config_class'])
+
+def _load_chunk(chunk):
+    from app import db
+    from app.models.lead import Lead
+    from app.models.lead_history import LeadHistory
+    from app.models.payment import Payment
+    from app.utils.pricing import pricing_snapshot
+
+    settings = _worker
+    lead_count = min(CHUNK_SIZE, settings['leads'] - chunk * CHUNK_SIZE)
+    with settings['app'].app_context():
+        leads, history, payments = generate_chunk(chunk, lead_count, settings['seed'], settings['end'], settings['days'],
+                                                  settings['plumbers_by_city'], settings['first_change_seq'],
+                                                  pricing_snapshot())
+        with db.engine.begin() as connection:
+            write_rows(connection, Lead.__table__, leads)
+            write_rows(connection, LeadHistory.__table__, history)
+            write_rows(connection, Payment.__table__, payments)
+    return len(leads), len(history), len(payments)
+
+def _droppable_indexes(connection, tables):
+    """Secondary (non-constraint) index definitions of the given tables (PostgreSQL)."""
+    from sqlalchemy import text
+
+    return connection.execute(text(
+        "SELECT indexname, indexdef FROM pg_indexes "
+        "WHERE schemaname = current_schema() AND tablename = ANY(:tables) "
+        "AND indexname NOT IN (SELECT conname FROM pg_constraint)"
+    ), {'tables': list(tables)}).all()
+
+def generate(leads, plumbers, seed, end, days, workers, defer_indexes, config_class):
+    """Generate plumbers and leads and print a summary."""
+    from sqlalchemy import text
+    from app import create_app, db
+    from app.models.change_sequence import ChangeSequence
+    from app.models.user import User
+    from app.models.user_service import UserServiceArea, UserServiceType
+    from config import without_statement_timeout
+
+    # COPY of a large chunk and the --defer-indexes rebuild run far past the web statement_timeout;
+    # the workers get the same config through settings
+    config_class = without_statement_timeout(config_class)
+    app = create_app(config_class)
+    started = time.monotonic()
+
+    with app.app_context():
+        postgres = db.engine.dialect.name == 'postgresql'
+        if not postgres and workers > 1:
+            print("Only PostgreSQL takes concurrent writers, using one worker")
+            workers = 1
+
+        users, areas, types = generate_plumbers(plumbers, seed, end)
+        with db.engine.begin() as connection:
+            write_rows(connection, User.__table__, users)
+            write_rows(connection, UserServiceArea.__table__, areas)
+            write_rows(connection, UserServiceType.__table__, types)
+        print(f"Created {len(users)} plumbers")
+
+        # One block of change sequence values for every generated lead
+        first_change_seq = ChangeSequence.allocate(db.session, 'leads', leads) if leads else 0
+        db.session.commit()
+
+        indexes = []
+        if defer_indexes and postgres:
+            with db.engine.begin() as connection:
+                indexes = _droppable_indexes(connection, ['leads', 'lead_history', 'payments'])
+                for name, _ in indexes:
+                    connection.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+            print(f"Dropped {len(indexes)} indexes until the load is done")
+        db.engine.dispose()
+
+    plumbers_by_city = {}
+    for user in users:
+        plumbers_by_city.setdefault((user['city'], user['state']), []).append(user['id'])
+    settings = {'config_class': config_class, 'leads': leads, 'seed': seed, 'end': end, 'days': days,
+                'plumbers_by_city': plumbers_by_city, 'first_change_seq': first_change_seq}
+
+    chunks = range((leads + CHUNK_SIZE - 1) // CHUNK_SIZE)
+    totals = [0, 0, 0]
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(settings,))
+        results = pool.imap_unordered(_load_chunk, chunks)
+    else:
+        pool = None
+        _init_worker(settings)
+        results = map(_load_chunk, chunks)
+    try:
+        for done, counts in enumerate(results, 1):
+            totals = [total + count for total, count in zip(totals, counts)]
+            if done % 10 == 0 or done == len(chunks):
+                rate = totals[0] / max(time.monotonic() - started, 0.001)
+                print(f"  {totals[0]}/{leads} leads ({rate:,.0f} leads/s)")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    with app.app_context():
+        if indexes:
+            print(f"Rebuilding {len(indexes)} indexes...")
+            with db.engine.begin() as connection:
+                for _, definition in indexes:
+                    connection.execute(text(definition))
+        if postgres:
+            with db.engine.begin() as connection:
+                connection.execute(text("ANALYZE users, user_service_areas, user_service_types, leads, lead_history, payments"))
+
+    print(f"Created {totals[0]} leads, {totals[1]} history entries and {totals[2]} payments "
+          f"in {time.monotonic() - started:.0f}s")
+
+if __name__ == '__main__':
+    from config import config
+
+    parser = argparse.ArgumentParser(description='Generate synthetic plumbers and leads for performance testing')
+    parser.add_argument('--leads', type=int, default=100000, help='Number of leads to create')
+    parser.add_argument('--plumbers', type=int, default=500, help='Number of plumbers to create')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed, --end and counts give the same data')
+    parser.add_argument('--days', type=int, default=365, help='Spread lead creation times over this many days')
+    parser.add_argument('--end', type=lambda value: datetime.strptime(value, '%Y-%m-%d'),
+                        default=datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0),
+                        help='Newest lead date, YYYY-MM-DD (default: today)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Parallel loader processes (PostgreSQL only)')
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help='Drop secondary indexes during the load and rebuild them afterwards (PostgreSQL only)')
+    args = parser.parse_args()
+
+    if args.leads < 0 or args.plumbers < 0:
+        parser.error('counts must not be negative')
+    generate(args.leads, args.plumbers, args.seed, args.end, args.days, args.workers, args.defer_indexes,
+             config[os.environ.get('FLASK_ENV', 'default')])
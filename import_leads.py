@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Lead import script for PlumberLeads application.
+Loads leads from a CSV file (one lead per row, columns named like the
+POST /api/leads/submit fields) using the bulk import pipeline.
+
+Usage:
+    python import_leads.py leads.csv [--source partner-name] [--chunk-size 500] [--no-geocode]
+"""
+
+import argparse
+import csv
+import sys
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+def import_file(path, source, chunk_size, geocode):
+    """Import every row of a CSV file and print a summary"""
+    from app import create_app
+    from app.services.lead_import import import_leads
+
+    app = create_app()
+
+    with app.app_context():
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            # Plumbers are notified by the background task runner
+            result = import_leads(csv.DictReader(f), source=source, chunk_size=chunk_size,
+                                  geocode=geocode, notify=False)
+
+    print(f"Imported {result['created']} leads, {len(result['duplicates'])} duplicates, {result['failed']} rows failed")
+    for error in result['errors']:
+        # +2: rows are zero-based and the header is line 1
+        print(f"  line {error['index'] + 2}: {'; '.join(error['errors'])}")
+    return result['failed'] == 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import leads from a CSV file')
+    parser.add_argument('path', help='CSV file to import')
+    parser.add_argument('--source', default='import', help='Value stored as the lead source')
+    parser.add_argument('--chunk-size', type=int, default=None, help='Rows per INSERT/transaction')
+    parser.add_argument('--no-geocode', action='store_true', help='Do not geocode rows without coordinates')
+    args = parser.parse_args()
+
+    if not import_file(args.path, args.source, args.chunk_size, not args.no_geocode):
+        sys.exit(1)
@@ -28,8 +28,8 @@ def create_sample_users():
         is_active=True,
         is_admin=True,
         is_verified=True,
-        service_areas=json.dumps([]),
-        service_types=json.dumps([]),
+        service_areas=[],
+        service_types=[],
         # Add address fields for admin
         address='123 Admin St',
         city='San Francisco',
@@ -121,8 +121,8 @@ def create_sample_users():
             latitude=p['latitude'],
             longitude=p['longitude'],
             service_radius=p['service_radius'],
-            service_areas=json.dumps(p['service_areas']),
-            service_types=json.dumps(p['service_types']),
+            service_areas=p['service_areas'],
+            service_types=p['service_types'],
             # Add required fields
             business_description=p['business_description'],
             license_number=p['license_number'],
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+"""
+Data migration script for PlumberLeads application.
+Brings an existing database up to date with the current models, including
+backfills that an autogenerated schema migration cannot express.
+
+Usage:
+    python migrate_db.py              # run every step
+    python migrate_db.py <step> ...   # run only the named steps
+"""
+
+import json
+import sys
+import uuid
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+
+def _column_names(inspector, table):
+    """Return the set of column names for a table, or an empty set if it does not exist."""
+    if not inspector.has_table(table):
+        return set()
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def _load_json_list(value):
+    """Parse a legacy JSON text column into a de-duplicated list."""
+    try:
+        values = json.loads(value) if value else []
+    except ValueError:
+        return []
+    result = []
+    for item in values if isinstance(values, list) else []:
+        if item and item not in result:
+            result.append(item)
+    return result
+
+
+def migrate_service_coverage(db):
+    """Move users.service_areas / users.service_types JSON into the association tables."""
+    from sqlalchemy import inspect, insert, text
+    from app.models.user_service import UserServiceArea, UserServiceType
+
+    columns = _column_names(inspect(db.engine), 'users')
+    if 'service_areas' not in columns and 'service_types' not in columns:
+        print("  users table already normalized, nothing to backfill")
+        return
+
+    rows = db.session.execute(text("SELECT id, service_areas, service_types FROM users")).all()
+    covered = {row.user_id for row in db.session.query(UserServiceArea.user_id).distinct()}
+    typed = {row.user_id for row in db.session.query(UserServiceType.user_id).distinct()}
+
+    area_rows, type_rows = [], []
+    for user_id, areas, types in rows:
+        user_id = uuid.UUID(str(user_id))
+        if user_id not in covered:
+            area_rows.extend({'user_id': user_id, 'area': area, 'position': position}
+                             for position, area in enumerate(_load_json_list(areas)))
+        if user_id not in typed:
+            type_rows.extend({'user_id': user_id, 'service_type': service_type, 'position': position}
+                             for position, service_type in enumerate(_load_json_list(types)))
+
+    if area_rows:
+        db.session.execute(insert(UserServiceArea.__table__), area_rows)
+    if type_rows:
+        db.session.execute(insert(UserServiceType.__table__), type_rows)
+    db.session.commit()
+    print(f"  Backfilled {len(area_rows)} service areas and {len(type_rows)} service types for {len(rows)} users")
+
+    # The JSON columns are NOT NULL and no longer written by the model, so they have to go
+    for column in ('service_areas', 'service_types'):
+        if column in columns:
+            db.session.execute(text(f"ALTER TABLE users DROP COLUMN {column}"))
+    db.session.commit()
+    print("  Dropped legacy users.service_areas / users.service_types columns")
+
+
+def migrate_lead_notifications(db):
+    """Add leads.notified_at, marking existing leads as already handled."""
+    from sqlalchemy import inspect, text
+
+    if 'notified_at' in _column_names(inspect(db.engine), 'leads'):
+        return
+    # Leads from before the notification workers must not all be fanned out on their first run
+    db.session.execute(text("ALTER TABLE leads ADD COLUMN notified_at TIMESTAMP"))
+    result = db.session.execute(text("UPDATE leads SET notified_at = COALESCE(created_at, CURRENT_TIMESTAMP)"))
+    db.session.commit()
+    print(f"  Added leads.notified_at and marked {result.rowcount} existing leads as notified")
+
+
+def migrate_change_seq(db):
+    """Add leads.change_seq and number existing leads in update order."""
+    from sqlalchemy import inspect, text
+    from app.models.change_sequence import ChangeSequence
+
+    inspector = inspect(db.engine)
+    if 'change_seq' not in _column_names(inspector, 'leads'):
+        db.session.execute(text("ALTER TABLE leads ADD COLUMN change_seq BIGINT"))
+        db.session.commit()
+        print("  Added leads.change_seq")
+    if 'ix_leads_change_seq' not in {index['name'] for index in inspector.get_indexes('leads')}:
+        db.session.execute(text("CREATE INDEX ix_leads_change_seq ON leads (change_seq)"))
+        db.session.commit()
+
+    lead_ids = [row.id for row in db.session.execute(text(
+        "SELECT id FROM leads WHERE change_seq IS NULL ORDER BY COALESCE(updated_at, created_at)"
+    ))]
+    if lead_ids:
+        first = ChangeSequence.allocate(db.session, 'leads', len(lead_ids))
+        for offset, lead_id in enumerate(lead_ids):
+            db.session.execute(text("UPDATE leads SET change_seq = :seq WHERE id = :id"),
+                               {'seq': first + offset, 'id': lead_id})
+    db.session.commit()
+    print(f"  Assigned change sequence values to {len(lead_ids)} leads")
+
+
+def migrate_lead_fingerprints(db):
+    """Add the duplicate detection columns to leads and fingerprint existing leads."""
+    from sqlalchemy import inspect, select, text, update
+    from app.models.lead import Lead, FINGERPRINT_FIELDS
+    from app.utils.dedupe import lead_fingerprint
+
+    inspector = inspect(db.engine)
+    columns = _column_names(inspector, 'leads')
+    for column, ddl in (('address_hash', 'VARCHAR(32)'), ('phone_hash', 'VARCHAR(32)'),
+                        ('email_hash', 'VARCHAR(32)'), ('content_simhash', 'BIGINT'),
+                        ('duplicate_of_id', 'UUID REFERENCES leads (id)' if db.engine.dialect.name == 'postgresql' else 'CHAR(32)')):
+        if column not in columns:
+            db.session.execute(text(f"ALTER TABLE leads ADD COLUMN {column} {ddl}"))
+            print(f"  Added leads.{column}")
+    db.session.commit()
+
+    indexes = {index['name'] for index in inspector.get_indexes('leads')}
+    for column in ('address_hash', 'phone_hash', 'email_hash'):
+        name = f'ix_leads_{column}_created'
+        if name not in indexes:
+            db.session.execute(text(f"CREATE INDEX {name} ON leads ({column}, created_at)"))
+    db.session.commit()
+
+    table = Lead.__table__
+    rows = db.session.execute(
+        select(table.c.id, *[table.c[field] for field in FINGERPRINT_FIELDS]).where(table.c.content_simhash.is_(None))
+    ).all()
+    for row in rows:
+        db.session.execute(update(table).where(table.c.id == row.id).values(**lead_fingerprint(row._mapping)))
+    db.session.commit()
+    print(f"  Fingerprinted {len(rows)} leads")
+
+
+def migrate_lead_search(db):
+    """Create the full-text search index over existing leads."""
+    from app.services.search import install_search_index
+
+    with db.engine.begin() as connection:
+        if not install_search_index(connection):
+            print(f"  Lead search is not supported on {db.engine.dialect.name}, skipping")
+            return
+    print("  Full-text search index is in place")
+
+
+def migrate_money_cents(db):
+    """Move lead prices and payment amounts from float dollars to integer cents."""
+    from sqlalchemy import inspect, text
+    from app.utils.pricing import pricing_snapshot
+
+    postgres = db.engine.dialect.name == 'postgresql'
+    for table, legacy, columns in (('leads', 'price', ('price_cents', 'claim_price_cents')),
+                                   ('payments', 'amount', ('amount_cents',))):
+        existing = _column_names(inspect(db.engine), table)
+        for column in columns:
+            if column not in existing:
+                db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER"))
+                print(f"  Added {table}.{column}")
+        if legacy in existing:
+            result = db.session.execute(text(
+                f"UPDATE {table} SET {columns[0]} = CAST(ROUND({legacy} * 100) AS INTEGER) WHERE {columns[0]} IS NULL"
+            ))
+            print(f"  Converted {result.rowcount} {table}.{legacy} values to cents")
+        db.session.commit()
+
+    # Claim prices for existing leads, computed in one statement from the current settings
+    snapshot = pricing_snapshot()
+    result = db.session.execute(text(
+        "UPDATE leads SET claim_price_cents = CASE WHEN (CAST(price_cents AS BIGINT) * :bp + 5000) / 10000 < :minimum "
+        "THEN :minimum ELSE (CAST(price_cents AS BIGINT) * :bp + 5000) / 10000 END "
+        "WHERE claim_price_cents IS NULL AND price_cents IS NOT NULL"
+    ), {'bp': snapshot.basis_points, 'minimum': snapshot.minimum_cents})
+    db.session.commit()
+    print(f"  Priced {result.rowcount} leads")
+
+    # The float columns are NOT NULL and no longer written by the models, so they have to go
+    for table, legacy, column in (('leads', 'price', 'price_cents'), ('payments', 'amount', 'amount_cents')):
+        if legacy in _column_names(inspect(db.engine), table):
+            db.session.execute(text(f"ALTER TABLE {table} DROP COLUMN {legacy}"))
+            if postgres:
+                db.session.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL"))
+            print(f"  Dropped legacy {table}.{legacy}")
+    db.session.commit()
+
+
+def migrate_lead_regions(db):
+    """Add the region key to leads, key existing leads and index nearby-lead lookups by region."""
+    from sqlalchemy import inspect, select, text, update
+    from app.models.lead import Lead
+    from app.utils.regions import region_key
+
+    if 'region' not in _column_names(inspect(db.engine), 'leads'):
+        db.session.execute(text("ALTER TABLE leads ADD COLUMN region VARCHAR(24)"))
+        db.session.commit()
+        print("  Added leads.region")
+
+    # Keyset batches so a large table is keyed in short transactions
+    table = Lead.__table__
+    keyed, last_id = 0, None
+    while True:
+        query = select(table.c.id, table.c.latitude, table.c.longitude, table.c.state) \
+            .where(table.c.region.is_(None)).order_by(table.c.id).limit(5000)
+        if last_id is not None:
+            query = query.where(table.c.id > last_id)
+        rows = db.session.execute(query).all()
+        if not rows:
+            break
+        by_region = {}
+        for row in rows:
+            by_region.setdefault(region_key(row.latitude, row.longitude, row.state), []).append(row.id)
+        for region, ids in by_region.items():
+            db.session.execute(update(table).where(table.c.id.in_(ids)).values(region=region))
+        db.session.commit()
+        keyed += len(rows)
+        last_id = rows[-1].id
+    print(f"  Keyed {keyed} leads by region")
+
+    # The region-led index replaces the plain status/coordinates one
+    indexes = {index['name'] for index in inspect(db.engine).get_indexes('leads')}
+    for index in table.indexes:
+        if index.name == 'ix_leads_region_status_lat_lng' and index.name not in indexes:
+            index.create(db.engine)
+            print(f"  Created {index.name}")
+    if 'ix_leads_status_lat_lng' in indexes:
+        db.session.execute(text("DROP INDEX ix_leads_status_lat_lng"))
+        db.session.commit()
+        print("  Dropped ix_leads_status_lat_lng")
+
+
+def migrate_query_indexes(db):
+    """Create the indexes behind the hot lead and payment queries."""
+    from sqlalchemy import inspect
+    from app.models.lead import Lead
+    from app.models.payment import Payment
+
+    created = 0
+    for table in (Lead.__table__, Payment.__table__):
+        existing = {index['name'] for index in inspect(db.engine).get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                index.create(db.engine)
+                created += 1
+                print(f"  Created {index.name}")
+    print(f"  {created} indexes created")
+
+
+# Ordered list of migration steps; each step must be safe to run more than once
+STEPS = [
+    ('service_coverage', migrate_service_coverage),
+    ('lead_notifications', migrate_lead_notifications),
+    ('change_seq', migrate_change_seq),
+    ('lead_fingerprints', migrate_lead_fingerprints),
+    ('lead_search', migrate_lead_search),
+    ('money_cents', migrate_money_cents),
+    ('lead_regions', migrate_lead_regions),
+    ('query_indexes', migrate_query_indexes),
+]
+
+
+def migrate_database(step_names=None):
+    """Create missing tables and run the requested data migration steps."""
+    from app import create_app, db
+    from config import Config, without_statement_timeout
+
+    # The backfills and index builds rewrite whole tables, far past the web statement_timeout
+    app = create_app(without_statement_timeout(Config))
+    selected = [(name, step) for name, step in STEPS if not step_names or name in step_names]
+    unknown = set(step_names or []) - {name for name, _ in STEPS}
+    if unknown:
+        print(f"Unknown migration steps: {', '.join(sorted(unknown))}")
+        return False
+
+    with app.app_context():
+        print("Creating missing tables...")
+        db.create_all()
+
+        for name, step in selected:
+            print(f"Running step '{name}'...")
+            try:
+                step(db)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error in step '{name}': {e}")
+                return False
+
+    print("Database migration complete.")
+    return True
+
+
+if __name__ == '__main__':
+    if not migrate_database(sys.argv[1:]):
+        sys.exit(1)
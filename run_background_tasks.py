@@ -5,16 +5,33 @@ This script runs periodic tasks like releasing expired lead reservations.
 """
 
 import time
+from app import create_app
 from app.tasks.lead_tasks import release_expired_reservations
+from app.tasks.session_tasks import cleanup_expired_sessions
+from app.tasks.email_tasks import deliver_pending_emails
+from app.tasks.notification_tasks import send_lead_notifications
 
 def run_background_tasks():
     """Run background tasks periodically"""
     print("Starting background tasks...")
     
+    # One app for the life of the process: the tasks share its engine and connection pool
+    # instead of opening a fresh pool (and a burst of connections) on every sweep
+    app = create_app()
+    
     while True:
         try:
             # Release expired reservations
-            release_expired_reservations()
+            release_expired_reservations(app)
+            
+            # Purge expired server-side sessions
+            cleanup_expired_sessions(app)
+            
+            # Notify plumbers about new leads and send digests
+            send_lead_notifications(app)
+            
+            # Deliver queued emails and due retries
+            deliver_pending_emails(app)
             
             # Wait for 5 minutes before next check
             time.sleep(300)